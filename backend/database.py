@@ -1,11 +1,17 @@
+import os
+
 from sqlmodel import SQLModel, create_engine, Session
 from backend import models
+from backend.services.classifier import register_classification_hooks
+from backend.services.metrics import instrument_engine
 
-sqlite_file_name = "database.db"
+sqlite_file_name = os.environ.get("PORTFOLIO_DB", "database.db")
 sqlite_url = f"sqlite:///{sqlite_file_name}"
 
 connect_args = {"check_same_thread": False}
 engine = create_engine(sqlite_url, echo=True, connect_args=connect_args)
+instrument_engine(engine)
+register_classification_hooks(models.Asset)
 
 def create_db_and_tables():
     SQLModel.metadata.create_all(engine)
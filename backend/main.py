@@ -1,9 +1,12 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 
 from contextlib import asynccontextmanager
 from .database import create_db_and_tables
-from .routers import assets
+from .routers import assets, export, valuations
+from .services.events import hub
+from .services.metrics import render_prometheus
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -27,7 +30,27 @@ app.add_middleware(
 )
 
 app.include_router(assets.router)
+app.include_router(export.router)
+app.include_router(valuations.router)
 
 @app.get("/")
 def read_root():
     return {"message": "Portfolio Manager API is running"}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus scrape endpoint."""
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/portfolio/stream")
+async def stream_portfolio(user_id: int, request: Request, min_interval: float = 1.0):
+    """
+    Server-sent events with live portfolio values.
+    First a `snapshot` event, then compact `delta` events (changed positions,
+    totals, bucket allocations) at most once per `min_interval` seconds.
+    """
+    return StreamingResponse(
+        hub.events(user_id, max(min_interval, 0.1), request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,6 +1,7 @@
 from typing import Optional
+from sqlalchemy import Index, UniqueConstraint
 from sqlmodel import Field, SQLModel
-from datetime import datetime
+from datetime import date, datetime
 
 class User(SQLModel, table=True):
     __table_args__ = {"extend_existing": True}
@@ -37,6 +38,8 @@ class Asset(SQLModel, table=True):
     alloc_work_pct: float = 0.0 # NEW: For GSUs + MSFT bucket
     alloc_bonds_pct: float = 0.0
     alloc_cash_pct: float = 0.0 # Short term bonds / cash
+    allocation_split: Optional[str] = None # JSON {bucket: weight}, resolved on write by services/classifier.py
+    due_date: Optional[datetime] = None # Future Needs: when the liability must be paid (cash-flow planner)
 
 class StockGrant(SQLModel, table=True):
     __table_args__ = {"extend_existing": True}
@@ -63,9 +66,84 @@ class Settings(SQLModel, table=True):
     # Tax Assumptions
     tax_rate_income: float = 0.50
     tax_rate_capital_gains: float = 0.25
-    gsu_tax_mode: str = "Average" # Current, Optimized, Average
+    gsu_tax_mode: str = "Average" # Current, Optimized, Average, Section 102
+    inflation_rate: float = 0.0 # Annual CPI assumption for inflation-adjusted (real) gains
 
     # Planning Settings
     swr_rate: float = 0.04 # 4% Rule
     include_crypto: bool = True # Include in NW totals?
     allocation_targets: str = "{}" # JSON string: {'US Stocks': 30, ...}
+    monthly_contribution: float = 0.0 # Saved from salary each month until retirement
+    retirement_year: Optional[int] = None # SWR withdrawals start here (None = already drawing)
+
+class PriceHistory(SQLModel, table=True):
+    """Daily closes in the symbol's own currency (FX pairs stored as e.g. USDILS=X)."""
+    __table_args__ = (UniqueConstraint("symbol", "day"), {"extend_existing": True})
+    id: Optional[int] = Field(default=None, primary_key=True)
+    symbol: str = Field(index=True)
+    day: date
+    close: float
+
+class Transaction(SQLModel, table=True):
+    """Append-only ledger entry. Asset.quantity / cost_basis are materialized from these (services/ledger.py)."""
+    __table_args__ = (Index("ix_transaction_asset_date", "asset_id", "trade_date", "id"), {"extend_existing": True})
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="user.id")
+    asset_id: int = Field(foreign_key="asset.id")
+    trade_date: datetime = Field(default_factory=datetime.utcnow)
+    kind: str # Buy, Sell, Deposit, Withdrawal, Dividend, Interest, Fee, Adjustment
+    quantity: float = 0.0 # Units bought/sold (Adjustment: signed change)
+    amount: float = 0.0 # Cash in the asset's currency: total cost incl. fees (Buy), proceeds (Sell)
+    notes: Optional[str] = None
+
+class PositionSnapshot(SQLModel, table=True):
+    """Replay checkpoint: one asset's state after every transaction up to (as_of, txn_id)."""
+    __table_args__ = (Index("ix_positionsnapshot_asset_date", "asset_id", "as_of"), {"extend_existing": True})
+    id: Optional[int] = Field(default=None, primary_key=True)
+    asset_id: int = Field(foreign_key="asset.id")
+    as_of: datetime
+    txn_id: int
+    quantity: float
+    cost_basis: float
+    realized: float = 0.0
+    income: float = 0.0
+
+class ValuationRun(SQLModel, table=True):
+    """One batch revaluation (nightly or on demand), see services/revaluation.py."""
+    __table_args__ = {"extend_existing": True}
+    id: Optional[int] = Field(default=None, primary_key=True)
+    started_at: datetime = Field(default_factory=datetime.utcnow)
+    finished_at: Optional[datetime] = None
+    status: str = "running" # running, done, failed
+    workers: int = 1
+    users: int = 0
+    positions: int = 0
+    seconds: float = 0.0
+
+class PortfolioValuation(SQLModel, table=True):
+    """Persisted per-user totals from a ValuationRun (values in the user's base currency)."""
+    __table_args__ = {"extend_existing": True}
+    id: Optional[int] = Field(default=None, primary_key=True)
+    run_id: int = Field(foreign_key="valuationrun.id", index=True)
+    user_id: int = Field(foreign_key="user.id", index=True)
+    as_of: datetime
+    base_currency: str = "ILS"
+    net_worth: float = 0.0
+    after_tax: float = 0.0
+    swr_monthly: float = 0.0
+    future_value_40y: float = 0.0
+    allocations: str = "{}" # JSON {bucket: value}
+    positions: int = 0
+
+class PositionValuation(SQLModel, table=True):
+    """Persisted per-position values from a ValuationRun."""
+    __table_args__ = {"extend_existing": True}
+    id: Optional[int] = Field(default=None, primary_key=True)
+    run_id: int = Field(foreign_key="valuationrun.id", index=True)
+    user_id: int = Field(foreign_key="user.id")
+    asset_id: int = Field(foreign_key="asset.id")
+    symbol: str
+    price: float = 0.0
+    market_value: float = 0.0
+    cost_basis: float = 0.0
+    tax: float = 0.0
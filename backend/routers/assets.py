@@ -1,7 +1,12 @@
+from datetime import datetime
+from typing import Optional
+
 from fastapi import APIRouter, Depends, HTTPException
 from sqlmodel import Session, select
-from ..models import Asset, User
+from ..models import Asset, Transaction, User
 from ..database import get_session
+from ..services import ledger
+from ..services.events import hub
 
 router = APIRouter(prefix="/assets", tags=["assets"])
 
@@ -10,6 +15,8 @@ def create_asset(asset: Asset, session: Session = Depends(get_session)):
     session.add(asset)
     session.commit()
     session.refresh(asset)
+    ledger.open_positions(session, [asset])
+    hub.notify_assets_changed(asset.user_id)
     return asset
 
 @router.get("/", response_model=list[Asset])
@@ -23,6 +30,38 @@ def delete_asset(asset_id: int, session: Session = Depends(get_session)):
     asset = session.get(Asset, asset_id)
     if not asset:
         raise HTTPException(status_code=404, detail="Asset not found")
+    user_id = asset.user_id
+    ledger.forget_asset(session, asset_id)
     session.delete(asset)
     session.commit()
+    hub.notify_assets_changed(user_id)
     return {"ok": True}
+
+@router.get("/positions")
+def read_positions(user_id: int, as_of: Optional[datetime] = None, session: Session = Depends(get_session)):
+    """Ledger state per asset at `as_of` (default: now), rebuilt from the nearest snapshot."""
+    asset_ids = session.exec(select(Asset.id).where(Asset.user_id == user_id)).all()
+    holdings = ledger.positions_at(session, asset_ids, as_of)
+    return [{"asset_id": asset_id, "quantity": h.quantity, "cost_basis": h.cost_basis,
+             "realized": h.realized, "income": h.income, "as_of": h.as_of}
+            for asset_id, h in sorted(holdings.items())]
+
+@router.post("/{asset_id}/transactions", response_model=Transaction)
+def create_transaction(asset_id: int, txn: Transaction, session: Session = Depends(get_session)):
+    asset = session.get(Asset, asset_id)
+    if not asset:
+        raise HTTPException(status_code=404, detail="Asset not found")
+    # Table models skip validation on the request body; coerce types (e.g. trade_date) here
+    txn = Transaction.model_validate({**{k: getattr(txn, k) for k in txn.model_fields_set}, "asset_id": asset_id, "user_id": asset.user_id})
+    try:
+        ledger.record(session, txn)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    session.refresh(txn)
+    hub.notify_assets_changed(asset.user_id)
+    return txn
+
+@router.get("/{asset_id}/transactions", response_model=list[Transaction])
+def read_transactions(asset_id: int, session: Session = Depends(get_session)):
+    statement = select(Transaction).where(Transaction.asset_id == asset_id).order_by(Transaction.trade_date, Transaction.id)
+    return session.exec(statement).all()
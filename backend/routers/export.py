@@ -0,0 +1,26 @@
+from typing import List, Optional
+
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+
+from ..services import export as exporter
+
+router = APIRouter(prefix="/export", tags=["export"])
+
+@router.get("/{dataset}.{fmt}")
+def export_dataset(dataset: str, fmt: str, user_id: Optional[List[int]] = Query(None),
+                   chunk_rows: int = exporter.CHUNK_ROWS):
+    """
+    Stream positions, grants, transactions or price history as csv, parquet or xlsx.
+    Rows are read, valued and encoded one chunk at a time; repeat `user_id` to
+    select several users (default: all).
+    """
+    try:
+        exporter.check_export(dataset, fmt)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(
+        exporter.export(dataset, fmt, user_id, max(chunk_rows, 1)),
+        media_type=exporter.CONTENT_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{dataset}.{fmt}"'},
+    )
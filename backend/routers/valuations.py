@@ -0,0 +1,30 @@
+import json
+from typing import List, Optional
+
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
+from sqlmodel import Session, select
+
+from ..database import engine, get_session
+from ..models import PortfolioValuation, ValuationRun
+from ..services import revaluation
+
+router = APIRouter(prefix="/valuations", tags=["valuations"])
+
+@router.post("/run", status_code=202)
+def run_revaluation(background_tasks: BackgroundTasks, user_id: Optional[List[int]] = Query(None),
+                    workers: Optional[int] = None):
+    """Start a revaluation (all users by default) in the background."""
+    background_tasks.add_task(revaluation.revalue, engine, user_id, workers)
+    return {"status": "started"}
+
+@router.get("/runs", response_model=List[ValuationRun])
+def list_runs(limit: int = 20, session: Session = Depends(get_session)):
+    return session.exec(select(ValuationRun).order_by(ValuationRun.id.desc()).limit(limit)).all()
+
+@router.get("/latest")
+def latest(user_id: int, session: Session = Depends(get_session)):
+    """The user's totals and allocations from the most recent run."""
+    valuation: Optional[PortfolioValuation] = revaluation.latest_valuation(session, user_id)
+    if not valuation:
+        raise HTTPException(status_code=404, detail="No valuation for this user yet")
+    return {**valuation.model_dump(exclude={"allocations"}), "allocations": json.loads(valuation.allocations)}
@@ -0,0 +1,129 @@
+from datetime import date
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .tax_engine import tax_engine
+
+HORIZON_MONTHS = 40 * 12
+# Same real-return assumption as the 40-year future value in apply_projections
+REAL_RETURN = 0.05
+LIABILITY_CATEGORY = "Future Needs"
+
+
+def month_index(when, start: date) -> int:
+    """Whole months from `start`'s month to `when`'s (negative for the past)."""
+    return (when.year - start.year) * 12 + when.month - start.month
+
+
+def accumulate(opening: float, flows: np.ndarray, growth: float) -> np.ndarray:
+    """
+    Balances b[0..n] for b[m+1] = b[m] * growth + flows[m], without a Python loop:
+    b[m] = growth^m * (opening + sum_{k<m} flows[k] / growth^(k+1)).
+    """
+    powers = growth ** np.arange(len(flows) + 1)
+    return powers * np.cumsum(np.concatenate(([opening], flows / powers[1:])))
+
+
+class CashFlowPlanner:
+    """
+    Month-by-month plan of the after-tax portfolio, in today's money (real returns).
+    - Future Needs with a due_date are paid in their due month (overdue ones
+      now, ones past the horizon in its last month); until then the money
+      stays invested. Undated liabilities stay netted from the start, as in
+      process_portfolio.
+    - Unvested GSUs arrive in their vest month, net of GSU tax at today's price.
+    - monthly_contribution is saved until retirement; from then on the SWR
+      amount (swr_rate of the balance at retirement, per year) is withdrawn.
+    Everything taken from the portfolio is laid out on the month grid once, so
+    `run` is a few array operations and can be called on every input change.
+    """
+
+    def __init__(self, positions, grants, settings, gsu_price: float = 0.0, usd_rate: float = 1.0,
+                 start: Optional[date] = None, horizon_months: int = HORIZON_MONTHS):
+        start = start or date.today()
+        self.start = date(start.year, start.month, 1)
+        self.horizon = horizon_months
+        self.settings = settings
+        n = horizon_months
+
+        # 1. Dated liabilities come out of the opening balance and into their month
+        self.opening = 0.0
+        self.liabilities = np.zeros(n)
+        self.dated: List[Dict] = []
+        for p in positions:
+            value = p.net_after_tax
+            if p.category == LIABILITY_CATEGORY and p.due_date is not None and value < 0:
+                month = min(max(month_index(p.due_date, self.start), 0), n - 1)
+                self.liabilities[month] -= value
+                self.dated.append({"name": p.name, "due": p.due_date, "month": month, "amount": -value})
+            else:
+                self.opening += value
+
+        # 2. Unvested GSUs (one vectorized tax call for all grants)
+        self.gsu = np.zeros(n)
+        unvested = [g for g in grants if not g.is_vested]
+        if unvested and gsu_price > 0:
+            units = np.array([g.units for g in unvested], dtype=float)
+            tax = tax_engine.gsu_tax(units, gsu_price, [g.grant_price for g in unvested], settings)
+            months = np.clip([month_index(g.vest_date, self.start) for g in unvested], 0, n - 1)
+            np.add.at(self.gsu, months, (units * gsu_price - tax) * usd_rate)
+
+    def retirement_month(self, retirement_year: Optional[int]) -> int:
+        """Month index where withdrawals start (January of `retirement_year`; 0 if none or past)."""
+        if not retirement_year:
+            return 0
+        return min(max(month_index(date(int(retirement_year), 1, 1), self.start), 0), self.horizon)
+
+    def run(self, monthly_contribution: Optional[float] = None, retirement_year: Optional[int] = None,
+            real_return: float = REAL_RETURN, swr_rate: Optional[float] = None) -> Dict:
+        """
+        Plan for the given inputs (None = take it from settings). Returns
+        months (datetime64[M], horizon + 1), balance (start of each month),
+        the monthly flow arrays (contributions, gsu, liabilities, withdrawals),
+        withdrawal_monthly, retirement_month and depleted_month (first month
+        with a negative balance, or None).
+        """
+        s = self.settings
+        contribution = monthly_contribution if monthly_contribution is not None else getattr(s, 'monthly_contribution', 0.0) or 0.0
+        retire = self.retirement_month(retirement_year if retirement_year is not None else getattr(s, 'retirement_year', None))
+        swr = swr_rate if swr_rate is not None else getattr(s, 'swr_rate', 0.04)
+        growth = (1.0 + real_return) ** (1 / 12)
+
+        months = np.arange(self.horizon)
+        contributions = np.where(months < retire, contribution, 0.0)
+        balance = accumulate(self.opening, contributions + self.gsu - self.liabilities, growth)
+
+        # Withdrawals start at retirement, so the balance up to it does not depend on them
+        withdrawal = max(balance[retire], 0.0) * swr / 12 if retire < self.horizon else 0.0
+        withdrawals = np.where(months >= retire, withdrawal, 0.0)
+        if withdrawal:
+            balance = balance + accumulate(0.0, -withdrawals, growth)
+
+        negative = np.flatnonzero(balance < 0)
+        return {
+            "months": np.datetime64(self.start, 'M') + np.arange(self.horizon + 1),
+            "balance": balance,
+            "contributions": contributions,
+            "gsu": self.gsu,
+            "liabilities": self.liabilities,
+            "withdrawals": withdrawals,
+            "withdrawal_monthly": withdrawal,
+            "retirement_month": retire,
+            "depleted_month": int(negative[0]) if len(negative) else None,
+        }
+
+
+def plan_frame(plan: Dict, months: Sequence[int] = ()):
+    """Yearly rows (or the given month indices) of a plan, for display."""
+    import pandas as pd
+
+    idx = np.asarray(months if len(months) else np.arange(0, len(plan["balance"]), 12))
+    prev = np.maximum(idx - 12, 0)
+    df = pd.DataFrame({"Month": plan["months"][idx].astype("datetime64[D]"), "Balance": plan["balance"][idx]})
+    for key, label in (("contributions", "Contributions"), ("gsu", "GSU Vests"),
+                       ("liabilities", "Liabilities"), ("withdrawals", "Withdrawals")):
+        # Flows over the 12 months leading up to each row
+        cum = np.concatenate(([0.0], np.cumsum(plan[key])))
+        df[label] = cum[idx] - cum[prev]
+    return df
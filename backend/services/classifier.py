@@ -0,0 +1,139 @@
+import json
+import re
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from .positions import intern_weights
+
+BUCKETS = ['IL Stocks', 'US Stocks', 'Crypto', 'Work', 'Bonds', 'Cash']
+
+# Explicit split fields on Asset, in BUCKETS order
+SPLIT_FIELDS = ['alloc_il_stock_pct', 'alloc_us_stock_pct', 'alloc_crypto_pct',
+                'alloc_work_pct', 'alloc_bonds_pct', 'alloc_cash_pct']
+
+
+class Rule:
+    """
+    One classification rule; every given condition must hold.
+    Exact-match fields compare equality, `*_pattern` fields are regexes
+    (compiled once, searched anywhere in the field).
+    """
+
+    def __init__(self, bucket: str, type: Optional[str] = None, category: Optional[str] = None,
+                 ticker: Optional[str] = None, currency: Optional[str] = None,
+                 name_pattern: Optional[str] = None):
+        self.bucket = bucket
+        self.exact = [(field, value) for field, value in
+                      (("type", type), ("category", category), ("ticker", ticker), ("currency", currency))
+                      if value is not None]
+        self.name_re = re.compile(name_pattern) if name_pattern else None
+
+    def matches(self, asset) -> bool:
+        for field, value in self.exact:
+            if getattr(asset, field) != value:
+                return False
+        return self.name_re is None or bool(self.name_re.search(asset.name or ""))
+
+
+# First match wins. Mirrors the heuristics process_portfolio used to apply on every run.
+RULES: List[Rule] = [
+    Rule('Crypto', type='Cryptocurrency'),
+    Rule('Work', category='Work'),
+    Rule('Work', ticker='MSFT'),
+    Rule('Bonds', name_pattern=r'Bond|Gov'),
+    Rule('Cash', type='Cash'),
+    Rule('Cash', name_pattern=r'Deposit'),
+    Rule('US Stocks', currency='USD'),
+]
+DEFAULT_BUCKET = 'IL Stocks'
+
+
+def classify(asset, rules: List[Rule] = None) -> Dict[str, float]:
+    """
+    Bucket -> weight (0.0 - 1.0) for an asset.
+    - Liabilities (Future Needs) map to no bucket.
+    - Explicit alloc_*_pct splits win when they add up to anything meaningful.
+    - Otherwise the first matching rule gets 100%.
+    """
+    if asset.category == "Future Needs":
+        return {}
+
+    splits = [getattr(asset, f) or 0.0 for f in SPLIT_FIELDS]
+    # Allow for float rounding errors close to 1.0
+    if sum(splits) > 0.01:
+        return dict(zip(BUCKETS, splits))
+
+    for rule in (rules if rules is not None else RULES):
+        if rule.matches(asset):
+            return {rule.bucket: 1.0}
+    return {DEFAULT_BUCKET: 1.0}
+
+
+def encode_split(weights: Dict[str, float]) -> str:
+    """Compact JSON for Asset.allocation_split (zero weights dropped)."""
+    return json.dumps({b: w for b, w in weights.items() if w}, separators=(',', ':'))
+
+
+@lru_cache(maxsize=4096)
+def _decode_split(split: str) -> Tuple[Tuple[str, float], ...]:
+    return intern_weights(json.loads(split))
+
+
+def stored_weights(asset) -> Tuple[Tuple[str, float], ...]:
+    """
+    ((bucket, weight), ...) for valuation. Reads the split persisted on write;
+    assets that were never saved (or predate the column) are classified on the fly.
+    """
+    split = getattr(asset, 'allocation_split', None)
+    if split:
+        return _decode_split(split)
+    return intern_weights(classify(asset))
+
+
+# --- Write hooks ---
+def _classify_on_write(mapper, connection, target):
+    target.allocation_split = encode_split(classify(target))
+
+
+def register_classification_hooks(model):
+    """Recompute `allocation_split` whenever an asset is inserted or updated through the ORM."""
+    from sqlalchemy import event
+
+    for name in ("before_insert", "before_update"):
+        if not event.contains(model, name, _classify_on_write):
+            event.listen(model, name, _classify_on_write)
+
+
+def reclassify_all(engine, batch_size: int = 5000) -> int:
+    """
+    Re-run the rules over every stored asset (after RULES change).
+    Works in id-ordered batches and only writes rows whose split changed.
+    Returns the number of rows updated.
+    """
+    from sqlalchemy import bindparam, update
+    from sqlmodel import Session, select
+    from ..models import Asset
+
+    updated = 0
+    last_id = 0
+    with Session(engine) as session:
+        while True:
+            batch = session.exec(
+                select(Asset).where(Asset.id > last_id).order_by(Asset.id).limit(batch_size)
+            ).all()
+            if not batch:
+                break
+            changes = []
+            for asset in batch:
+                split = encode_split(classify(asset))
+                if split != asset.allocation_split:
+                    changes.append({"asset_id": asset.id, "split": split})
+            if changes:
+                # Core UPDATE: bypasses the ORM hooks, which would only recompute the same value
+                stmt = update(Asset).where(Asset.id == bindparam("asset_id")).values(allocation_split=bindparam("split"))
+                session.connection().execute(stmt, changes)
+                session.commit()
+                updated += len(changes)
+            last_id = batch[-1].id
+            session.expunge_all()
+    return updated
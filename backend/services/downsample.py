@@ -0,0 +1,118 @@
+from datetime import date
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from .classifier import stored_weights
+from .performance import TOTAL, PerformanceBook
+
+# Plotly draws one vertex per pixel at best; ~1 point per 2px keeps lines smooth
+CHART_WIDTH_PX = 1200
+PX_PER_POINT = 2
+BUCKETS = ['US Stocks', 'IL Stocks', 'Bonds', 'Cash', 'Crypto', 'Work']
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: indices of `n_out` points that keep the
+    visual shape of (x, y). First and last points are always kept; each
+    middle bucket keeps the point forming the largest triangle with the
+    previous pick and the next bucket's average. One pass, O(len(x)).
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int) # n_out - 2 buckets between the endpoints
+    # Average of the bucket after each one (the last point closes the final bucket)
+    bounds = np.append(edges, n)
+    sizes = np.diff(bounds)
+    avg_x = (np.add.reduceat(x, bounds[:-1]) / sizes)[1:]
+    avg_y = (np.add.reduceat(y, bounds[:-1]) / sizes)[1:]
+
+    picked = np.empty(n_out, dtype=int)
+    picked[0], picked[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        ax, ay = x[a], y[a]
+        # Twice the triangle area (a, candidate, next average); the constant terms don't change the argmax
+        area = np.abs((ax - avg_x[i]) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (avg_y[i] - ay))
+        a = lo + int(area.argmax())
+        picked[i + 1] = a
+    return picked
+
+
+def minmax(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Min/max bucketing: the lowest and highest point of each of n_out/2
+    buckets (plus both endpoints), so every spike and drawdown survives.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 4:
+        return np.arange(n)
+    y = np.asarray(y, dtype=float)
+    starts = np.linspace(0, n, n_out // 2 + 1).astype(int)[:-1]
+    sizes = np.diff(np.append(starts, n))
+    positions = np.arange(n)
+    picks = [[0, n - 1]]
+    for reduce in (np.minimum, np.maximum):
+        extreme = np.repeat(reduce.reduceat(y, starts), sizes)
+        # First position in each bucket that attains the bucket's extreme
+        hits = np.where(y == extreme, positions, n)
+        picks.append(np.minimum.reduceat(hits, starts))
+    return np.unique(np.concatenate(picks))
+
+
+METHODS = {"lttb": lttb, "minmax": minmax}
+
+
+def select_points(x: np.ndarray, series: np.ndarray, n_out: int, method: str = "lttb") -> np.ndarray:
+    """
+    Shared indices for several series (days x k): the union of each series'
+    picks from an n_out / k budget, so traces stay aligned (stackable) and
+    the union never exceeds n_out points.
+    """
+    pick = METHODS[method]
+    x = np.asarray(x)
+    xf = x.astype('datetime64[D]').astype(np.int64) if x.dtype.kind == 'M' else x
+    series = np.asarray(series).reshape(len(xf), -1)
+    budget = max(n_out // series.shape[1], 4)
+    return np.unique(np.concatenate([pick(xf, series[:, j], budget) for j in range(series.shape[1])]))
+
+
+def display_points(width_px: int = CHART_WIDTH_PX) -> int:
+    return max(int(width_px) // PX_PER_POINT, 16)
+
+
+def bucket_values(book: PerformanceBook, assets) -> np.ndarray:
+    """Daily values per allocation bucket (days x BUCKETS), same weights as process_portfolio."""
+    by_id = {a.id: a for a in assets}
+    weights = np.zeros((len(book.asset_ids), len(BUCKETS)))
+    for i, asset_id in enumerate(book.asset_ids):
+        for bucket, w in stored_weights(by_id[asset_id]):
+            if bucket in BUCKETS:
+                weights[i, BUCKETS.index(bucket)] += w
+    positions = np.clip(book.values[:, :len(book.asset_ids)], 0.0, None) # Liabilities stay out of buckets
+    return positions @ weights
+
+
+def history_series(book: PerformanceBook, assets, start: Optional[date] = None, end: Optional[date] = None,
+                   width_px: int = CHART_WIDTH_PX, method: str = "lttb") -> Dict[str, Tuple[np.ndarray, Dict[str, np.ndarray]]]:
+    """
+    Net-worth and per-bucket history over [start, end], cut down to the
+    chart's display resolution. Only the visible window is sampled, so a
+    shorter range brings back detail while the payload stays the same size.
+    Returns {"net_worth": (days, {TOTAL: values}), "buckets": (days, {bucket: values})}.
+    """
+    s, e = book.window(start, end)
+    days = book.days[s:e + 1]
+    n_out = display_points(width_px)
+    total = book.values[s:e + 1, book.labels.index(TOTAL)]
+    buckets = bucket_values(book, assets)[s:e + 1]
+
+    keep = select_points(days, total, n_out, method)
+    keep_b = select_points(days, buckets, n_out, method)
+    return {"net_worth": (days[keep], {TOTAL: total[keep]}),
+            "buckets": (days[keep_b], {name: buckets[keep_b, j] for j, name in enumerate(BUCKETS)})}
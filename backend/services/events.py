@@ -0,0 +1,215 @@
+import asyncio
+import json
+import time
+from typing import AsyncIterator, Callable, Dict, Optional, Set
+
+from sqlmodel import Session, select
+
+from ..database import engine
+from ..models import Asset, Settings
+from .streaming import LivePortfolio, crypto_symbols, feed_from_env, stream_quotes
+from .valuation import asset_symbol, get_fx_matrix, get_live_prices, get_live_quotes, process_portfolio, push_live_prices
+
+
+def load_portfolio(user_id: int):
+    """Full valuation for one user: (summary, positions, fx, settings)."""
+    with Session(engine) as session:
+        settings = session.exec(select(Settings).where(Settings.user_id == user_id)).first() or Settings(user_id=user_id)
+        assets = session.exec(select(Asset).where(Asset.user_id == user_id)).all()
+    symbols = sorted({asset_symbol(a) for a in assets if not (a.manual_price and a.manual_price > 0)})
+    prices = get_live_prices(symbols)
+    fx = get_fx_matrix({a.currency for a in assets} | {"USD", "ILS", settings.base_currency})
+    if settings.use_manual_fx:
+        fx = fx.override("USD", "ILS", settings.usd_ils_rate)
+    summary, positions = process_portfolio(assets, prices, fx, settings)
+    return summary, positions, fx, settings
+
+
+def snapshot(live: LivePortfolio) -> dict:
+    """Compact, JSON-ready view of a portfolio (rounded to avoid float noise in deltas)."""
+    return {
+        "positions": {
+            str(p.id): {
+                "price": round(p.price, 6),
+                "value": round(p.mkt_val_ils, 2),
+                "net": round(p.net_after_tax, 2),
+            }
+            for p in live.positions
+        },
+        "totals": {
+            "net_worth": round(live.summary['total_net_worth'], 2),
+            "after_tax": round(live.summary['total_after_tax'], 2),
+            "swr_monthly": round(live.summary['swr_monthly'], 2),
+        },
+        "allocations": {k: round(v, 2) for k, v in live.summary['allocations'].items()},
+    }
+
+
+def diff(old: Optional[dict], new: dict) -> dict:
+    """Only what changed between two snapshots. Removed positions map to None."""
+    if old is None:
+        return new
+    delta = {}
+    changed = {k: v for k, v in new["positions"].items() if old["positions"].get(k) != v}
+    changed.update({k: None for k in old["positions"] if k not in new["positions"]})
+    if changed:
+        delta["positions"] = changed
+    for section in ("totals", "allocations"):
+        sub = {k: v for k, v in new[section].items() if old[section].get(k) != v}
+        if sub:
+            delta[section] = sub
+    return delta
+
+
+class _UserState:
+    def __init__(self, live: LivePortfolio):
+        self.live = live
+        self.version = 0
+        self.snapshot = snapshot(live)
+        self.clients: Set[asyncio.Event] = set()
+        self.task: Optional[asyncio.Task] = None
+
+    def bump(self):
+        self.version += 1
+        self.snapshot = snapshot(self.live)
+        for wake in self.clients:
+            wake.set()
+
+
+class PortfolioHub:
+    """
+    Fan-out of live portfolio deltas to SSE clients.
+    - One valuation + one quote stream per user, shared by all of that user's clients.
+    - Crypto ticks, other quotes (polled every `quote_interval` through the
+      QuoteCache, so upstream refetches follow its market-hours expiry), FX moves
+      (polled every `fx_interval`) and asset edits bump the user's snapshot;
+      each client is woken and sends the diff against what *it* last sent, no
+      more often than its `min_interval`. Slow clients therefore get one merged
+      delta instead of a backlog.
+    """
+
+    def __init__(self, loader: Callable = load_portfolio, feed_factory: Callable = feed_from_env,
+                 fx_interval: float = 300.0, keepalive: float = 15.0, quote_interval: float = 60.0,
+                 quote_source: Callable = get_live_quotes):
+        self.loader = loader
+        self.feed_factory = feed_factory
+        self.fx_interval = fx_interval
+        self.quote_interval = quote_interval
+        self.quote_source = quote_source
+        self.keepalive = keepalive
+        self._users: Dict[int, _UserState] = {}
+        self._loading: Dict[int, asyncio.Lock] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def _state(self, user_id: int) -> _UserState:
+        self._loop = asyncio.get_running_loop()
+        state = self._users.get(user_id)
+        if state is None:
+            # Concurrent first connections share one load and one background task
+            async with self._loading.setdefault(user_id, asyncio.Lock()):
+                state = self._users.get(user_id)
+                if state is None:
+                    summary, positions, fx, settings = await asyncio.to_thread(self.loader, user_id)
+                    state = self._users[user_id] = _UserState(LivePortfolio(summary, positions, fx, settings))
+                    state.task = asyncio.create_task(self._run(user_id, state))
+        return state
+
+    async def _run(self, user_id: int, state: _UserState):
+        """Per-user background work: crypto quote stream + polling of other quotes and FX."""
+        symbols = crypto_symbols(state.live.positions)
+        # Everything else that has a live quote (manual prices are per asset, never quoted)
+        polled = sorted({p.symbol for p in state.live.positions
+                         if p.symbol not in symbols and not p.has_manual_price})
+        stream = None
+        if symbols:
+            start = {p.symbol: p.price for p in state.live.positions if p.symbol in symbols}
+            stream = asyncio.create_task(stream_quotes(
+                self.feed_factory(symbols, start), state.live,
+                on_update=lambda changed, summary: state.bump(),
+                on_prices=push_live_prices,
+            ))
+        loop = asyncio.get_running_loop()
+        next_fx = loop.time() + self.fx_interval
+        try:
+            while True:
+                wait = next_fx - loop.time()
+                if polled:
+                    wait = min(wait, self.quote_interval)
+                await asyncio.sleep(max(wait, 0.0))
+                if polled:
+                    quotes = await asyncio.to_thread(self.quote_source, polled)
+                    # Only positions whose price moved are revalued
+                    if state.live.apply({t: q.price for t, q in quotes.items()}):
+                        state.bump()
+                if loop.time() < next_fx:
+                    continue
+                next_fx = loop.time() + self.fx_interval
+                fx = await asyncio.to_thread(get_fx_matrix, state.live.fx.currencies)
+                if state.live.settings.use_manual_fx:
+                    fx = fx.override("USD", "ILS", state.live.settings.usd_ils_rate)
+                if fx.usd_rates != state.live.fx.usd_rates:
+                    await self.reload(user_id)
+        finally:
+            if stream:
+                stream.cancel()
+
+    async def reload(self, user_id: int):
+        """Full revaluation (asset edits, FX moves). Clients receive only the diff."""
+        state = self._users.get(user_id)
+        if state is None:
+            return
+        summary, positions, fx, settings = await asyncio.to_thread(self.loader, user_id)
+        state.live = LivePortfolio(summary, positions, fx, settings)
+        if state.task:
+            # Restart the quote stream so it follows the new position set
+            state.task.cancel()
+        state.task = asyncio.create_task(self._run(user_id, state))
+        state.bump()
+
+    def notify_assets_changed(self, user_id: int):
+        """Thread-safe hook for the (sync) asset endpoints."""
+        if self._loop is None or user_id not in self._users:
+            return
+        self._loop.call_soon_threadsafe(lambda: asyncio.ensure_future(self.reload(user_id)))
+
+    async def events(self, user_id: int, min_interval: float = 1.0,
+                     is_disconnected: Callable = None) -> AsyncIterator[str]:
+        """SSE stream: one `snapshot` event, then `delta` events."""
+        state = await self._state(user_id)
+        wake = asyncio.Event()
+        state.clients.add(wake)
+        try:
+            last = state.snapshot
+            yield _sse("snapshot", last)
+            last_sent = time.monotonic()
+            while True:
+                try:
+                    await asyncio.wait_for(wake.wait(), timeout=self.keepalive)
+                except asyncio.TimeoutError:
+                    if is_disconnected and await is_disconnected():
+                        return
+                    yield ": keepalive\n\n"
+                    continue
+                # Throttle: anything arriving during the wait is folded into this delta
+                remaining = min_interval - (time.monotonic() - last_sent)
+                if remaining > 0:
+                    await asyncio.sleep(remaining)
+                wake.clear()
+                current = state.snapshot
+                delta = diff(last, current)
+                if delta:
+                    yield _sse("delta", delta)
+                    last, last_sent = current, time.monotonic()
+        finally:
+            state.clients.discard(wake)
+            if not state.clients and self._users.get(user_id) is state:
+                del self._users[user_id]
+                if state.task:
+                    state.task.cancel()
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+hub = PortfolioHub()
@@ -0,0 +1,286 @@
+import csv
+import io
+import math
+import zipfile
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from xml.sax.saxutils import escape
+
+from sqlmodel import Session, select
+
+from ..database import engine
+from ..models import Asset, PriceHistory, Settings, StockGrant, Transaction
+from .valuation import asset_symbol, get_fx_matrix, get_live_prices, process_portfolio
+
+CHUNK_ROWS = 5000
+
+# Column name and type per dataset (types: str, float, int, bool, date, datetime).
+# Fixed up front so every chunk and every format share one schema.
+COLUMNS: Dict[str, List[Tuple[str, str]]] = {
+    "positions": [
+        ("user_id", "int"), ("asset_id", "int"), ("name", "str"), ("ticker", "str"), ("symbol", "str"),
+        ("type", "str"), ("category", "str"), ("currency", "str"), ("quantity", "float"),
+        ("price", "float"), ("cost_per_unit", "float"), ("market_value", "float"), ("cost_basis", "float"),
+        ("tax", "float"), ("net_after_tax", "float"), ("base_currency", "str"),
+    ],
+    "grants": [
+        ("user_id", "int"), ("grant_id", "int"), ("name", "str"), ("grant_date", "datetime"),
+        ("vest_date", "datetime"), ("units", "float"), ("grant_price", "float"), ("vest_price", "float"),
+        ("is_vested", "bool"),
+    ],
+    "transactions": [
+        ("user_id", "int"), ("transaction_id", "int"), ("asset_id", "int"), ("trade_date", "datetime"),
+        ("kind", "str"), ("quantity", "float"), ("amount", "float"), ("notes", "str"),
+    ],
+    "history": [("symbol", "str"), ("day", "date"), ("close", "float")],
+}
+
+CONTENT_TYPES = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+# --- Row sources: each yields lists of row dicts, reading the DB in keyset-paged chunks ---
+
+def _paged(model, filters: Sequence, chunk_rows: int) -> Iterator[list]:
+    """Rows of `model` ordered by id, one chunk per query (bounded memory, no OFFSET scans)."""
+    last_id = 0
+    with Session(engine) as session:
+        while True:
+            rows = session.exec(select(model).where(model.id > last_id, *filters)
+                                .order_by(model.id).limit(chunk_rows)).all()
+            if not rows:
+                return
+            last_id = rows[-1].id
+            yield rows
+            session.expunge_all()
+
+
+def iter_positions(user_ids: Optional[Sequence[int]] = None, chunk_rows: int = CHUNK_ROWS) -> Iterator[List[dict]]:
+    """Valued positions (process_portfolio), priced and converted chunk by chunk."""
+    filters = [Asset.user_id.in_(user_ids)] if user_ids else []
+    settings_by_user: Dict[int, Settings] = {}
+    fx_by_user = {}
+    with Session(engine) as session:
+        currencies = set(session.exec(select(Asset.currency).distinct().where(*filters)).all())
+        # Every exported user's base currency, so the matrix covers each conversion target
+        user_filters = [Settings.user_id.in_(user_ids)] if user_ids else []
+        currencies |= {c or 'ILS' for c in session.exec(select(Settings.base_currency).distinct().where(*user_filters)).all()}
+    fx = get_fx_matrix(currencies | {"USD", "ILS"})
+
+    for assets in _paged(Asset, filters, chunk_rows):
+        by_user: Dict[int, List[Asset]] = {}
+        for a in assets:
+            by_user.setdefault(a.user_id, []).append(a)
+        symbols = sorted({asset_symbol(a) for a in assets if not (a.manual_price and a.manual_price > 0)})
+        prices = get_live_prices(symbols) if symbols else {}
+
+        rows = []
+        for user_id, user_assets in by_user.items():
+            if user_id not in settings_by_user:
+                with Session(engine) as session:
+                    settings = session.exec(select(Settings).where(Settings.user_id == user_id)).first() or Settings(user_id=user_id)
+                settings_by_user[user_id] = settings
+                fx_by_user[user_id] = fx.override("USD", "ILS", settings.usd_ils_rate) if settings.use_manual_fx else fx
+            settings = settings_by_user[user_id]
+            summary, positions = process_portfolio(user_assets, prices, fx_by_user[user_id], settings)
+            base_ccy = settings.base_currency or 'ILS'
+            # No rate to the base currency: export the row with empty values rather than a 0 or an abort
+            unconverted = set(summary.get('unconverted', ()))
+            for p in positions:
+                valued = p.currency not in unconverted
+                rows.append({
+                    "user_id": user_id, "asset_id": p.id, "name": p.name, "ticker": p.ticker, "symbol": p.symbol,
+                    "type": p.type, "category": p.category, "currency": p.currency, "quantity": p.quantity,
+                    "price": p.price, "cost_per_unit": p.cost_per_unit,
+                    "market_value": p.mkt_val_ils if valued else None,
+                    "cost_basis": p.cost_basis_ils if valued else None,
+                    "tax": p.tax_ils if valued else None,
+                    "net_after_tax": p.net_after_tax if valued else None,
+                    "base_currency": base_ccy,
+                })
+        yield rows
+
+
+def iter_grants(user_ids: Optional[Sequence[int]] = None, chunk_rows: int = CHUNK_ROWS) -> Iterator[List[dict]]:
+    filters = [StockGrant.user_id.in_(user_ids)] if user_ids else []
+    for grants in _paged(StockGrant, filters, chunk_rows):
+        yield [{"user_id": g.user_id, "grant_id": g.id, "name": g.name, "grant_date": g.grant_date,
+                "vest_date": g.vest_date, "units": g.units, "grant_price": g.grant_price,
+                "vest_price": g.vest_price, "is_vested": g.is_vested} for g in grants]
+
+
+def iter_transactions(user_ids: Optional[Sequence[int]] = None, chunk_rows: int = CHUNK_ROWS) -> Iterator[List[dict]]:
+    filters = [Transaction.user_id.in_(user_ids)] if user_ids else []
+    for txns in _paged(Transaction, filters, chunk_rows):
+        yield [{"user_id": t.user_id, "transaction_id": t.id, "asset_id": t.asset_id, "trade_date": t.trade_date,
+                "kind": t.kind, "quantity": t.quantity, "amount": t.amount, "notes": t.notes} for t in txns]
+
+
+def iter_history(user_ids: Optional[Sequence[int]] = None, chunk_rows: int = CHUNK_ROWS) -> Iterator[List[dict]]:
+    """Stored daily closes (shared across users, so `user_ids` does not filter)."""
+    for closes in _paged(PriceHistory, [], chunk_rows):
+        yield [{"symbol": c.symbol, "day": c.day, "close": c.close} for c in closes]
+
+
+DATASETS: Dict[str, Callable[..., Iterator[List[dict]]]] = {
+    "positions": iter_positions,
+    "grants": iter_grants,
+    "transactions": iter_transactions,
+    "history": iter_history,
+}
+
+
+# --- Writers: each turns row chunks into byte chunks, yielding after every input chunk ---
+
+class _Sink(io.RawIOBase):
+    """Write-only buffer the writers fill; drained after every chunk."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self) -> bytes:
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def _csv_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    return "" if value is None else value
+
+
+def stream_csv(columns: List[Tuple[str, str]], chunks: Iterable[List[dict]]) -> Iterator[bytes]:
+    names = [name for name, _ in columns]
+    text = io.StringIO()
+    writer = csv.writer(text)
+    writer.writerow(names)
+    yield text.getvalue().encode()
+    for rows in chunks:
+        text.seek(0)
+        text.truncate()
+        writer.writerows([_csv_value(row.get(n)) for n in names] for row in rows)
+        yield text.getvalue().encode()
+
+
+def stream_parquet(columns: List[Tuple[str, str]], chunks: Iterable[List[dict]]) -> Iterator[bytes]:
+    """One row group per chunk; needs pyarrow (optional dependency)."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    types = {"str": pa.string(), "float": pa.float64(), "int": pa.int64(), "bool": pa.bool_(),
+             "date": pa.date32(), "datetime": pa.timestamp("us")}
+    schema = pa.schema([(name, types[kind]) for name, kind in columns])
+    sink = _Sink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for rows in chunks:
+            if rows:
+                writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def _xlsx_cell(value, kind: str) -> str:
+    if value is None or (kind == "float" and not math.isfinite(value)):
+        return "<c/>"
+    if kind in ("float", "int"):
+        return f"<c><v>{value!r}</v></c>" if kind == "float" else f"<c><v>{int(value)}</v></c>"
+    if kind == "bool":
+        return f'<c t="b"><v>{int(bool(value))}</v></c>'
+    if kind in ("date", "datetime"):
+        value = value.isoformat(sep=" ") if isinstance(value, datetime) else value.isoformat()
+    return f'<c t="inlineStr"><is><t>{escape(str(value))}</t></is></c>'
+
+
+_XLSX_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'),
+}
+
+
+def stream_xlsx(columns: List[Tuple[str, str]], chunks: Iterable[List[dict]], sheet: str = "Sheet1") -> Iterator[bytes]:
+    """
+    Minimal single-sheet workbook written as a streamed zip (inline strings,
+    no shared-string table), so rows go out as they are produced.
+    """
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, body in _XLSX_PARTS.items():
+            zf.writestr(name, body)
+        zf.writestr("xl/workbook.xml", (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f'<sheets><sheet name="{escape(sheet[:31])}" sheetId="1" r:id="rId1"/></sheets></workbook>'))
+        with zf.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as ws:
+            header = "".join(_xlsx_cell(name, "str") for name, _ in columns)
+            ws.write(('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                      '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                      f'<sheetData><row>{header}</row>').encode())
+            yield sink.drain()
+            for rows in chunks:
+                ws.write("".join("<row>" + "".join(_xlsx_cell(row.get(name), kind) for name, kind in columns) + "</row>"
+                                 for row in rows).encode())
+                yield sink.drain()
+            ws.write(b"</sheetData></worksheet>")
+    yield sink.drain()
+
+
+WRITERS = {"csv": stream_csv, "parquet": stream_parquet, "xlsx": stream_xlsx}
+
+
+def check_export(dataset: str, fmt: str):
+    """Raise ValueError for unknown datasets/formats or a missing optional dependency."""
+    if dataset not in DATASETS:
+        raise ValueError(f"Unknown dataset '{dataset}' (choose from {', '.join(DATASETS)})")
+    if fmt not in WRITERS:
+        raise ValueError(f"Unknown format '{fmt}' (choose from {', '.join(WRITERS)})")
+    if fmt == "parquet":
+        try:
+            import pyarrow.parquet  # noqa: F401
+        except ImportError:
+            raise ValueError("Parquet export needs pyarrow (pip install pyarrow)")
+
+
+def export(dataset: str, fmt: str, user_ids: Optional[Sequence[int]] = None,
+           chunk_rows: int = CHUNK_ROWS) -> Iterator[bytes]:
+    """Byte chunks of `dataset` in `fmt`; nothing is materialized beyond one chunk of rows."""
+    check_export(dataset, fmt)
+    chunks = DATASETS[dataset](user_ids, chunk_rows)
+    for data in WRITERS[fmt](COLUMNS[dataset], chunks):
+        if data:
+            yield data
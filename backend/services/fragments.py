@@ -0,0 +1,231 @@
+import hashlib
+import pickle
+import threading
+from collections import OrderedDict
+from html import escape
+from typing import Callable, Dict, Sequence, Tuple
+
+from .metrics import CACHE_REQUESTS
+
+# Rendered tables are tiny next to the data that produced them; a few hundred
+# entries cover every table of every active session on one server process.
+MAX_FRAGMENTS = 512
+
+MUTED = "<span style='color:#64748B'>{}</span>"
+
+
+def digest(data) -> str:
+    """Key for nested tuples/lists/dicts of plain values (pickle is ~3x faster than repr for dates)."""
+    return hashlib.blake2b(pickle.dumps(data, protocol=5), digest_size=16).hexdigest()
+
+
+class FragmentCache:
+    """
+    Process-wide LRU of rendered HTML keyed by (template name, digest of input).
+    Streamlit runs every session in one process, so an unchanged table is
+    formatted once and then reused across reruns and across sessions.
+    """
+
+    def __init__(self, maxsize: int = MAX_FRAGMENTS):
+        self.maxsize = maxsize
+        self._items: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, name: str, data, render: Callable[[], str]) -> str:
+        """HTML for `data`, calling `render()` only when this input was not seen before."""
+        key = (name, digest(data))
+        with self._lock:
+            html = self._items.get(key)
+            if html is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+        if html is not None:
+            CACHE_REQUESTS.inc(cache="fragment", result="hit")
+            return html
+
+        html = render()
+        CACHE_REQUESTS.inc(cache="fragment", result="miss")
+        with self._lock:
+            self.misses += 1
+            self._items[key] = html
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+        return html
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self._items)
+
+
+fragment_cache = FragmentCache()
+
+
+class TableTemplate:
+    """
+    A table as three string templates: `head` (opening markup), `row`
+    (str.format fields per row) and `foot`. Rows are joined once instead of
+    concatenated with += and the markup carries no indentation whitespace.
+    """
+
+    def __init__(self, name: str, head: str, row: str, foot: str = "</tbody></table></div>"):
+        self.name = name
+        self.head = _compact(head)
+        self.row = _compact(row)
+        self.foot = foot
+
+    def render(self, rows: Sequence[Dict]) -> str:
+        return "".join([self.head, *[self.row.format(**r) for r in rows], self.foot])
+
+
+def _compact(markup: str) -> str:
+    return "".join(line.strip() for line in markup.strip().splitlines())
+
+
+def money_action(delta: float, buy: str, sell: str, style: str, threshold: float = 1000.0, idle: str = "—") -> str:
+    """Buy/sell cell: green for positive deltas, red for negative, muted under `threshold`."""
+    if abs(delta) < threshold:
+        return MUTED.format(idle)
+    color, label = ("#34D399", buy) if delta > 0 else ("#FB7185", sell)
+    return f"<span style='color:{color}; {style}'>{label.format(amount=f'₪{abs(delta):,.0f}')}</span>"
+
+
+# --- Dashboard tables ---
+
+ALLOCATION_TABLE = TableTemplate("allocation", """
+    <div class="card" style="padding:0; overflow-x:auto;">
+        <table class="styled-table" style="min-width:600px;">
+            <thead>
+                <tr>
+                    <th style="width:25%;">Asset Class</th>
+                    <th class="text-right" style="width:20%;">Current Value</th>
+                    <th class="text-right" style="width:15%;">Actual %</th>
+                    <th class="text-right" style="width:15%;">Target %</th>
+                    <th class="text-right" style="width:25%;">Delta</th>
+                </tr>
+            </thead>
+            <tbody>
+""", """
+    <tr>
+        <td style="font-weight:600;">{bucket}</td>
+        <td class="text-right">₪{value:,.0f}</td>
+        <td class="text-right">{pct:.1f}%</td>
+        <td class="text-right">{target:.1f}%</td>
+        <td class="text-right">{action}</td>
+    </tr>
+""")
+
+GSU_TABLE = TableTemplate("gsu", """
+    <div style="overflow-x:auto;">
+    <table class="styled-table">
+        <thead>
+            <tr>
+                <th>Grant Date</th>
+                <th>Full Vest Date</th>
+                <th class="text-right">Total Units</th>
+                <th class="text-right">Vested</th>
+                <th class="text-right">Unvested</th>
+                <th class="text-right">Grant Price</th>
+                <th class="text-right">Value (Unvested)</th>
+            </tr>
+        </thead>
+        <tbody>
+""", """
+    <tr>
+        <td>{grant_date:%d/%m/%Y}</td>
+        <td>{vest_date:%d/%m/%Y}</td>
+        <td class="text-right">{total:.0f}</td>
+        <td class="text-right" style="color:#34D399;">{vested:.0f}</td>
+        <td class="text-right" style="color:#F59E0B;">{unvested:.0f}</td>
+        <td class="text-right">${grant_price:.2f}</td>
+        <td class="text-right">${unvested_value:,.0f}</td>
+    </tr>
+""")
+
+REBALANCING_TABLE = TableTemplate("rebalancing", """
+    <div style="overflow-x:auto;">
+    <table class="styled-table">
+        <thead>
+            <tr>
+                <th style="width:25%;">Bucket</th>
+                <th class="text-right" style="width:20%;">Actual</th>
+                <th class="text-right" style="width:15%;">Target</th>
+                <th class="text-right" style="width:40%;">Recommended Action</th>
+            </tr>
+        </thead>
+        <tbody>
+""", """
+    <tr>
+        <td style="font-weight:600;">{bucket}</td>
+        <td class="text-right">
+            <div>₪{value:,.0f}</div>
+            <div style="font-size:0.75rem; color:#64748B;">{pct:.1f}%</div>
+        </td>
+        <td class="text-right">{target:.1f}%</td>
+        <td class="text-right">{action}</td>
+    </tr>
+""")
+
+LOCATION_TABLE = TableTemplate("location", """
+    <table class="styled-table" style="font-size:0.8rem;">
+        <tbody>
+""", """
+    <tr><td style='padding:8px;'>{location}</td><td style='padding:8px; text-align:right;'>₪{value:,.0f}</td><td style='padding:8px; text-align:right; color:#94A3B8;'>{pct:.1f}%</td></tr>
+""", "</tbody></table>")
+
+
+def allocation_rows(allocs: Dict[str, float], targets: Dict[str, float], total: float, buckets: Sequence[str]):
+    """Rows for ALLOCATION_TABLE (delta = what to buy/sell to reach the target)."""
+    rows = []
+    for b in buckets:
+        val = allocs.get(b, 0.0)
+        tgt = targets.get(b, 0.0)
+        delta = total * (tgt / 100) - val
+        rows.append({"bucket": escape(b), "value": val, "pct": (val / total * 100) if total > 0 else 0,
+                     "target": tgt, "action": money_action(delta, "+{amount} (Buy)", "-{amount} (Sell)", "font-weight:600;")})
+    return rows
+
+
+def rebalancing_rows(allocs: Dict[str, float], targets: Dict[str, float], total: float, buckets: Sequence[str]):
+    """Rows for REBALANCING_TABLE."""
+    rows = []
+    for b in buckets:
+        val = allocs.get(b, 0.0)
+        tgt = targets.get(b, 0.0)
+        delta = total * (tgt / 100) - val
+        rows.append({"bucket": escape(b), "value": val, "pct": (val / total * 100) if total > 0 else 0, "target": tgt,
+                     "action": money_action(delta, "BUY {amount}", "SELL {amount}", "font-weight:700;", idle="No Action")})
+    return rows
+
+
+# --- Memoized entry points (the key is the raw input, so a hit skips building rows too) ---
+
+def allocation_table(allocs: Dict[str, float], targets: Dict[str, float], total: float, buckets: Sequence[str]) -> str:
+    data = (sorted(allocs.items()), sorted(targets.items()), total, tuple(buckets))
+    return fragment_cache.get("allocation", data,
+                              lambda: ALLOCATION_TABLE.render(allocation_rows(allocs, targets, total, buckets)))
+
+
+def rebalancing_table(allocs: Dict[str, float], targets: Dict[str, float], total: float, buckets: Sequence[str]) -> str:
+    data = (sorted(allocs.items()), sorted(targets.items()), total, tuple(buckets))
+    return fragment_cache.get("rebalancing", data,
+                              lambda: REBALANCING_TABLE.render(rebalancing_rows(allocs, targets, total, buckets)))
+
+
+def gsu_table(groups: Sequence[Dict], price: float) -> str:
+    """`groups`: dicts with grant_date, vest_date, grant_price, total, vested, unvested."""
+    data = (groups, price)
+    return fragment_cache.get("gsu", data, lambda: GSU_TABLE.render(
+        [{**g, "unvested_value": g["unvested"] * price} for g in groups]))
+
+
+def location_table(locations: Sequence[Tuple[str, float]], total: float) -> str:
+    data = (tuple(locations), total)
+    return fragment_cache.get("location", data, lambda: LOCATION_TABLE.render(
+        [{"location": escape(loc), "value": val, "pct": (val / total * 100) if total > 0 else 0}
+         for loc, val in locations]))
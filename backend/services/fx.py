@@ -0,0 +1,226 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import yfinance as yf
+
+from . import providers
+from .market_hours import FX_POLICY
+from .metrics import CACHE_REQUESTS, PROVIDER_LATENCY, PROVIDER_REQUESTS
+from .singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Every rate is stored against USD (units of currency per 1 USD), so any
+# cross rate is a single division and N currencies need only N-1 fetches.
+PIVOT = "USD"
+
+# Used only when a currency has never been fetched successfully
+FALLBACK_USD_RATES = {"USD": 1.0, "ILS": 3.5}
+
+
+def fetch_usd_rates(currencies: List[str]) -> Dict[str, float]:
+    """One Yahoo spark request for all `USDxxx=X` pairs. Returns units per 1 USD."""
+    symbols = {f"{PIVOT}{c}=X": c for c in currencies if c != PIVOT}
+    rates = {PIVOT: 1.0} if PIVOT in currencies else {}
+    if not symbols or os.environ.get("PORTFOLIO_OFFLINE") == "1":
+        return rates
+
+    try:
+        fetched = providers.fetch_yahoo_spark_prices(list(symbols))
+    except providers.ProviderError:
+        if providers.YAHOO_BASE_URL:
+            raise
+        fetched = _download_usd_rates(list(symbols))
+    rates.update({symbols[sym]: rate for sym, rate in fetched.items()})
+    return rates
+
+
+def _download_usd_rates(symbols: List[str]) -> Dict[str, float]:
+    """yfinance fallback for when the spark endpoint is down."""
+    data = yf.download(symbols, period="5d", group_by="ticker", progress=False, threads=True)
+    if data.empty:
+        return {}
+
+    fetched = {}
+    for sym in symbols:
+        try:
+            if isinstance(data.columns, pd.MultiIndex):
+                series = data[sym]['Close'].dropna()
+            else:
+                series = data['Close'].dropna()
+            if not series.empty:
+                rate = series.iloc[-1]
+                fetched[sym] = float(rate.item() if hasattr(rate, 'item') else rate)
+        except Exception:
+            continue
+    return fetched
+
+
+class FXMatrix:
+    """
+    Snapshot of cross rates between a set of currencies.
+    rates[i, j] = units of currency j per 1 unit of currency i.
+    """
+
+    def __init__(self, usd_rates: Dict[str, float], as_of: Optional[float] = None):
+        self.currencies = sorted(usd_rates)
+        self.index = {c: i for i, c in enumerate(self.currencies)}
+        per_usd = np.array([usd_rates[c] for c in self.currencies], dtype=float)
+        self.usd_rates = dict(usd_rates)
+        self.rates = per_usd[np.newaxis, :] / per_usd[:, np.newaxis]
+        self.as_of = as_of if as_of is not None else time.time()
+
+    @classmethod
+    def from_usd_ils(cls, usd_ils: float) -> "FXMatrix":
+        """Legacy single-rate input (the old `fx_rate` float)."""
+        return cls({"USD": 1.0, "ILS": usd_ils})
+
+    def rate(self, from_ccy: str, to_ccy: str) -> float:
+        """Cross rate, or NaN (with a warning) when either currency has no rate."""
+        if from_ccy not in self.index or to_ccy not in self.index:
+            logger.warning("No FX rate for %s/%s", from_ccy, to_ccy)
+            return float("nan")
+        return float(self.rates[self.index[from_ccy], self.index[to_ccy]])
+
+    def override(self, from_ccy: str, to_ccy: str, rate: float) -> "FXMatrix":
+        """Copy with one pair pinned (e.g. a manual USD/ILS), keeping `from_ccy` fixed against USD."""
+        usd_rates = dict(self.usd_rates)
+        usd_rates.setdefault(from_ccy, FALLBACK_USD_RATES.get(from_ccy, 1.0))
+        usd_rates[to_ccy] = usd_rates[from_ccy] * rate
+        return FXMatrix(usd_rates, self.as_of)
+
+    def convert(self, amounts: Sequence[float], currencies: Sequence[str], to_ccy: str) -> np.ndarray:
+        """
+        Convert a whole array of amounts in one step.
+        Amounts in a currency the matrix does not know come back as NaN (all
+        of them if `to_ccy` itself is unknown).
+        """
+        amounts = np.asarray(amounts, dtype=float)
+        if to_ccy not in self.index:
+            logger.warning("No FX rate for %s; %d amounts left unconverted", to_ccy, len(amounts))
+            return np.full(amounts.shape, np.nan)
+        col = self.rates[:, self.index[to_ccy]]
+        # Unknown currencies map to an extra NaN slot
+        idx = np.array([self.index.get(c, len(col)) for c in currencies], dtype=np.intp)
+        factors = np.append(col, np.nan)[idx]
+        return amounts * factors
+
+
+class FXService:
+    """
+    Cached rate matrix with history.
+    - All missing/expired currencies are fetched in a single batch.
+    - Failed fetches keep the previous rate (or FALLBACK_USD_RATES). A currency
+      that failed is negatively cached with exponential backoff (backoff_base *
+      2^n, capped) like QuoteCache, so a dead pair is not refetched every call.
+    - Every successful fetch is appended to `history`.
+    - Concurrent misses for the same currency share one fetch (SingleFlight).
+    - Rates expire after `ttl`, or per `policy.expires(ccy, fetched_at)`.
+    """
+
+    def __init__(self, fetcher: Callable[[List[str]], Dict[str, float]] = fetch_usd_rates,
+                 ttl: float = 3600, history_size: int = 1000, policy=None,
+                 backoff_base: float = 60, backoff_max: float = 3600):
+        self._fetcher = fetcher
+        self.ttl = ttl
+        self.policy = policy
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._rates: Dict[str, Tuple[float, float]] = {} # ccy -> (per USD, fresh_until)
+        self._failures: Dict[str, list] = {} # ccy -> [count, retry_at]
+        self.history: deque = deque(maxlen=history_size) # (timestamp, {ccy: per USD})
+        self._lock = threading.Lock()
+        self._flight = SingleFlight("fx")
+
+    def _fetch_and_store(self, currencies: List[str]) -> Dict[str, float]:
+        now = time.time()
+        with self._lock:
+            # Refreshed (or failed) by a fetch that finished while this caller was queueing
+            currencies = [c for c in currencies if self._due(c, now)]
+        if not currencies:
+            return {}
+        start = time.perf_counter()
+        try:
+            fetched = self._fetcher(currencies)
+            outcome = "ok" if fetched else "empty"
+        except Exception as e:
+            logger.warning("FX fetch failed for %s: %s", currencies, e)
+            fetched = {}
+            outcome = "error"
+        PROVIDER_LATENCY.observe(time.perf_counter() - start, provider="fx", outcome=outcome)
+        PROVIDER_REQUESTS.inc(provider="fx", outcome=outcome)
+        now = time.time()
+        with self._lock:
+            for c in currencies:
+                r = fetched.get(c)
+                if r and r > 0:
+                    self._rates[c] = (r, self.policy.expires(c, now) if self.policy else now + self.ttl)
+                    self._failures.pop(c, None)
+                else:
+                    count = self._failures.get(c, [0, 0.0])[0] + 1
+                    delay = min(self.backoff_base * 2 ** (count - 1), self.backoff_max)
+                    self._failures[c] = [count, now + delay]
+            if fetched:
+                self.history.append((now, {c: r for c, r in fetched.items() if r and r > 0}))
+        return fetched
+
+    def _due(self, ccy: str, now: float) -> bool:
+        """Expired or never fetched, and not backing off after a failure. Caller holds the lock."""
+        if ccy in self._rates and now < self._rates[ccy][1]:
+            return False
+        fail = self._failures.get(ccy)
+        return not (fail and now < fail[1])
+
+    def get_matrix(self, currencies: Iterable[str]) -> FXMatrix:
+        """
+        Matrix over `currencies` (include the base currency). Expired or failed
+        currencies keep their last-known rate; one that never resolved is left
+        out, and FXMatrix.rate / convert give NaN for it.
+        """
+        wanted = set(currencies) | {PIVOT}
+        now = time.time()
+        with self._lock:
+            stale = sorted(c for c in wanted if c != PIVOT and self._due(c, now))
+            backing_off = sum(1 for c in wanted if c in self._failures and c not in stale)
+
+        CACHE_REQUESTS.inc(len(wanted) - 1 - len(stale) - backing_off, cache="fx", result="hit")
+        if backing_off:
+            CACHE_REQUESTS.inc(backing_off, cache="fx", result="negative")
+        if stale:
+            CACHE_REQUESTS.inc(len(stale), cache="fx", result="miss")
+            # Concurrent callers missing the same currency wait for one fetch
+            self._flight.do(stale, self._fetch_and_store)
+
+        usd_rates = {PIVOT: 1.0}
+        with self._lock:
+            for c in wanted:
+                if c in self._rates:
+                    usd_rates[c] = self._rates[c][0]
+                elif c in FALLBACK_USD_RATES:
+                    usd_rates[c] = FALLBACK_USD_RATES[c]
+        return FXMatrix(usd_rates)
+
+    def history_for(self, from_ccy: str, to_ccy: str) -> Tuple[np.ndarray, np.ndarray]:
+        """(timestamps, rates) for a pair, from snapshots that include both legs."""
+        ts, vals = [], []
+        last = {PIVOT: 1.0}
+        with self._lock:
+            for t, snap in self.history:
+                last.update(snap)
+                if from_ccy in last and to_ccy in last:
+                    ts.append(t)
+                    vals.append(last[to_ccy] / last[from_ccy])
+        return np.array(ts), np.array(vals)
+
+    def invalidate(self):
+        with self._lock:
+            self._rates = {c: (r, 0.0) for c, (r, _) in self._rates.items()}
+
+
+fx_service = FXService(policy=FX_POLICY)
@@ -0,0 +1,165 @@
+import logging
+import math
+import os
+import random
+import time
+import zlib
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+import requests
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session, select
+
+from ..database import engine
+from ..models import PriceHistory
+from . import providers
+
+logger = logging.getLogger(__name__)
+
+# Daily closes are kept locally so risk numbers never need a multi-year download per rerun.
+DEFAULT_LOOKBACK_DAYS = 760 # ~3 years of trading days for a 252-day window plus slack
+RETRY_AFTER = 3600.0        # Seconds before re-trying symbols whose update failed
+_last_attempt: Dict[str, float] = {}
+
+
+def fx_symbol(from_ccy: str, to_ccy: str) -> str:
+    """Yahoo FX pair symbol, e.g. USDILS=X (units of `to_ccy` per 1 `from_ccy`)."""
+    return f"{from_ccy}{to_ccy}=X"
+
+
+def last_business_day(today: Optional[date] = None) -> date:
+    day = (today or date.today()) - timedelta(days=1)
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return day
+
+
+def synthetic_history(symbol: str, start: date, end: date) -> List[Tuple[date, float]]:
+    """Deterministic random walk per symbol (offline runs, tests, benchmarks)."""
+    seed = zlib.crc32(symbol.encode())
+    rng = random.Random(seed)
+    vol = 0.005 + (seed % 30) / 1000.0 # 0.5% - 3.4% daily
+    price = 1.0 + (seed % 100000) / 100.0
+    day = date(2015, 1, 1)
+    rows = []
+    while day <= end:
+        if day.weekday() < 5:
+            price *= math.exp(rng.gauss(0.0002, vol))
+            if day >= start:
+                rows.append((day, price))
+        day += timedelta(days=1)
+    return rows
+
+
+def _fetch_chart(symbols: List[str], start: date) -> Dict[str, List[Tuple[date, float]]]:
+    period1 = int(datetime(start.year, start.month, start.day, tzinfo=timezone.utc).timestamp())
+    out = {}
+    with requests.Session() as session:
+        for sym in symbols:
+            try:
+                response = session.get(f"{providers.YAHOO_BASE_URL}/v8/finance/chart/{sym}",
+                                       params={"period1": period1, "period2": int(time.time()), "interval": "1d"},
+                                       timeout=10)
+            except requests.RequestException as e:
+                logger.warning("History fetch failed for %s: %s", sym, e)
+                continue
+            if response.status_code == 200:
+                series = providers.parse_yahoo_chart_series(response.json())
+                out[sym] = [(datetime.fromtimestamp(ts, timezone.utc).date(), c) for ts, c in series]
+    return out
+
+
+def _fetch_yfinance(symbols: List[str], start: date) -> Dict[str, List[Tuple[date, float]]]:
+    import yfinance as yf
+
+    data = yf.download(symbols, start=start.isoformat(), interval="1d", group_by="ticker", progress=False, threads=True)
+    out = {}
+    if data.empty:
+        return out
+    for sym in symbols:
+        try:
+            if isinstance(data.columns, pd.MultiIndex):
+                series = data[sym]['Close'].dropna()
+            else:
+                series = data['Close'].dropna()
+        except KeyError:
+            continue
+        out[sym] = [(ts.date(), float(v)) for ts, v in series.items()]
+    return out
+
+
+def fetch_daily_closes(symbols: List[str], start: date, end: Optional[date] = None) -> Dict[str, List[Tuple[date, float]]]:
+    """Daily closes from `start` for each symbol (same source selection as the price router)."""
+    if not symbols:
+        return {}
+    if os.environ.get("PORTFOLIO_OFFLINE") == "1":
+        end = end or last_business_day()
+        return {s: synthetic_history(s, start, end) for s in symbols}
+    if providers.YAHOO_BASE_URL:
+        return _fetch_chart(symbols, start)
+    return _fetch_yfinance(symbols, start)
+
+
+def update_history(symbols: Iterable[str], lookback_days: int = DEFAULT_LOOKBACK_DAYS, today: Optional[date] = None) -> int:
+    """
+    Incrementally extend stored history: only days after each symbol's last
+    stored close are fetched (one batch per distinct start date). Returns rows added.
+    """
+    symbols = sorted(set(symbols))
+    target = last_business_day(today)
+    with Session(engine) as session:
+        rows = session.exec(
+            select(PriceHistory.symbol, func.max(PriceHistory.day))
+            .where(PriceHistory.symbol.in_(symbols)).group_by(PriceHistory.symbol)
+        ).all()
+    last = dict(rows)
+
+    now = time.time()
+    by_start: Dict[date, List[str]] = {}
+    for sym in symbols:
+        if now - _last_attempt.get(sym, 0.0) < RETRY_AFTER:
+            continue
+        start = last[sym] + timedelta(days=1) if sym in last else target - timedelta(days=lookback_days)
+        if start <= target:
+            by_start.setdefault(start, []).append(sym)
+
+    added = 0
+    for start, group in by_start.items():
+        try:
+            fetched = fetch_daily_closes(group, start, target)
+        except Exception:
+            logger.exception("History update failed for %s", group)
+            fetched = {}
+        for sym in group:
+            if not fetched.get(sym):
+                _last_attempt[sym] = now
+        values = [{"symbol": sym, "day": d, "close": c}
+                  for sym, series in fetched.items() for d, c in series if d >= start and c > 0]
+        if values:
+            with Session(engine) as session:
+                # Chunked to stay under SQLite's bound-parameter limit
+                for i in range(0, len(values), 300):
+                    stmt = sqlite_insert(PriceHistory).values(values[i:i + 300]).on_conflict_do_nothing()
+                    session.connection().execute(stmt)
+                session.commit()
+            added += len(values)
+    return added
+
+
+def load_history(symbols: Iterable[str], days: int = DEFAULT_LOOKBACK_DAYS, today: Optional[date] = None,
+                 since: Optional[date] = None) -> pd.DataFrame:
+    """Closes as a (day x symbol) frame over the last `days` calendar days (or from `since`)."""
+    symbols = sorted(set(symbols))
+    since = since or (today or date.today()) - timedelta(days=days)
+    with Session(engine) as session:
+        rows = session.exec(
+            select(PriceHistory.day, PriceHistory.symbol, PriceHistory.close)
+            .where(PriceHistory.symbol.in_(symbols), PriceHistory.day >= since)
+        ).all()
+    if not rows:
+        return pd.DataFrame(columns=symbols)
+    df = pd.DataFrame(rows, columns=["day", "symbol", "close"])
+    return df.pivot_table(index="day", columns="symbol", values="close").sort_index()
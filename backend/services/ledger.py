@@ -0,0 +1,273 @@
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import String, and_, delete, func, or_, type_coerce
+from sqlmodel import Session, select
+
+from ..models import Asset, PositionSnapshot, Transaction
+
+BUY = "Buy"
+SELL = "Sell"
+DEPOSIT = "Deposit"
+WITHDRAWAL = "Withdrawal"
+DIVIDEND = "Dividend"
+INTEREST = "Interest"
+FEE = "Fee"
+ADJUSTMENT = "Adjustment"
+KINDS = [BUY, SELL, DEPOSIT, WITHDRAWAL, DIVIDEND, INTEREST, FEE, ADJUSTMENT]
+
+# A snapshot is written once this many transactions follow the previous one,
+# so rebuilding any asset at any date replays at most this many rows.
+SNAPSHOT_EVERY = 32
+
+
+class Holding:
+    """
+    One asset's ledger state (average-cost method).
+    - quantity / cost_basis: what Asset.quantity / Asset.cost_basis are materialized from
+    - realized: gains booked by sells; income: dividends and interest net of fees
+    - as_of / txn_id: last transaction applied; replayed: rows applied since the snapshot
+    """
+    __slots__ = ("quantity", "cost_basis", "realized", "income", "as_of", "txn_id", "replayed")
+
+    def __init__(self, quantity: float = 0.0, cost_basis: float = 0.0, realized: float = 0.0,
+                 income: float = 0.0, as_of: Optional[datetime] = None, txn_id: int = 0):
+        self.quantity = quantity
+        self.cost_basis = cost_basis
+        self.realized = realized
+        self.income = income
+        self.as_of = as_of
+        self.txn_id = txn_id
+        self.replayed = 0
+
+    @classmethod
+    def from_snapshot(cls, snap: PositionSnapshot) -> "Holding":
+        return cls(snap.quantity, snap.cost_basis, snap.realized, snap.income, snap.as_of, snap.txn_id)
+
+    def apply(self, kind: str, quantity: float, amount: float):
+        if kind == BUY:
+            self.quantity += quantity
+            self.cost_basis += amount
+        elif kind in (SELL, WITHDRAWAL):
+            # Cash withdrawals are sells of units worth 1
+            units = quantity if kind == SELL else amount
+            removed = self.cost_basis * min(units / self.quantity, 1.0) if self.quantity > 0 else 0.0
+            self.quantity -= units
+            self.cost_basis -= removed
+            if kind == SELL:
+                self.realized += amount - removed
+        elif kind == DEPOSIT:
+            self.quantity += amount
+            self.cost_basis += amount
+        elif kind in (DIVIDEND, INTEREST):
+            self.income += amount
+        elif kind == FEE:
+            self.income -= amount
+        elif kind == ADJUSTMENT:
+            self.quantity += quantity
+            self.cost_basis += amount
+        self.replayed += 1
+
+    @property
+    def cost_per_unit(self) -> float:
+        return self.cost_basis / self.quantity if self.quantity else 0.0
+
+    def __repr__(self):
+        return (f"Holding(quantity={self.quantity}, cost_basis={self.cost_basis}, "
+                f"realized={self.realized}, income={self.income}, as_of={self.as_of})")
+
+
+def positions_at(session: Session, asset_ids: Iterable[int], as_of: Optional[datetime] = None,
+                 use_snapshots: bool = True) -> Dict[int, Holding]:
+    """
+    Ledger state per asset after every transaction dated <= `as_of` (None = all).
+    Starts from each asset's latest snapshot at or before `as_of` and replays
+    only the rows after it, in two queries regardless of the number of assets.
+    """
+    asset_ids = list(asset_ids)
+    holdings: Dict[int, Holding] = {}
+    if not asset_ids:
+        return holdings
+
+    # 1. Latest usable snapshot per asset (snapshot ids grow with as_of, see _write_snapshots)
+    snap = None
+    if use_snapshots:
+        latest = select(func.max(PositionSnapshot.id)).where(PositionSnapshot.asset_id.in_(asset_ids))
+        if as_of is not None:
+            latest = latest.where(PositionSnapshot.as_of <= as_of)
+        snap = select(PositionSnapshot).where(PositionSnapshot.id.in_(latest.group_by(PositionSnapshot.asset_id))).subquery()
+        for row in session.exec(select(PositionSnapshot).where(PositionSnapshot.id.in_(select(snap.c.id)))).all():
+            holdings[row.asset_id] = Holding.from_snapshot(row)
+
+    # 2. Transactions after each snapshot, in ledger order (trade_date, id).
+    #    Snapshotted assets are joined from the snapshot side so each one is an
+    #    index range seek on (asset_id, trade_date) instead of a full history scan.
+    # trade_date is read raw and only parsed for each asset's last row
+    columns = (Transaction.asset_id, type_coerce(Transaction.trade_date, String), Transaction.id,
+               Transaction.kind, Transaction.quantity, Transaction.amount)
+    order = (Transaction.asset_id, Transaction.trade_date, Transaction.id)
+    statements = []
+    unsnapped = [a for a in asset_ids if a not in holdings]
+    if unsnapped:
+        statements.append(select(*columns).where(Transaction.asset_id.in_(unsnapped)))
+    if holdings:
+        statements.append(
+            select(*columns).select_from(snap)
+            .join(Transaction, and_(Transaction.asset_id == snap.c.asset_id, Transaction.trade_date >= snap.c.as_of))
+            .where(or_(Transaction.trade_date > snap.c.as_of, Transaction.id > snap.c.txn_id))
+        )
+    if as_of is not None:
+        statements = [stmt.where(Transaction.trade_date <= as_of) for stmt in statements]
+
+    for stmt in statements:
+        for asset_id, trade_date, txn_id, kind, quantity, amount in session.exec(stmt.order_by(*order)):
+            holding = holdings.get(asset_id)
+            if holding is None:
+                holding = holdings[asset_id] = Holding()
+            holding.apply(kind, quantity, amount)
+            holding.as_of = trade_date
+            holding.txn_id = txn_id
+    for holding in holdings.values():
+        if isinstance(holding.as_of, str):
+            holding.as_of = datetime.fromisoformat(holding.as_of)
+    return holdings
+
+
+def _write_snapshots(session: Session, holdings: Dict[int, Holding]):
+    # Only ever written at an asset's latest transaction, so ids increase with as_of
+    for asset_id, h in holdings.items():
+        session.add(PositionSnapshot(asset_id=asset_id, as_of=h.as_of, txn_id=h.txn_id, quantity=h.quantity,
+                                     cost_basis=h.cost_basis, realized=h.realized, income=h.income))
+
+
+def materialize(session: Session, asset_ids: Iterable[int]) -> Dict[int, Holding]:
+    """
+    Write the ledger state onto Asset.quantity / cost_basis (and cost_per_unit) and
+    checkpoint assets whose replay tail reached SNAPSHOT_EVERY. Caller commits.
+    """
+    holdings = positions_at(session, asset_ids)
+    for asset_id, h in holdings.items():
+        asset = session.get(Asset, asset_id)
+        if asset is None:
+            continue
+        asset.quantity = h.quantity
+        asset.cost_basis = h.cost_basis
+        if h.cost_basis:
+            # Rows without ledger cost keep their hand-entered unit cost
+            asset.cost_per_unit = h.cost_per_unit
+        session.add(asset)
+    _write_snapshots(session, {a: h for a, h in holdings.items() if h.replayed >= SNAPSHOT_EVERY})
+    return holdings
+
+
+def record(session: Session, txn: Transaction, commit: bool = True) -> Holding:
+    """
+    Append a transaction and re-materialize its asset. A back-dated entry
+    drops the asset's snapshots after its date (the next one is written at the
+    tail; rebuild_snapshots restores the intermediate ones).
+    """
+    if txn.kind not in KINDS:
+        raise ValueError(f"Unknown transaction kind: {txn.kind}")
+    session.add(txn)
+    session.flush()
+    session.exec(delete(PositionSnapshot).where(PositionSnapshot.asset_id == txn.asset_id,
+                                                PositionSnapshot.as_of > txn.trade_date))
+    holding = materialize(session, [txn.asset_id])[txn.asset_id]
+    if commit:
+        session.commit()
+    return holding
+
+
+def reconcile(session: Session, asset: Asset, quantity: float, cost_basis: float,
+              notes: str = "Manual edit", commit: bool = True) -> Optional[Holding]:
+    """Record an Adjustment that moves a materialized asset to the given quantity / cost basis."""
+    open_positions(session, [asset])
+    d_qty = quantity - (asset.quantity or 0.0)
+    d_cost = cost_basis - (asset.cost_basis or 0.0)
+    if abs(d_qty) < 1e-12 and abs(d_cost) < 1e-9:
+        return None
+    return record(session, Transaction(user_id=asset.user_id, asset_id=asset.id, kind=ADJUSTMENT,
+                                       quantity=d_qty, amount=d_cost, notes=notes), commit=commit)
+
+
+def edit(session: Session, asset: Asset, quantity: float, cost_per_unit: Optional[float] = None,
+         notes: str = "Manual edit", commit: bool = True) -> Optional[Holding]:
+    """
+    Adjustment for an asset form edit. A changed unit cost re-costs the whole
+    quantity (cost_basis = quantity * cost_per_unit); otherwise the total cost
+    basis is kept and only the quantity moves.
+    """
+    open_positions(session, [asset])
+    cost_basis = asset.cost_basis or 0.0
+    if cost_per_unit is not None and abs(cost_per_unit - (asset.cost_per_unit or 0.0)) > 1e-9:
+        cost_basis = quantity * cost_per_unit
+    holding = reconcile(session, asset, quantity, cost_basis, notes=notes, commit=commit)
+    if cost_per_unit is not None and not asset.cost_basis:
+        # No ledger cost to derive it from (zero quantity or cost): keep what was entered
+        asset.cost_per_unit = cost_per_unit
+        session.add(asset)
+        if commit:
+            session.commit()
+    return holding
+
+
+def open_positions(session: Session, assets: Iterable[Asset]) -> int:
+    """
+    Opening Adjustment (dated date_acquired) for assets with no transactions yet,
+    so pre-ledger rows keep their current quantity and cost. Returns rows added.
+    """
+    assets = list(assets)
+    with_ledger = set(session.exec(select(Transaction.asset_id).distinct()
+                                   .where(Transaction.asset_id.in_([a.id for a in assets]))).all())
+    opened = []
+    for asset in assets:
+        if asset.id in with_ledger:
+            continue
+        session.add(Transaction(user_id=asset.user_id, asset_id=asset.id, kind=ADJUSTMENT,
+                                trade_date=asset.date_acquired or datetime.utcnow(),
+                                quantity=asset.quantity or 0.0, amount=asset.cost_basis or 0.0,
+                                notes="Opening balance"))
+        opened.append(asset.id)
+    if opened:
+        session.flush()
+        materialize(session, opened)
+        session.commit()
+    return len(opened)
+
+
+def rebuild_snapshots(session: Session, asset_ids: Optional[Iterable[int]] = None) -> int:
+    """
+    Full replay writing a snapshot every SNAPSHOT_EVERY transactions per asset
+    (after bulk imports or to repair dropped checkpoints). Returns snapshots written.
+    """
+    query = select(Transaction.asset_id, Transaction.trade_date, Transaction.id,
+                   Transaction.kind, Transaction.quantity, Transaction.amount)
+    purge = delete(PositionSnapshot)
+    if asset_ids is not None:
+        asset_ids = list(asset_ids)
+        query = query.where(Transaction.asset_id.in_(asset_ids))
+        purge = purge.where(PositionSnapshot.asset_id.in_(asset_ids))
+    session.exec(purge)
+
+    rows: List[dict] = []
+    holding, current = None, None
+    for asset_id, trade_date, txn_id, kind, quantity, amount in session.exec(
+            query.order_by(Transaction.asset_id, Transaction.trade_date, Transaction.id)):
+        if asset_id != current:
+            holding, current = Holding(), asset_id
+        holding.apply(kind, quantity, amount)
+        if holding.replayed >= SNAPSHOT_EVERY:
+            rows.append({"asset_id": asset_id, "as_of": trade_date, "txn_id": txn_id, "quantity": holding.quantity,
+                         "cost_basis": holding.cost_basis, "realized": holding.realized, "income": holding.income})
+            holding.replayed = 0
+    if rows:
+        # Core bulk insert, in ledger order so ids keep increasing with as_of
+        session.connection().execute(PositionSnapshot.__table__.insert(), rows)
+    session.commit()
+    return len(rows)
+
+
+def forget_asset(session: Session, asset_id: int):
+    """Drop an asset's ledger and snapshots (on asset delete). Caller commits."""
+    session.exec(delete(PositionSnapshot).where(PositionSnapshot.asset_id == asset_id))
+    session.exec(delete(Transaction).where(Transaction.asset_id == asset_id))
@@ -0,0 +1,171 @@
+import re
+from datetime import date, datetime, time as dtime, timedelta
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+# How long a quote fetched while its market trades stays fresh
+LIVE_TTL = {"tase": 300, "nyse": 300, "crypto": 120, "fx": 900}
+# A quote fetched in the first minutes after the close may not be the official close yet
+SETTLE = 15 * 60
+# Upper bound on any expiry, so unmodelled holidays or late corrections are still picked up
+MAX_CLOSED_TTL = 12 * 3600
+
+MON, TUE, WED, THU, FRI, SAT, SUN = range(7)
+
+
+class Market:
+    """
+    Weekly trading sessions in the exchange's local time.
+    `sessions` maps weekday -> (open, close); days not listed are closed, as
+    are `holidays`. A quote is fresh for `live_ttl` while the market trades;
+    after the close it stays fresh until the next open (after one settle
+    refetch for the official close), capped at MAX_CLOSED_TTL.
+    """
+
+    def __init__(self, name: str, tz: str, sessions: Dict[int, Tuple[dtime, dtime]], live_ttl: float,
+                 holidays: Iterable[date] = ()):
+        self.name = name
+        self.tz = ZoneInfo(tz)
+        self.sessions = sessions
+        self.live_ttl = live_ttl
+        self.holidays: FrozenSet[date] = frozenset(holidays)
+
+    def _session(self, day: date) -> Optional[Tuple[datetime, datetime]]:
+        hours = self.sessions.get(day.weekday())
+        if hours is None or day in self.holidays:
+            return None
+        open_, close = hours
+        end = datetime.combine(day, close, self.tz) if close != dtime(0) else datetime.combine(day + timedelta(days=1), close, self.tz)
+        return datetime.combine(day, open_, self.tz), end
+
+    def state(self, ts: float) -> Tuple[bool, float]:
+        """(is open, epoch of the next open/close transition) at `ts`."""
+        local = datetime.fromtimestamp(ts, self.tz)
+        for offset in range(-1, 15):
+            session = self._session(local.date() + timedelta(days=offset))
+            if session is None:
+                continue
+            start, end = session
+            if local < start:
+                return False, start.timestamp()
+            if local < end:
+                return True, end.timestamp()
+        return False, ts + MAX_CLOSED_TTL
+
+    def is_open(self, ts: float) -> bool:
+        return self.state(ts)[0]
+
+    def expires(self, key: str, fetched_at: float) -> float:
+        is_open, transition = self.state(fetched_at)
+        if is_open:
+            # Never carry a mid-session price across the close
+            return min(fetched_at + self.live_ttl, transition + SETTLE)
+        last_close = self._last_close(fetched_at)
+        if last_close is not None and fetched_at < last_close + SETTLE:
+            return last_close + SETTLE
+        return min(transition, fetched_at + MAX_CLOSED_TTL)
+
+    def _last_close(self, ts: float) -> Optional[float]:
+        local = datetime.fromtimestamp(ts, self.tz)
+        for offset in range(0, -8, -1):
+            session = self._session(local.date() + timedelta(days=offset))
+            if session and session[1] <= local:
+                return session[1].timestamp()
+        return None
+
+
+class AlwaysOpen:
+    """24/7 markets (crypto): a fixed short TTL."""
+
+    def __init__(self, name: str, live_ttl: float):
+        self.name = name
+        self.live_ttl = live_ttl
+
+    def is_open(self, ts: float) -> bool:
+        return True
+
+    def expires(self, key: str, fetched_at: float) -> float:
+        return fetched_at + self.live_ttl
+
+
+class DailyPublication:
+    """
+    Prices published once per business day (mutual fund NAVs): fresh until
+    the next publication (or the safety cap), however often the dashboard
+    reruns. `at` should be late enough that the day's NAV is reliably out.
+    """
+
+    def __init__(self, name: str, tz: str, at: dtime, weekdays: Iterable[int]):
+        self.name = name
+        self.tz = ZoneInfo(tz)
+        self.at = at
+        self.weekdays = frozenset(weekdays)
+
+    def is_open(self, ts: float) -> bool:
+        return False
+
+    def next_publication(self, ts: float) -> float:
+        local = datetime.fromtimestamp(ts, self.tz)
+        for offset in range(0, 8):
+            day = local.date() + timedelta(days=offset)
+            at = datetime.combine(day, self.at, self.tz)
+            if day.weekday() in self.weekdays and at > local:
+                return at.timestamp()
+        return ts + MAX_CLOSED_TTL
+
+    def expires(self, key: str, fetched_at: float) -> float:
+        return min(self.next_publication(fetched_at), fetched_at + MAX_CLOSED_TTL)
+
+
+# --- Calendars (regular hours; exchange holidays can be passed as `holidays`) ---
+# TASE trades Monday-Friday since January 2026, with a short Friday session
+TASE = Market("tase", "Asia/Jerusalem", {
+    **{d: (dtime(9, 59), dtime(17, 25)) for d in (MON, TUE, WED, THU)},
+    FRI: (dtime(9, 59), dtime(13, 50)),
+}, LIVE_TTL["tase"])
+NYSE = Market("nyse", "America/New_York", {d: (dtime(9, 30), dtime(16, 0)) for d in (MON, TUE, WED, THU, FRI)},
+              LIVE_TTL["nyse"])
+# Spot FX: Sunday 17:00 to Friday 17:00 New York time
+FX = Market("fx", "America/New_York", {
+    SUN: (dtime(17, 0), dtime(0)),
+    **{d: (dtime(0), dtime(0)) for d in (MON, TUE, WED, THU)},
+    FRI: (dtime(0), dtime(17, 0)),
+}, LIVE_TTL["fx"])
+CRYPTO = AlwaysOpen("crypto", LIVE_TTL["crypto"])
+# Israeli mutual funds publish one NAV per business day in the evening
+FUND_NAV = DailyPublication("fund_nav", "Asia/Jerusalem", dtime(22, 0), (MON, TUE, WED, THU, FRI))
+
+
+class FreshnessPolicy:
+    """
+    Picks a market per cache key (first matching regex wins, like the
+    provider ROUTES) and asks it when a quote fetched at `fetched_at` expires.
+    """
+
+    def __init__(self, routes: List[Tuple[str, object]], default):
+        self.routes = [(re.compile(pattern), market) for pattern, market in routes]
+        self.default = default
+
+    def market_for(self, key: str):
+        for pattern, market in self.routes:
+            if pattern.match(key):
+                return market
+        return self.default
+
+    def expires(self, key: str, fetched_at: float) -> float:
+        return self.market_for(key).expires(key, fetched_at)
+
+
+QUOTE_POLICY = FreshnessPolicy([
+    (r'^5\d{6}$', FUND_NAV),       # TASE mutual funds (5xxxxxx)
+    (r'^\d+(\.TA)?$', TASE),       # Other TASE securities
+    (r'^[A-Z0-9]+-[A-Z]{3}$', CRYPTO),
+    (r'^[A-Z]{6}=X$', FX),
+], NYSE)
+# FXService keys are currency codes
+FX_POLICY = FreshnessPolicy([], FX)
+
+
+def open_markets(ts: float) -> List[str]:
+    """Names of the markets trading at `ts` (for status displays)."""
+    return [m.name.upper() for m in (TASE, NYSE, FX, CRYPTO) if m.is_open(ts)]
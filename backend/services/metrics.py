@@ -0,0 +1,174 @@
+import bisect
+import functools
+import os
+import threading
+import time
+from typing import Dict, Sequence, Tuple
+
+# PORTFOLIO_METRICS=0 turns every timer/counter into a no-op. Decorators then
+# return the undecorated function, so disabled metrics cost nothing at all.
+ENABLED = os.environ.get("PORTFOLIO_METRICS", "1") != "0"
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _label_str(names: Sequence[str], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{str(v).replace(chr(34), chr(39))}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        if not ENABLED:
+            return
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            for key, v in sorted(self._values.items()):
+                yield f"{self.name}{_label_str(self.labels, key)} {v}"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple[str, ...], list] = {} # key -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        if not ENABLED:
+            return
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            if i < len(self.buckets):
+                row[i] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def time(self, **labels) -> "_Timer":
+        return _Timer(self, labels) if ENABLED else _NOOP_TIMER
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            for key, row in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, row):
+                    cumulative += count
+                    yield f"{self.name}_bucket{_label_str(self.labels + ('le',), key + (repr(bound),))} {cumulative}"
+                yield f"{self.name}_bucket{_label_str(self.labels + ('le',), key + ('+Inf',))} {row[-1]}"
+                yield f"{self.name}_sum{_label_str(self.labels, key)} {row[-2]}"
+                yield f"{self.name}_count{_label_str(self.labels, key)} {row[-1]}"
+
+
+class _Timer:
+    __slots__ = ("hist", "labels", "start")
+
+    def __init__(self, hist: Histogram, labels: dict):
+        self.hist = hist
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.hist.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class _NoopTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_TIMER = _NoopTimer()
+
+
+# --- Registry ---
+REGISTRY: Dict[str, object] = {}
+
+def counter(name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+    return REGISTRY.setdefault(name, Counter(name, help, labels))
+
+def histogram(name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.setdefault(name, Histogram(name, help, labels, buckets))
+
+def timed(hist: Histogram, **labels):
+    """Decorator recording each call's duration in `hist`."""
+    def decorator(func):
+        if not ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                hist.observe(time.perf_counter() - start, **labels)
+        return wrapper
+    return decorator
+
+def render_prometheus() -> str:
+    """All registered metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY.values():
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- Hot-path metrics ---
+PROVIDER_LATENCY = histogram("portfolio_provider_request_seconds", "Price/FX provider request latency", ("provider", "outcome"))
+PROVIDER_REQUESTS = counter("portfolio_provider_requests_total", "Price/FX provider requests", ("provider", "outcome"))
+CACHE_REQUESTS = counter("portfolio_cache_requests_total", "Quote/FX cache lookups per key", ("cache", "result"))
+VALUATION_SECONDS = histogram("portfolio_process_portfolio_seconds", "process_portfolio wall time")
+TAX_SECONDS = histogram("portfolio_tax_calculation_seconds", "Tax calculation time per call", ("function",),
+                        buckets=(0.00001, 0.0001, 0.001, 0.01, 0.1))
+DB_QUERY_SECONDS = histogram("portfolio_db_query_seconds", "Database statement latency", ("statement",))
+
+
+def instrument_engine(engine):
+    """Time every SQL statement on a SQLAlchemy engine."""
+    if not ENABLED:
+        return
+    from sqlalchemy import event
+
+    # The start time lives on the per-statement context, so a statement that
+    # raises (no after_cursor_execute) leaves nothing behind on the connection.
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._query_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "_query_start", None)
+        if start is None:
+            return
+        verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        DB_QUERY_SECONDS.observe(time.perf_counter() - start, statement=verb)
@@ -0,0 +1,284 @@
+from datetime import date, datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func
+from sqlmodel import Session, select
+
+from ..models import PriceHistory, Transaction
+from . import ledger
+from .history import fx_symbol, load_history
+from .risk import history_symbol
+from .valuation import asset_symbol
+
+TOTAL = "Total"
+EXCLUDED_CATEGORIES = ("Future Needs",) # Liabilities have no return
+
+# Money into the position per unit of `amount`; Adjustment is a transfer at market value
+_FLOW_SIGN = {ledger.BUY: 1.0, ledger.SELL: -1.0, ledger.DEPOSIT: 1.0, ledger.WITHDRAWAL: -1.0,
+              ledger.DIVIDEND: -1.0, ledger.INTEREST: -1.0, ledger.FEE: 1.0}
+
+
+def _quantity_delta(kind: str, quantity: float, amount: float) -> float:
+    if kind in (ledger.BUY, ledger.ADJUSTMENT):
+        return quantity
+    if kind == ledger.SELL:
+        return -quantity
+    if kind == ledger.DEPOSIT:
+        return amount
+    if kind == ledger.WITHDRAWAL:
+        return -amount
+    return 0.0
+
+
+def xirr(cashflows: np.ndarray, years: np.ndarray, guess: float = 0.1, tol: float = 1e-9,
+         max_iter: int = 50) -> np.ndarray:
+    """
+    Annual money-weighted return for each row of `cashflows` (series x dates),
+    dated `years` after the first date. Newton steps run on all rows at once;
+    rows that do not converge fall back to a vectorized bisection.
+    Rows without both a negative and a positive flow give NaN.
+    """
+    cf = np.atleast_2d(np.asarray(cashflows, dtype=float))
+    t = np.asarray(years, dtype=float)
+    k = cf.shape[0]
+    result = np.full(k, np.nan)
+    valid = (cf < 0).any(axis=1) & (cf > 0).any(axis=1)
+    if not valid.any():
+        return result
+
+    # Only dates where some row has a flow matter
+    cols = cf[valid].any(axis=0)
+    cf, t = cf[valid][:, cols], t[cols]
+
+    rate = np.full(cf.shape[0], guess)
+    done = np.zeros(cf.shape[0], dtype=bool)
+    with np.errstate(over='ignore', invalid='ignore', divide='ignore'):
+        for _ in range(max_iter):
+            disc = np.power(1.0 + rate[:, None], -t[None, :])
+            value = (cf * disc).sum(axis=1)
+            slope = (-t[None, :] * cf * disc).sum(axis=1) / (1.0 + rate)
+            step = np.where(done, 0.0, value / slope)
+            rate = np.maximum(rate - step, -0.999999)
+            done |= np.abs(step) < tol
+            if done.all():
+                break
+
+        # Bisection for the rest, over a bracket with a sign change
+        todo = ~done | ~np.isfinite(rate)
+        if todo.any():
+            lo = np.full(todo.sum(), -0.99)
+            hi = np.full(todo.sum(), 100.0)
+            sub = cf[todo]
+            f = lambda r: (sub * np.power(1.0 + r[:, None], -t[None, :])).sum(axis=1)
+            f_lo = f(lo)
+            bracketed = np.sign(f_lo) != np.sign(f(hi))
+            for _ in range(200):
+                mid = (lo + hi) / 2
+                f_mid = f(mid)
+                left = np.sign(f_mid) == np.sign(f_lo)
+                lo, f_lo = np.where(left, mid, lo), np.where(left, f_mid, f_lo)
+                hi = np.where(left, hi, mid)
+            rate[todo] = np.where(bracketed, (lo + hi) / 2, np.nan)
+
+    result[valid] = rate
+    return result
+
+
+class PerformanceBook:
+    """
+    Daily values and external flows (days x series) in the base currency,
+    flows counted at the end of their day. Daily sub-period returns are
+    turned into a prefix sum of log growth once, so the TWR of any range is
+    one subtraction per series.
+    """
+
+    def __init__(self, days: Sequence[date], labels: List[str], values: np.ndarray, flows: np.ndarray):
+        self.days = np.array(days, dtype='datetime64[D]')
+        self.labels = list(labels)
+        self.asset_ids: List[int] = []    # Position series come first, in this order
+        self.categories: List[str] = []   # Then one series per category, then TOTAL
+        self.values = values
+        self.flows = flows
+        prev = values[:-1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            daily = np.where(prev > 0, (values[1:] - flows[1:]) / prev - 1.0, 0.0)
+        self.daily_returns = np.clip(np.nan_to_num(daily), -0.999999, None)
+        self._growth = np.vstack([np.zeros(len(self.labels)), np.cumsum(np.log1p(self.daily_returns), axis=0)])
+
+    def _index(self, day: Optional[date], default: int) -> int:
+        if day is None or len(self.days) == 0:
+            return default
+        # Last valuation day on or before `day`
+        return int(np.clip(np.searchsorted(self.days, np.datetime64(day, 'D'), side='right') - 1, 0, len(self.days) - 1))
+
+    def window(self, start: Optional[date] = None, end: Optional[date] = None) -> Tuple[int, int]:
+        return self._index(start, 0), self._index(end, len(self.days) - 1)
+
+    def twr(self, start: Optional[date] = None, end: Optional[date] = None) -> np.ndarray:
+        """Cumulative time-weighted return per series over [start, end]."""
+        s, e = self.window(start, end)
+        return np.expm1(self._growth[e] - self._growth[s])
+
+    def annualized_twr(self, start: Optional[date] = None, end: Optional[date] = None) -> np.ndarray:
+        s, e = self.window(start, end)
+        years = (self.days[e] - self.days[s]).astype(int) / 365.25
+        growth = self._growth[e] - self._growth[s]
+        return np.expm1(growth / years) if years >= 1 else np.expm1(growth)
+
+    def xirr(self, start: Optional[date] = None, end: Optional[date] = None) -> np.ndarray:
+        """
+        Money-weighted annual return per series: the start value is invested,
+        flows in the range are added or withdrawn, the end value is received.
+        """
+        s, e = self.window(start, end)
+        if e <= s:
+            return np.full(len(self.labels), np.nan)
+        cf = -self.flows[s:e + 1].T.copy()
+        cf[:, 0] = -self.values[s]
+        cf[:, -1] += self.values[e]
+        years = (self.days[s:e + 1] - self.days[s]).astype(int) / 365.0
+        return xirr(cf, years)
+
+    def frame(self, start: Optional[date] = None, end: Optional[date] = None) -> pd.DataFrame:
+        s, e = self.window(start, end)
+        return pd.DataFrame({
+            "Start Value": self.values[s], "End Value": self.values[e],
+            "Net Flows": self.flows[s + 1:e + 1].sum(axis=0),
+            "TWR": self.twr(start, end), "TWR (ann.)": self.annualized_twr(start, end),
+            "XIRR": self.xirr(start, end),
+        }, index=self.labels)
+
+
+def build_book(assets, transactions: Sequence[Tuple[int, datetime, str, float, float]], history: pd.DataFrame,
+               fx_rates: Dict[str, float], base_ccy: str = 'ILS',
+               current_prices: Optional[Dict[str, float]] = None) -> Optional[PerformanceBook]:
+    """
+    Book with one series per position, per category and the total.
+    - transactions: (asset_id, trade_date, kind, quantity, amount), any order
+    - history: daily closes (day x symbol) incl. FX pairs, e.g. USDILS=X
+    - fx_rates: current rate to the base currency; FX series are anchored to it,
+      and it is used as a constant where a series is missing
+    - current_prices: live quotes by symbol; each close series is rescaled so its
+      last close matches (history can be quoted in other units, e.g. Agorot)
+    Manual-price and cash positions are valued at a constant price; positions with
+    neither a price series nor a manual price are left out.
+    """
+    if history.empty:
+        return None
+    history = history.sort_index().ffill()
+    days = list(history.index)
+    n_days = len(days)
+    day_index = np.array(days, dtype='datetime64[D]')
+
+    # 1. Local prices and FX per position (days x positions)
+    kept, price_cols, fx_cols = [], [], []
+    for a in assets:
+        if a.category in EXCLUDED_CATEGORIES:
+            continue
+        sym = history_symbol(asset_symbol(a), a.type)
+        if a.manual_price is not None and a.manual_price > 0:
+            price = np.full(n_days, float(a.manual_price))
+        elif sym is None:
+            price = np.ones(n_days)
+        elif sym in history.columns:
+            price = history[sym].to_numpy(dtype=float)
+            live = (current_prices or {}).get(asset_symbol(a))
+            if live and np.isfinite(price[-1]) and price[-1] > 0:
+                price = price * (live / price[-1])
+        else:
+            continue
+        if a.currency == base_ccy:
+            fx = np.ones(n_days)
+        elif fx_symbol(a.currency, base_ccy) in history.columns:
+            fx = history[fx_symbol(a.currency, base_ccy)].to_numpy(dtype=float)
+            live = fx_rates.get(a.currency)
+            if live and np.isfinite(fx[-1]) and fx[-1] > 0:
+                fx = fx * (live / fx[-1])
+        elif a.currency in fx_rates:
+            fx = np.full(n_days, fx_rates[a.currency])
+        else:
+            continue
+        kept.append(a)
+        price_cols.append(price)
+        fx_cols.append(fx)
+    if not kept:
+        return None
+    local_prices = np.nan_to_num(np.column_stack(price_cols))
+    fx = np.nan_to_num(np.column_stack(fx_cols))
+    col = {a.id: i for i, a in enumerate(kept)}
+
+    # 2. Quantity changes and cash flows placed on valuation days.
+    #    Transactions before the first day only set the opening quantity.
+    dq = np.zeros((n_days, len(kept)))
+    cash = np.zeros((n_days, len(kept)))
+    moved = np.zeros((n_days, len(kept)))
+    opening = np.zeros(len(kept))
+    has_ledger = np.zeros(len(kept), dtype=bool)
+    for asset_id, trade_date, kind, quantity, amount in transactions:
+        j = col.get(asset_id)
+        if j is None:
+            continue
+        has_ledger[j] = True
+        delta = _quantity_delta(kind, quantity, amount)
+        i = int(np.searchsorted(day_index, np.datetime64(trade_date, 'D'), side='left'))
+        if i == 0 and np.datetime64(trade_date, 'D') < day_index[0]:
+            opening[j] += delta
+        elif i < n_days:
+            dq[i, j] += delta
+            if kind == ledger.ADJUSTMENT:
+                moved[i, j] += delta
+            else:
+                cash[i, j] += _FLOW_SIGN.get(kind, 0.0) * amount
+    # Assets without a ledger hold their current quantity throughout
+    opening[~has_ledger] = [a.quantity for a, h in zip(kept, has_ledger) if not h]
+
+    quantities = opening + np.cumsum(dq, axis=0)
+    values = quantities * local_prices * fx
+    flows = (cash + moved * local_prices) * fx
+
+    # 3. Group columns: positions, then categories, then the total
+    categories = sorted({a.category for a in kept})
+    groups = np.zeros((len(kept), len(kept) + len(categories) + 1))
+    groups[np.arange(len(kept)), np.arange(len(kept))] = 1.0
+    for j, a in enumerate(kept):
+        groups[j, len(kept) + categories.index(a.category)] = 1.0
+    groups[:, -1] = 1.0
+    labels = [f"{a.name} ({a.ticker})" for a in kept] + categories + [TOTAL]
+    book = PerformanceBook(days, labels, values @ groups, flows @ groups)
+    book.asset_ids = [a.id for a in kept]
+    book.categories = categories
+    return book
+
+
+class PerformanceService:
+    """Builds the book once per ledger / history state; range queries reuse it."""
+
+    def __init__(self):
+        self._key = None
+        self._book: Optional[PerformanceBook] = None
+
+    def book(self, session: Session, assets, fx_rates: Dict[str, float], base_ccy: str = 'ILS',
+             current_prices: Optional[Dict[str, float]] = None, days: int = 760) -> Optional[PerformanceBook]:
+        ids = [a.id for a in assets]
+        symbols = {history_symbol(asset_symbol(a), a.type) for a in assets} - {None}
+        symbols |= {fx_symbol(a.currency, base_ccy) for a in assets if a.currency != base_ccy}
+
+        # Cheap change detection: ledger and stored history high-water marks
+        stamp = session.exec(select(func.max(Transaction.id), func.count(Transaction.id))
+                             .where(Transaction.asset_id.in_(ids))).one()
+        last_day = session.exec(select(func.max(PriceHistory.day)).where(PriceHistory.symbol.in_(symbols))).one()
+        prices = tuple(sorted((current_prices or {}).items()))
+        key = (tuple(ids), tuple(stamp), last_day, days, base_ccy, tuple(sorted(fx_rates.items())), prices,
+               tuple((a.manual_price, a.category) for a in assets))
+        if key != self._key:
+            txns = session.exec(select(Transaction.asset_id, Transaction.trade_date, Transaction.kind,
+                                       Transaction.quantity, Transaction.amount)
+                                .where(Transaction.asset_id.in_(ids))).all()
+            self._book = build_book(assets, txns, load_history(symbols, days=days), fx_rates, base_ccy, current_prices)
+            self._key = key
+        return self._book
+
+
+performance_service = PerformanceService()
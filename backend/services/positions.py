@@ -0,0 +1,68 @@
+from typing import Dict, Optional, Tuple
+
+# Allocation weights are shared between positions with the same split
+# (most assets are 100% in one bucket), so each position only holds a reference.
+_WEIGHTS: Dict[Tuple[Tuple[str, float], ...], Tuple[Tuple[str, float], ...]] = {}
+
+
+def intern_weights(weights: Dict[str, float]) -> Tuple[Tuple[str, float], ...]:
+    key = tuple((b, w) for b, w in weights.items() if w)
+    return _WEIGHTS.setdefault(key, key)
+
+
+class Position:
+    """
+    One valued holding, as produced by process_portfolio and read by the UI,
+    streaming and SSE layers. Copies the few Asset fields those layers need,
+    so it does not keep the ORM object (or its session state) alive.
+    Duck-types as an asset for calculate_tax (category, type, tax_rate, date_acquired).
+    Monetary values are in settings.base_currency despite the `_ils` names.
+    """
+    __slots__ = (
+        "id", "name", "ticker", "symbol", "type", "category", "currency",
+        "quantity", "cost_per_unit", "manual_price", "tax_rate", "weights",
+        "due_date", "date_acquired", "price", "mkt_val_ils", "cost_basis_ils", "tax_ils",
+    )
+
+    def __init__(self, asset, symbol: str, weights: Tuple[Tuple[str, float], ...], price: float,
+                 mkt_val_ils: float, cost_basis_ils: float, tax_ils: float):
+        self.id: Optional[int] = getattr(asset, "id", None)
+        self.name: str = asset.name
+        self.ticker: str = asset.ticker
+        self.symbol = symbol
+        self.type: str = asset.type
+        self.category: str = asset.category
+        self.currency: str = asset.currency
+        self.quantity: float = asset.quantity
+        self.cost_per_unit: float = getattr(asset, "cost_per_unit", 0.0)
+        self.manual_price: Optional[float] = asset.manual_price
+        self.tax_rate: Optional[float] = asset.tax_rate
+        self.weights = weights
+        self.due_date = getattr(asset, "due_date", None)
+        self.date_acquired = getattr(asset, "date_acquired", None)
+        self.price = price
+        self.mkt_val_ils = mkt_val_ils
+        self.cost_basis_ils = cost_basis_ils
+        self.tax_ils = tax_ils
+
+    @property
+    def net_after_tax(self) -> float:
+        return self.mkt_val_ils - self.tax_ils
+
+    @property
+    def has_manual_price(self) -> bool:
+        return self.manual_price is not None and self.manual_price > 0
+
+    @property
+    def group(self) -> str:
+        """Holdings table grouping (location category, else asset type)."""
+        return self.category or self.type
+
+    @property
+    def gain_pct(self) -> float:
+        if self.cost_basis_ils > 0:
+            return (self.mkt_val_ils - self.cost_basis_ils) / self.cost_basis_ils * 100
+        return 0.0
+
+    def __repr__(self):
+        return f"Position({self.symbol!r}, qty={self.quantity}, value={self.mkt_val_ils:,.2f})"
@@ -0,0 +1,184 @@
+import contextvars
+import functools
+import json
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+# Streamlit calls whose arguments are measured as payload (bytes sent to the browser)
+_PAYLOAD_CALLS = ("markdown", "caption", "write", "plotly_chart", "dataframe", "metric")
+
+# Profiler of the rerun executing in this context. Streamlit runs each session's
+# script on its own thread, so concurrent sessions never see each other's.
+_active: contextvars.ContextVar[Optional["RerunProfiler"]] = contextvars.ContextVar("rerun_profiler", default=None)
+_engines = set()
+
+
+def _payload_size(args, kwargs) -> int:
+    size = 0
+    for a in list(args) + list(kwargs.values()):
+        if isinstance(a, str):
+            size += len(a.encode())
+        elif hasattr(a, "to_json"): # Plotly figures, DataFrames
+            try:
+                size += len(a.to_json())
+            except Exception:
+                pass
+    return size
+
+
+def _wrap(func, skip_self: bool = False):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        prof = _active.get()
+        if prof is None or prof._in_call:
+            return func(*args, **kwargs)
+        # Only the outermost call counts (st.write renders through markdown, dataframe, ...)
+        prof._in_call = True
+        try:
+            prof.add_payload(_payload_size(args[1:] if skip_self else args, kwargs))
+            return func(*args, **kwargs)
+        finally:
+            prof._in_call = False
+    wrapper._profiled = True
+    return wrapper
+
+
+def install(st, engine):
+    """
+    Hook Streamlit output calls and SQL statements (idempotent).
+    Output is hooked on DeltaGenerator, so columns, containers and the sidebar
+    are measured too; module-level st.* are bound methods of the main
+    DeltaGenerator created at import, so those are hooked as well. The hooks
+    are process-wide but only record for the current context's RerunProfiler.
+    """
+    dg_class = st.delta_generator.DeltaGenerator
+    for name in _PAYLOAD_CALLS:
+        func = getattr(dg_class, name, None)
+        if func is not None and not getattr(func, "_profiled", False):
+            setattr(dg_class, name, _wrap(func, skip_self=True))
+        func = getattr(st, name, None)
+        if func is not None and not getattr(func, "_profiled", False):
+            setattr(st, name, _wrap(func))
+
+    if id(engine) not in _engines:
+        from sqlalchemy import event
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def _count(conn, cursor, statement, parameters, context, executemany):
+            prof = _active.get()
+            if prof is not None:
+                prof.add_query()
+        _engines.add(id(engine))
+
+
+class RerunProfiler:
+    """
+    Per-rerun section timer. `begin(name)` closes the previous section and
+    opens the next, so a linear script can be profiled without re-indenting.
+    Each section records wall time, SQL queries and payload bytes.
+    Becomes the context's active profiler on creation (replacing one left by
+    an aborted rerun) until `finish`, or `abort` on paths that stop the script.
+    """
+
+    def __init__(self):
+        self.sections: List[Dict] = []
+        self._current: Optional[Dict] = None
+        self._start = time.perf_counter()
+        self._in_call = False
+        _active.set(self)
+
+    def begin(self, name: str):
+        self.end()
+        self._current = {"section": name, "ms": 0.0, "queries": 0, "bytes": 0, "_t": time.perf_counter()}
+
+    def end(self):
+        if self._current is not None:
+            cur = self._current
+            cur["ms"] = (time.perf_counter() - cur.pop("_t")) * 1000
+            self.sections.append(cur)
+            self._current = None
+
+    def add_query(self):
+        if self._current is not None:
+            self._current["queries"] += 1
+
+    def add_payload(self, size: int):
+        if self._current is not None:
+            self._current["bytes"] += size
+
+    def abort(self):
+        """Stop recording without a result (the rerun is being cut short)."""
+        self._current = None
+        if _active.get() is self:
+            _active.set(None)
+
+    def finish(self) -> Dict:
+        self.end()
+        if _active.get() is self:
+            _active.set(None)
+        return {
+            "at": time.strftime("%H:%M:%S"),
+            "total_ms": (time.perf_counter() - self._start) * 1000,
+            "sections": self.sections,
+        }
+
+
+class NullProfiler:
+    """Drop-in when profiling is off."""
+
+    def __init__(self):
+        # Profiling may have been on for the previous rerun of this session
+        _active.set(None)
+
+    def begin(self, name: str):
+        pass
+
+    def end(self):
+        pass
+
+    def abort(self):
+        pass
+
+    def finish(self):
+        return None
+
+
+def record_run(history: deque, run: Dict, maxlen: int = 50) -> deque:
+    if history is None:
+        history = deque(maxlen=maxlen)
+    history.append(run)
+    return history
+
+
+def history_frame(history):
+    """Rows of (run, section, ms) for charting regressions across reruns."""
+    import pandas as pd
+
+    rows = []
+    for i, run in enumerate(history):
+        for s in run["sections"]:
+            rows.append({"run": i, "section": s["section"], "ms": s["ms"]})
+    if not rows:
+        return pd.DataFrame()
+    return pd.DataFrame(rows).pivot_table(index="run", columns="section", values="ms", aggfunc="sum")
+
+
+def render_panel(st, history):
+    """Developer panel: last rerun breakdown + rolling per-section history."""
+    import pandas as pd
+
+    if not history:
+        return
+    last = history[-1]
+    with st.expander(f"🛠 Rerun Profiler — {last['total_ms']:.0f} ms", expanded=False):
+        df = pd.DataFrame(last["sections"])
+        if len(history) > 1:
+            # Compare against the median of previous runs to flag regressions
+            prev = history_frame(list(history)[:-1]).median()
+            df["median_ms"] = df["section"].map(prev)
+            df["delta_ms"] = df["ms"] - df["median_ms"]
+        st.dataframe(df.round(1), use_container_width=True, hide_index=True)
+        st.caption(f"{len(history)} reruns kept. Payload = bytes passed to st.* output calls.")
+        st.line_chart(history_frame(history))
+        st.download_button("Download history (JSON)", json.dumps(list(history)), file_name="rerun_profile.json")
@@ -0,0 +1,539 @@
+import csv
+import logging
+import math
+import os
+import re
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+import requests
+import yfinance as yf
+from bs4 import BeautifulSoup
+
+from .metrics import PROVIDER_LATENCY, PROVIDER_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+# Shared pool for provider batches. Hedged requests need spare workers, so keep
+# this comfortably above the sum of per-provider concurrency limits.
+_POOL = ThreadPoolExecutor(max_workers=16, thread_name_prefix="price-provider")
+
+# Upstream hosts. Point both at scripts/market_server.py to record/replay
+# market data offline; YAHOO_BASE_URL also turns off the yfinance fallbacks,
+# leaving only the plain spark/chart endpoints (which the stand-in can serve).
+BIZPORTAL_BASE_URL = os.environ.get("BIZPORTAL_BASE_URL", "https://www.bizportal.co.il").rstrip("/")
+YAHOO_BASE_URL = (os.environ.get("YAHOO_BASE_URL") or "").rstrip("/")
+
+_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+
+class ProviderError(Exception):
+    """Upstream source is unreachable or returned garbage (as opposed to 'ticker not found')."""
+
+
+def _bizportal_request(ticker_id: str) -> float:
+    """Fetch one security from Bizportal. Raises ProviderError if the site itself fails."""
+    # Remove .TA suffix if present for the ID
+    clean_id = ticker_id.replace('.TA', '')
+
+    # Bizportal URL structure
+    url = f"{BIZPORTAL_BASE_URL}/capitalmarket/quote/general/{clean_id}"
+
+    try:
+        response = requests.get(url, headers=_HEADERS, timeout=3) # Reduced timeout to 3s
+    except requests.RequestException as e:
+        raise ProviderError(f"Bizportal unreachable: {e}") from e
+    if response.status_code >= 500:
+        raise ProviderError(f"Bizportal returned {response.status_code}")
+    if response.status_code != 200:
+        return 0.0
+
+    return parse_bizportal_html(response.content)
+
+
+def parse_bizportal_html(content: bytes) -> float:
+    """Price in Shekels from a Bizportal quote page (0.0 if not found)."""
+    soup = BeautifulSoup(content, 'html.parser')
+
+    # Selector found: .paper_rate .num
+    price_span = soup.select_one('.paper_rate .num')
+    if price_span:
+        # Price might contain commas
+        price_text = price_span.text.replace(',', '')
+        # TASE prices are in Agorot, convert to Shekels
+        return float(price_text) / 100.0
+
+    return 0.0
+
+
+def fetch_bizportal_price(ticker_id: str) -> float:
+    """Fallback: Fetch price from Bizportal for TASE securities."""
+    try:
+        return _bizportal_request(ticker_id)
+    except Exception as e:
+        logger.warning("Error fetching from Bizportal for %s: %s", ticker_id, e)
+        return 0.0
+
+
+def fetch_yahoo_prices(tickers: List[str]) -> Dict[str, float]:
+    """Batch download from Yahoo and pick the last close per ticker."""
+    prices = {}
+    # Use 5d to ensure data continuity
+    data = yf.download(tickers, period="5d", group_by="ticker", progress=False, threads=True)
+    if data.empty:
+        # yfinance swallows network errors and hands back an empty frame
+        raise ProviderError("Yahoo returned no data")
+
+    for ticker in tickers:
+        try:
+            last_price = None
+
+            # Handle Multi-Level Column
+            if isinstance(data.columns, pd.MultiIndex):
+                if ticker in data.columns:
+                    ticker_df = data[ticker]
+                    if 'Close' in ticker_df.columns:
+                        series = ticker_df['Close'].dropna()
+                        if not series.empty:
+                            last_price = series.iloc[-1]
+
+            # Handle Single Level (Flattened)
+            elif 'Close' in data.columns:
+                if len(tickers) == 1 and tickers[0] == ticker:
+                    series = data['Close'].dropna()
+                    if not series.empty:
+                        last_price = series.iloc[-1]
+
+            if last_price is not None:
+                prices[ticker] = float(last_price.item() if hasattr(last_price, 'item') else last_price)
+        except Exception:
+            continue
+    return prices
+
+
+def fetch_yahoo_chart_prices(tickers: List[str], base_url: Optional[str] = None, timeout: float = 5.0) -> Dict[str, float]:
+    """
+    Last close per ticker from Yahoo's v8 chart endpoint (one request per ticker).
+    Used instead of yfinance when YAHOO_BASE_URL is set, e.g. against the stand-in server.
+    Raises ProviderError only if every request failed at the transport/5xx level.
+    """
+    base_url = (base_url or YAHOO_BASE_URL or "https://query1.finance.yahoo.com").rstrip("/")
+    prices = {}
+    failures = 0
+    with requests.Session() as session:
+        for ticker in tickers:
+            try:
+                response = session.get(f"{base_url}/v8/finance/chart/{ticker}",
+                                       params={"range": "5d", "interval": "1d"}, headers=_HEADERS, timeout=timeout)
+            except requests.RequestException:
+                failures += 1
+                continue
+            if response.status_code >= 500:
+                failures += 1
+                continue
+            if response.status_code != 200:
+                continue
+            price = parse_yahoo_chart(response.json())
+            if price:
+                prices[ticker] = price
+    if tickers and failures == len(tickers):
+        raise ProviderError(f"Yahoo chart endpoint failed for all {len(tickers)} tickers")
+    return prices
+
+
+# Yahoo's spark endpoint answers up to 20 symbols per request
+SPARK_CHUNK = 20
+
+
+def fetch_yahoo_spark_prices(tickers: List[str], base_url: Optional[str] = None, timeout: float = 5.0) -> Dict[str, float]:
+    """
+    Current price per ticker from Yahoo's v8 spark endpoint, SPARK_CHUNK symbols
+    per request and a single 1d/1d point each (no history, no pandas).
+    Raises ProviderError only if every request failed at the transport/5xx level.
+    """
+    base_url = (base_url or YAHOO_BASE_URL or "https://query1.finance.yahoo.com").rstrip("/")
+    prices = {}
+    chunks = [tickers[i:i + SPARK_CHUNK] for i in range(0, len(tickers), SPARK_CHUNK)]
+    failures = 0
+    with requests.Session() as session:
+        for chunk in chunks:
+            try:
+                response = session.get(f"{base_url}/v8/finance/spark",
+                                       params={"symbols": ",".join(chunk), "range": "1d", "interval": "1d"},
+                                       headers=_HEADERS, timeout=timeout)
+            except requests.RequestException:
+                failures += 1
+                continue
+            if response.status_code >= 500:
+                failures += 1
+                continue
+            if response.status_code != 200:
+                continue
+            try:
+                prices.update(parse_yahoo_spark(response.json()))
+            except ValueError:
+                failures += 1
+    if chunks and failures == len(chunks):
+        raise ProviderError(f"Yahoo spark endpoint failed for all {len(chunks)} requests")
+    return {t: prices[t] for t in tickers if t in prices}
+
+
+def parse_yahoo_spark(payload: dict) -> Dict[str, float]:
+    """{symbol: price} from a spark response: the live market price, else the last close."""
+    try:
+        results = payload["spark"]["result"] or []
+    except (KeyError, TypeError):
+        return {}
+    prices = {}
+    for item in results:
+        response = (item.get("response") or [None])[0]
+        if not response:
+            continue
+        price = (response.get("meta") or {}).get("regularMarketPrice")
+        if not price:
+            price = parse_yahoo_chart({"chart": {"result": [response]}})
+        if price:
+            prices[item.get("symbol")] = float(price)
+    return prices
+
+
+def parse_yahoo_chart(payload: dict) -> Optional[float]:
+    """Last non-null close from a chart response, else the meta market price."""
+    try:
+        result = payload["chart"]["result"][0]
+    except (KeyError, IndexError, TypeError):
+        return None
+    closes = ((result.get("indicators") or {}).get("quote") or [{}])[0].get("close") or []
+    for close in reversed(closes):
+        if close is not None:
+            return float(close)
+    price = (result.get("meta") or {}).get("regularMarketPrice")
+    return float(price) if price else None
+
+
+def parse_yahoo_chart_series(payload: dict) -> List[Tuple[int, float]]:
+    """(epoch seconds, close) pairs from a chart response, nulls dropped."""
+    try:
+        result = payload["chart"]["result"][0]
+    except (KeyError, IndexError, TypeError):
+        return []
+    closes = ((result.get("indicators") or {}).get("quote") or [{}])[0].get("close") or []
+    return [(ts, float(c)) for ts, c in zip(result.get("timestamp") or [], closes) if c is not None]
+
+
+class RateLimiter:
+    """Token bucket: `rate` requests per second with bursts of up to `burst`."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_s = (1 - self._tokens) / self.rate
+            time.sleep(wait_s)
+
+
+class CircuitBreaker:
+    """
+    Per-provider breaker. After `threshold` consecutive failures the provider is
+    skipped for `cooldown` seconds; each failed probe after that doubles the
+    cooldown (up to `max_cooldown`). One success closes it again.
+    """
+
+    def __init__(self, threshold: int = 3, cooldown: float = 30.0, max_cooldown: float = 600.0):
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.failures = 0
+        self.open_until = 0.0
+        self._cooldown = cooldown
+        self._lock = threading.Lock()
+
+    def available(self) -> bool:
+        return time.monotonic() >= self.open_until
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.open_until = 0.0
+            self._cooldown = self.base_cooldown
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.open_until = time.monotonic() + self._cooldown
+                self._cooldown = min(self._cooldown * 2, self.max_cooldown)
+
+
+class PriceProvider:
+    """
+    Base class for a price source.
+    Subclasses implement `_fetch`, returning prices only for tickers they resolved.
+    - max_concurrency: simultaneous in-flight batches against this source.
+    - rate_per_sec / burst: token bucket applied per batch request.
+    - batch_size: tickers per request (None = all in one request).
+    - latency_budget: seconds before a hedged request fires the next source.
+    """
+    name = "base"
+
+    def __init__(
+        self,
+        max_concurrency: int = 4,
+        rate_per_sec: Optional[float] = None,
+        burst: int = 1,
+        batch_size: Optional[int] = None,
+        latency_budget: Optional[float] = None,
+    ):
+        self.max_concurrency = max_concurrency
+        self.batch_size = batch_size
+        self.latency_budget = latency_budget
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._limiter = RateLimiter(rate_per_sec, burst) if rate_per_sec else None
+        self.breaker = CircuitBreaker()
+
+    def batches(self, tickers: List[str]) -> List[List[str]]:
+        if not self.batch_size:
+            return [list(tickers)]
+        return [tickers[i:i + self.batch_size] for i in range(0, len(tickers), self.batch_size)]
+
+    def fetch(self, tickers: List[str]) -> Dict[str, float]:
+        """Fetch one batch under this provider's concurrency and rate limits."""
+        with self._slots:
+            if self._limiter:
+                self._limiter.acquire()
+            start = time.perf_counter()
+            try:
+                prices = self._fetch(tickers)
+            except Exception as e:
+                self._record(start, "error")
+                self.breaker.record_failure()
+                logger.warning("%s provider failed for %s: %s", self.name, tickers, e)
+                return {}
+        self.breaker.record_success()
+        # Zero/negative means "not found" for every upstream we use
+        prices = {t: p for t, p in prices.items() if p and p > 0}
+        self._record(start, "ok" if prices else "empty")
+        return prices
+
+    def _record(self, start: float, outcome: str):
+        PROVIDER_LATENCY.observe(time.perf_counter() - start, provider=self.name, outcome=outcome)
+        PROVIDER_REQUESTS.inc(provider=self.name, outcome=outcome)
+
+    def _fetch(self, tickers: List[str]) -> Dict[str, float]:
+        raise NotImplementedError
+
+
+class YahooProvider(PriceProvider):
+    """Last prices via the spark endpoint: one request per SPARK_CHUNK symbols, chunks in parallel."""
+    name = "yahoo"
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("max_concurrency", 4)
+        # A 500-symbol refresh (25 chunks) fits in one burst; sustained load is held to 20 req/s
+        kwargs.setdefault("rate_per_sec", 20.0)
+        kwargs.setdefault("burst", 25)
+        kwargs.setdefault("batch_size", SPARK_CHUNK)
+        kwargs.setdefault("latency_budget", 4.0)
+        super().__init__(**kwargs)
+
+    def _fetch(self, tickers):
+        try:
+            return fetch_yahoo_spark_prices(tickers)
+        except ProviderError:
+            if YAHOO_BASE_URL:
+                raise
+        # Spark unavailable upstream: fall back to the (much heavier) yfinance download
+        return fetch_yahoo_prices(tickers)
+
+
+class BizportalProvider(PriceProvider):
+    name = "bizportal"
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("max_concurrency", 4)
+        kwargs.setdefault("rate_per_sec", 5.0)
+        kwargs.setdefault("burst", 4)
+        kwargs.setdefault("batch_size", 1) # One security per page
+        kwargs.setdefault("latency_budget", 1.5)
+        super().__init__(**kwargs)
+
+    def _fetch(self, tickers):
+        return {t: _bizportal_request(t) for t in tickers}
+
+
+class CSVPriceProvider(PriceProvider):
+    """Local CSV with `ticker,price` rows. Re-read only when the file changes."""
+    name = "csv"
+
+    def __init__(self, path: Optional[str] = None, **kwargs):
+        kwargs.setdefault("max_concurrency", 16)
+        super().__init__(**kwargs)
+        self.path = path or os.environ.get("PRICES_CSV", "prices.csv")
+        self._mtime = None
+        self._prices: Dict[str, float] = {}
+
+    def _load(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            self._prices = {}
+            return
+        if mtime == self._mtime:
+            return
+        prices = {}
+        with open(self.path, newline='') as f:
+            for row in csv.DictReader(f):
+                try:
+                    prices[row['ticker'].strip()] = float(row['price'])
+                except (KeyError, TypeError, ValueError):
+                    continue
+        self._prices = prices
+        self._mtime = mtime
+
+    def _fetch(self, tickers):
+        self._load()
+        return {t: self._prices[t] for t in tickers if t in self._prices}
+
+
+class OfflineProvider(PriceProvider):
+    """Deterministic stand-in prices (stable per ticker) for offline runs and tests."""
+    name = "offline"
+
+    def __init__(self, latency: float = 0.0, **kwargs):
+        kwargs.setdefault("max_concurrency", 16)
+        super().__init__(**kwargs)
+        self.latency = latency
+
+    def _fetch(self, tickers):
+        if self.latency:
+            time.sleep(self.latency)
+        # Hash-based so a ticker always gets the same price between runs
+        return {t: 1.0 + (zlib.crc32(t.encode()) % 100000) / 100.0 for t in tickers}
+
+
+class PriceRouter:
+    """
+    Routes each ticker to an ordered fallback chain of providers.
+    - routes: [(regex, [provider names])], first match wins, else default_chain.
+    - Tickers a provider cannot resolve fall through to the next provider.
+    - If a provider has a latency_budget and is slower than it, the next
+      provider is fired in parallel (hedged) and the first answer wins.
+    """
+
+    def __init__(self, providers: Dict[str, PriceProvider], routes: List[Tuple[str, List[str]]], default_chain: List[str]):
+        self.providers = providers
+        self.routes = [(re.compile(pattern), chain) for pattern, chain in routes]
+        self.default_chain = default_chain
+
+    def chain_for(self, ticker: str) -> List[str]:
+        for pattern, chain in self.routes:
+            if pattern.match(ticker):
+                return chain
+        return self.default_chain
+
+    def fetch(self, tickers: List[str]) -> Dict[str, float]:
+        groups: Dict[Tuple[str, ...], List[str]] = {}
+        for t in dict.fromkeys(tickers):
+            chain = tuple(name for name in self.chain_for(t) if name in self.providers)
+            groups.setdefault(chain, []).append(t)
+
+        prices = {}
+        for chain, group in groups.items():
+            prices.update(self._fetch_chain(list(chain), group))
+        return prices
+
+    def _fetch_chain(self, chain: List[str], tickers: List[str]) -> Dict[str, float]:
+        # Providers with an open breaker are skipped outright (no timeout paid)
+        chain = [name for name in chain if self.providers[name].breaker.available()]
+        prices = {}
+        remaining = tickers
+        i = 0
+        while remaining and i < len(chain):
+            primary = self.providers[chain[i]]
+            backup = self.providers[chain[i + 1]] if i + 1 < len(chain) else None
+            got, used_backup = self._hedged(primary, backup, remaining)
+            prices.update(got)
+            remaining = [t for t in remaining if t not in got]
+            # A hedge already asked the backup for every ticker the primary left unresolved
+            i += 2 if used_backup else 1
+        return prices
+
+    def _hedged(self, primary: PriceProvider, backup: Optional[PriceProvider], tickers: List[str]):
+        batches = primary.batches(tickers)
+        futures = {_POOL.submit(primary.fetch, b): b for b in batches}
+        budget = None
+        if backup and primary.latency_budget:
+            # Batches queue behind the concurrency limit; budget each wave, not the total
+            budget = primary.latency_budget * math.ceil(len(batches) / primary.max_concurrency)
+        done, pending = wait(futures, timeout=budget)
+
+        prices = {}
+        for f in done:
+            prices.update(f.result())
+        if not pending:
+            return prices, False
+
+        # Primary is over budget: fire the backup for the tickers still in flight,
+        # plus any the primary already answered as not found (the chain resumes
+        # after the backup, so they would otherwise never reach it)
+        slow = [t for f in pending for t in futures[f]]
+        missed = [t for f in done for t in futures[f] if t not in prices]
+        hedged = {_POOL.submit(backup.fetch, b) for b in backup.batches(slow + missed)}
+        wanted = slow + missed
+        outstanding = set(pending) | hedged
+        while outstanding and any(t not in prices for t in wanted):
+            finished, outstanding = wait(outstanding, return_when=FIRST_COMPLETED)
+            for f in finished:
+                for t, p in f.result().items():
+                    prices.setdefault(t, p)
+        return prices, True
+
+
+# --- Registry ---
+PROVIDERS: Dict[str, PriceProvider] = {}
+
+def register_provider(provider: PriceProvider):
+    PROVIDERS[provider.name] = provider
+
+for _p in (BizportalProvider(), YahooProvider(), CSVPriceProvider(), OfflineProvider()):
+    register_provider(_p)
+
+# Numeric (with optional .TA suffix) -> TASE security, Bizportal first.
+# Manual prices are per asset, not quotes: process_portfolio applies them and
+# callers leave those tickers out of the fetch, so they never reach the shared cache.
+ROUTES = [
+    # Yahoo quotes .TA in Agorot rather than Shekels, so it is not a fallback here
+    (r'^\d+(\.TA)?$', ["bizportal", "csv"]),
+]
+DEFAULT_CHAIN = ["yahoo", "csv"]
+# PORTFOLIO_OFFLINE=1 skips every network source
+OFFLINE_CHAIN = ["csv", "offline"]
+
+def _build_router() -> PriceRouter:
+    if os.environ.get("PORTFOLIO_OFFLINE") == "1":
+        return PriceRouter(PROVIDERS, [], OFFLINE_CHAIN)
+    return PriceRouter(PROVIDERS, ROUTES, DEFAULT_CHAIN)
+
+router = _build_router()
+
+def fetch_prices(tickers: List[str]) -> Dict[str, float]:
+    """Resolve tickers through the router. Unresolved tickers are omitted."""
+    return router.fetch(tickers)
@@ -0,0 +1,115 @@
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple
+
+from .metrics import CACHE_REQUESTS
+from .singleflight import SingleFlight
+
+
+class Quote(NamedTuple):
+    price: float
+    as_of: float # Epoch seconds of the successful fetch
+    stale: bool  # True when served from last-known-good after a failed refresh
+
+
+class QuoteCache:
+    """
+    Price cache in front of the provider router.
+    - Fresh quotes are served for `ttl` seconds, or until `policy.expires(ticker,
+      fetched_at)` when a freshness policy is given (see market_hours.py).
+    - A ticker that fails to resolve is negatively cached with exponential
+      backoff (backoff_base * 2^n, capped), so a dead symbol or source is not
+      retried on every refresh.
+    - While a ticker is failing, its last-known-good price is served with
+      `stale=True` instead of dropping to zero.
+    - Concurrent misses for the same ticker share one upstream fetch
+      (SingleFlight); only the caller that fetched updates the cache.
+    """
+
+    def __init__(self, fetcher: Callable[[List[str]], Dict[str, float]], ttl: float = 1800,
+                 backoff_base: float = 60, backoff_max: float = 3600, policy=None):
+        self._fetcher = fetcher
+        self.ttl = ttl
+        self.policy = policy
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._good: Dict[str, list] = {}     # ticker -> [price, as_of, fresh_until]
+        self._failures: Dict[str, list] = {} # ticker -> [count, retry_at]
+        self._lock = threading.Lock()
+        self._flight = SingleFlight("quotes")
+
+    def get(self, tickers: List[str]) -> Dict[str, Quote]:
+        """Quotes for the tickers we have a price for (fresh or stale). Unknown tickers are omitted."""
+        now = time.time()
+        quotes = {}
+        to_fetch = []
+        with self._lock:
+            for t in dict.fromkeys(tickers):
+                good = self._good.get(t)
+                if good and now < good[2]:
+                    quotes[t] = Quote(good[0], good[1], False)
+                    CACHE_REQUESTS.inc(cache="quotes", result="hit")
+                    continue
+                fail = self._failures.get(t)
+                if fail and now < fail[1]:
+                    # Negative cache hit: still backing off, serve last-known-good
+                    CACHE_REQUESTS.inc(cache="quotes", result="negative")
+                    if good:
+                        quotes[t] = Quote(good[0], good[1], True)
+                    continue
+                to_fetch.append(t)
+
+        if to_fetch:
+            CACHE_REQUESTS.inc(len(to_fetch), cache="quotes", result="miss")
+        if not to_fetch:
+            return quotes
+
+        fetched = self._flight.do(to_fetch, self._fetch_and_store)
+        with self._lock:
+            for t in to_fetch:
+                if t in fetched:
+                    quotes[t] = Quote(*self._good[t][:2], False)
+                else:
+                    good = self._good.get(t)
+                    if good:
+                        quotes[t] = Quote(good[0], good[1], True)
+        return quotes
+
+    def _expires(self, ticker: str, fetched_at: float) -> float:
+        return self.policy.expires(ticker, fetched_at) if self.policy else fetched_at + self.ttl
+
+    def _fetch_and_store(self, tickers: List[str]) -> Dict[str, float]:
+        """Fetch and record the outcome. Runs once per ticker however many callers missed it."""
+        now = time.time()
+        with self._lock:
+            # A fetch that finished while this caller was queueing already refreshed (or failed) these
+            fresh = {t: self._good[t][0] for t in tickers if t in self._good and now < self._good[t][2]}
+            backing_off = {t for t in tickers if t in self._failures and now < self._failures[t][1]}
+        tickers = [t for t in tickers if t not in fresh and t not in backing_off]
+        fetched = self._fetcher(tickers) if tickers else {}
+        now = time.time()
+        with self._lock:
+            for t in tickers:
+                if t in fetched:
+                    self._good[t] = [fetched[t], now, self._expires(t, now)]
+                    self._failures.pop(t, None)
+                else:
+                    count = self._failures.get(t, [0, 0.0])[0] + 1
+                    delay = min(self.backoff_base * 2 ** (count - 1), self.backoff_max)
+                    self._failures[t] = [count, now + delay]
+        return {**fresh, **{t: fetched[t] for t in tickers if t in fetched}}
+
+    def put(self, prices: Dict[str, float]):
+        """Store pushed prices (e.g. from a streaming feed) as fresh quotes."""
+        now = time.time()
+        with self._lock:
+            for t, p in prices.items():
+                if p and p > 0:
+                    self._good[t] = [p, now, self._expires(t, now)]
+                    self._failures.pop(t, None)
+
+    def invalidate(self):
+        """Force a refetch on next access. Last-known-good prices and backoff state are kept."""
+        with self._lock:
+            for good in self._good.values():
+                good[2] = 0.0
@@ -0,0 +1,172 @@
+import json
+import logging
+import multiprocessing
+import os
+import time
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import delete, func
+from sqlmodel import Session, create_engine, select
+
+from ..models import Asset, PortfolioValuation, PositionValuation, Settings, ValuationRun
+from .fx import FXMatrix
+from .valuation import asset_symbol, get_fx_matrix, get_live_prices, process_portfolio
+
+logger = logging.getLogger(__name__)
+
+BATCH_USERS = 500 # Users per task; large enough to amortize IPC, small enough to balance
+KEEP_POSITION_RUNS = 7 # Per-position rows are kept for the last N runs (summaries are kept)
+
+
+class MarketSnapshot(NamedTuple):
+    """One set of quotes and FX rates shared by every worker in a run."""
+    prices: Dict[str, float]
+    fx: FXMatrix
+    as_of: datetime
+
+
+def take_snapshot(engine, user_ids: Optional[Sequence[int]] = None) -> MarketSnapshot:
+    """Quote every symbol held (one batched fetch) and build one FX matrix."""
+    with Session(engine) as session:
+        query = select(Asset.ticker, Asset.type, Asset.currency, Asset.manual_price).distinct()
+        if user_ids:
+            query = query.where(Asset.user_id.in_(user_ids))
+        rows = session.exec(query).all()
+        base_currencies = set(session.exec(select(Settings.base_currency).distinct()).all())
+    holdings = [SimpleNamespace(ticker=t, type=typ, currency=c, manual_price=m) for t, typ, c, m in rows]
+    symbols = sorted({asset_symbol(a) for a in holdings if not (a.manual_price and a.manual_price > 0)})
+    prices = get_live_prices(symbols)
+    fx = get_fx_matrix({a.currency for a in holdings} | base_currencies | {"USD", "ILS"})
+    return MarketSnapshot(prices, fx, datetime.utcnow())
+
+
+# --- Worker side (module-level so it pickles under spawn as well as fork) ---
+
+_worker: dict = {}
+
+
+def _init_worker(db_url: str, snapshot: MarketSnapshot, engine=None):
+    # Each process opens its own connections; the snapshot arrives once per worker, not per task
+    _worker["engine"] = engine or create_engine(db_url, connect_args={"check_same_thread": False})
+    _worker["snapshot"] = snapshot
+
+
+def _value_users(user_ids: List[int]) -> Tuple[list, list]:
+    """Value a batch of users. Returns (summary rows, position rows) as plain tuples."""
+    engine = _worker["engine"]
+    snap: MarketSnapshot = _worker["snapshot"]
+    with Session(engine) as session:
+        assets = session.exec(select(Asset).where(Asset.user_id.in_(user_ids)).order_by(Asset.user_id)).all()
+        settings = {s.user_id: s for s in session.exec(select(Settings).where(Settings.user_id.in_(user_ids))).all()}
+        session.expunge_all()
+
+    by_user: Dict[int, List[Asset]] = {uid: [] for uid in user_ids}
+    for a in assets:
+        by_user[a.user_id].append(a)
+
+    summaries, positions = [], []
+    for user_id, user_assets in by_user.items():
+        user_settings = settings.get(user_id) or Settings(user_id=user_id)
+        fx = snap.fx.override("USD", "ILS", user_settings.usd_ils_rate) if user_settings.use_manual_fx else snap.fx
+        summary, user_positions = process_portfolio(user_assets, snap.prices, fx, user_settings)
+        summaries.append((user_id, user_settings.base_currency or 'ILS', summary['total_net_worth'],
+                          summary['total_after_tax'], summary['swr_monthly'], summary['future_value_40y'],
+                          json.dumps(summary['allocations'], separators=(",", ":")), len(user_positions)))
+        positions.extend((user_id, p.id, p.symbol, p.price, p.mkt_val_ils, p.cost_basis_ils, p.tax_ils)
+                         for p in user_positions)
+    return summaries, positions
+
+
+# --- Coordinator ---
+
+def _write_batch(session: Session, run_id: int, as_of: datetime, summaries: list, positions: list):
+    if summaries:
+        session.connection().execute(PortfolioValuation.__table__.insert(), [
+            {"run_id": run_id, "as_of": as_of, "user_id": uid, "base_currency": ccy, "net_worth": nw,
+             "after_tax": at, "swr_monthly": swr, "future_value_40y": fv, "allocations": alloc, "positions": n}
+            for uid, ccy, nw, at, swr, fv, alloc, n in summaries])
+    if positions:
+        session.connection().execute(PositionValuation.__table__.insert(), [
+            {"run_id": run_id, "user_id": uid, "asset_id": aid, "symbol": sym, "price": price,
+             "market_value": mv, "cost_basis": cb, "tax": tax}
+            for uid, aid, sym, price, mv, cb, tax in positions])
+    session.commit()
+
+
+def revalue(engine, user_ids: Optional[Sequence[int]] = None, workers: Optional[int] = None,
+            batch_users: int = BATCH_USERS, snapshot: Optional[MarketSnapshot] = None,
+            keep_position_runs: int = KEEP_POSITION_RUNS) -> ValuationRun:
+    """
+    Revalue users (default: everyone holding assets) on a process pool and
+    persist a PortfolioValuation per user and a PositionValuation per asset.
+    - Quotes and FX are fetched once (`snapshot`) and shipped to each worker
+      at start-up, so all users are valued at the same prices.
+    - Workers only read; the parent writes each finished batch, so SQLite
+      sees one writer.
+    - workers=1 values in-process (no pool).
+    """
+    workers = workers or os.cpu_count() or 1
+    with Session(engine) as session:
+        if user_ids is None:
+            user_ids = session.exec(select(Asset.user_id).distinct().order_by(Asset.user_id)).all()
+        run = ValuationRun(workers=workers)
+        session.add(run)
+        session.commit()
+        session.refresh(run)
+
+        start = time.perf_counter()
+        try:
+            snapshot = snapshot or take_snapshot(engine, user_ids)
+            batches = [list(user_ids[i:i + batch_users]) for i in range(0, len(user_ids), batch_users)]
+            db_url = engine.url.render_as_string(hide_password=False)
+
+            if workers == 1:
+                _init_worker(db_url, snapshot, engine)
+                results = map(_value_users, batches)
+                pool = None
+            else:
+                pool = multiprocessing.get_context().Pool(workers, initializer=_init_worker, initargs=(db_url, snapshot))
+                results = pool.imap_unordered(_value_users, batches)
+            try:
+                for summaries, positions in results:
+                    _write_batch(session, run.id, snapshot.as_of, summaries, positions)
+                    run.users += len(summaries)
+                    run.positions += len(positions)
+            finally:
+                if pool is not None:
+                    pool.close()
+                    pool.join()
+            run.status = "done"
+        except Exception:
+            logger.exception("Revaluation run %s failed", run.id)
+            run.status = "failed"
+            raise
+        finally:
+            run.seconds = time.perf_counter() - start
+            run.finished_at = datetime.utcnow()
+            session.add(run)
+            session.commit()
+
+        prune_position_values(session, keep_position_runs)
+        session.refresh(run)
+        session.expunge(run)
+    return run
+
+
+def prune_position_values(session: Session, keep_runs: int = KEEP_POSITION_RUNS) -> int:
+    """Drop per-position rows of all but the newest `keep_runs` finished runs."""
+    keep = session.exec(select(ValuationRun.id).where(ValuationRun.status == "done")
+                        .order_by(ValuationRun.id.desc()).limit(keep_runs)).all()
+    if len(keep) < keep_runs:
+        return 0
+    result = session.exec(delete(PositionValuation).where(PositionValuation.run_id < min(keep)))
+    session.commit()
+    return result.rowcount
+
+
+def latest_valuation(session: Session, user_id: int) -> Optional[PortfolioValuation]:
+    """The user's most recent persisted totals."""
+    newest = select(func.max(PortfolioValuation.id)).where(PortfolioValuation.user_id == user_id).scalar_subquery()
+    return session.exec(select(PortfolioValuation).where(PortfolioValuation.id == newest)).first()
@@ -0,0 +1,259 @@
+import threading
+from datetime import date
+from statistics import NormalDist
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .cashflow import LIABILITY_CATEGORY
+from .history import fx_symbol, load_history, update_history
+
+TRADING_DAYS = 252
+CASH_TYPES = ('Cash/Deposit', 'Cash')
+
+
+class RollingWindow:
+    """
+    The last `window` daily return rows plus running sums (sum r, sum r r^T),
+    so adding a day costs O(n^2) instead of re-reading the whole window.
+    Sums are rebuilt from the buffer once per `window` pushes to bound float drift.
+    """
+
+    def __init__(self, n: int, window: int = TRADING_DAYS):
+        self.window = window
+        self.buffer = np.zeros((window, n))
+        self.count = 0
+        self._pos = 0
+        self._since_refresh = 0
+        self._s1 = np.zeros(n)
+        self._s2 = np.zeros((n, n))
+
+    def push(self, row: np.ndarray):
+        row = np.nan_to_num(np.asarray(row, dtype=float))
+        if self.count == self.window:
+            old = self.buffer[self._pos]
+            self._s1 -= old
+            self._s2 -= np.outer(old, old)
+        else:
+            self.count += 1
+        self.buffer[self._pos] = row
+        self._s1 += row
+        self._s2 += np.outer(row, row)
+        self._pos = (self._pos + 1) % self.window
+        self._since_refresh += 1
+        if self._since_refresh >= self.window:
+            self._refresh()
+
+    def _refresh(self):
+        rows = self.returns()
+        self._s1 = rows.sum(axis=0)
+        self._s2 = rows.T @ rows
+        self._since_refresh = 0
+
+    def returns(self) -> np.ndarray:
+        """Window rows in chronological order."""
+        if self.count < self.window:
+            return self.buffer[:self.count]
+        return np.roll(self.buffer, -self._pos, axis=0)
+
+    def mean(self) -> np.ndarray:
+        return self._s1 / max(self.count, 1)
+
+    def cov(self) -> np.ndarray:
+        if self.count < 2:
+            return np.zeros_like(self._s2)
+        return (self._s2 - np.outer(self._s1, self._s1) / self.count) / (self.count - 1)
+
+
+class RiskModel:
+    """
+    Rolling return statistics for a fixed set of factors (price series in the
+    base currency). `advance(prices)` only consumes days newer than the last
+    one seen, so a daily refresh pushes one row.
+    """
+
+    def __init__(self, factors: Sequence[str], window: int = TRADING_DAYS):
+        self.factors = list(factors)
+        self.window = RollingWindow(len(self.factors), window)
+        self.last_day: Optional[date] = None
+        self._last_prices: Optional[np.ndarray] = None
+
+    def advance(self, prices: pd.DataFrame) -> int:
+        """Push returns for rows after `last_day`. Returns the number of days added."""
+        if prices.empty:
+            return 0
+        frame = prices.reindex(columns=self.factors).sort_index().ffill()
+        if self.last_day is not None:
+            frame = frame[frame.index > self.last_day]
+        added = 0
+        for day, row in zip(frame.index, frame.to_numpy(dtype=float)):
+            if self._last_prices is not None:
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    ret = row / self._last_prices - 1.0
+                self.window.push(np.where(np.isfinite(ret), ret, 0.0))
+                added += 1
+            # Carry the previous close where a series has a gap
+            self._last_prices = row if self._last_prices is None else np.where(np.isnan(row), self._last_prices, row)
+            self.last_day = day
+        return added
+
+    def uncovered(self) -> List[str]:
+        """Factors with no price seen yet (their risk is reported as zero)."""
+        if self._last_prices is None:
+            return list(self.factors)
+        return [f for f, p in zip(self.factors, self._last_prices) if np.isnan(p)]
+
+    def report(self, exposures: Dict[str, float], confidence: Tuple[float, ...] = (0.95, 0.99),
+               total_value: Optional[float] = None) -> Dict:
+        """
+        Volatility, correlation and 1-day VaR for `exposures` ({factor: value in base currency}).
+        VaR is reported as a positive loss amount. Portfolio volatility is relative to
+        `total_value` (defaults to the sum of exposures), so unpriced holdings dilute it.
+        """
+        v = np.array([exposures.get(f, 0.0) for f in self.factors], dtype=float)
+        cov = self.window.cov()
+        sd = np.sqrt(np.clip(np.diag(cov), 0.0, None))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            corr = np.where(np.outer(sd, sd) > 0, cov / np.outer(sd, sd), 0.0)
+        np.fill_diagonal(corr, 1.0)
+
+        total = v.sum() if total_value is None else total_value
+        port_sd = float(np.sqrt(max(v @ cov @ v, 0.0)))
+        pnl = self.window.returns() @ v
+        var = {}
+        for c in confidence:
+            var[c] = {
+                "historical": float(-np.quantile(pnl, 1 - c)) if len(pnl) else 0.0,
+                "parametric": NormalDist().inv_cdf(c) * port_sd,
+            }
+        return {
+            "days": self.window.count,
+            "factors": self.factors,
+            "volatility": dict(zip(self.factors, (sd * np.sqrt(TRADING_DAYS)).tolist())),
+            "portfolio_volatility": port_sd / total * np.sqrt(TRADING_DAYS) if total else 0.0,
+            "portfolio_sd_daily": port_sd,
+            "correlation": pd.DataFrame(corr, index=self.factors, columns=self.factors),
+            "var": var,
+        }
+
+
+def history_symbol(symbol: str, type_: Optional[str]) -> Optional[str]:
+    """Series that drives a position's local-currency price (None = cash, no price risk)."""
+    if type_ in CASH_TYPES:
+        return None
+    # TASE securities: Yahoo quotes them in Agorot, which does not matter for returns
+    if symbol.isdigit():
+        return f"{symbol}.TA"
+    return symbol
+
+
+def position_series(position) -> Optional[str]:
+    """History series for a position; manually priced ones (pensions, houses) have none, like cash."""
+    if position.has_manual_price:
+        return None
+    return history_symbol(position.symbol, position.type)
+
+
+def factor_key(position, base_ccy: str) -> Optional[str]:
+    """One factor per (price series, currency); foreign cash and manual prices are pure FX risk."""
+    sym = position_series(position)
+    if sym is None:
+        return None if position.currency == base_ccy else f"FX:{position.currency}"
+    return sym if position.currency == base_ccy else f"{sym}:{position.currency}"
+
+
+def factor_prices(history: pd.DataFrame, specs: Dict[str, Tuple[Optional[str], str]], base_ccy: str) -> pd.DataFrame:
+    """Base-currency price series per factor from local closes and FX pairs."""
+    cols = {}
+    for key, (sym, ccy) in specs.items():
+        fx = 1.0 if ccy == base_ccy else history.get(fx_symbol(ccy, base_ccy))
+        local = 1.0 if sym is None else history.get(sym)
+        if fx is None or local is None:
+            continue
+        cols[key] = local * fx
+    return pd.DataFrame(cols, index=history.index)
+
+
+def concentration(positions, allocations: Dict[str, float], top_n: int = 5) -> Dict:
+    """
+    Position and bucket concentration from current values (liabilities excluded).
+    - hhi: sum of squared position weights; effective_n = 1 / hhi
+    - work_share: employer equity (category Work) as a share of the total
+    """
+    by_symbol: Dict[str, float] = {}
+    work = 0.0
+    for p in positions:
+        if p.mkt_val_ils > 0:
+            by_symbol[p.symbol] = by_symbol.get(p.symbol, 0.0) + p.mkt_val_ils
+            if p.category == 'Work':
+                work += p.mkt_val_ils
+    values = np.array(sorted(by_symbol.values(), reverse=True))
+    total = values.sum()
+    if total <= 0:
+        return {"hhi": 0.0, "effective_n": 0.0, "top_share": 0.0, "largest": None, "work_share": 0.0, "buckets": {}}
+    weights = values / total
+    hhi = float((weights ** 2).sum())
+    bucket_total = sum(v for v in allocations.values() if v > 0)
+    buckets = {b: v / bucket_total for b, v in allocations.items() if bucket_total > 0 and v > 0}
+    largest = max(by_symbol, key=by_symbol.get)
+    return {
+        "hhi": hhi,
+        "effective_n": 1.0 / hhi,
+        "top_share": float(weights[:top_n].sum()),
+        "largest": (largest, by_symbol[largest] / total),
+        "work_share": work / total,
+        "buckets": dict(sorted(buckets.items(), key=lambda kv: -kv[1])),
+    }
+
+
+class RiskService:
+    """
+    Keeps one RiskModel per factor set between calls. Each call extends the
+    stored history incrementally and feeds only new days into the model.
+    """
+
+    def __init__(self, window: int = TRADING_DAYS):
+        self.window = window
+        self._models: Dict[Tuple[str, ...], RiskModel] = {}
+        self._lock = threading.Lock()
+
+    def analyze(self, positions, summary: Dict, base_ccy: str = 'ILS', refresh: bool = True) -> Dict:
+        specs: Dict[str, Tuple[Optional[str], str]] = {}
+        exposures: Dict[str, float] = {}
+        total_value = 0.0
+        for p in positions:
+            # Liabilities are not market exposure (process_portfolio keeps them out of allocations too)
+            if p.category == LIABILITY_CATEGORY:
+                continue
+            # Cash and manually priced holdings carry no factor risk but still count toward the total
+            total_value += p.mkt_val_ils
+            key = factor_key(p, base_ccy)
+            if key is None:
+                continue
+            specs[key] = (position_series(p), p.currency)
+            exposures[key] = exposures.get(key, 0.0) + p.mkt_val_ils
+
+        symbols = {sym for sym, _ in specs.values() if sym} | {fx_symbol(c, base_ccy) for _, c in specs.values() if c != base_ccy}
+        if refresh:
+            update_history(symbols)
+
+        factors = tuple(sorted(specs))
+        with self._lock:
+            model = self._models.get(factors)
+            if model is None:
+                model = self._models[factors] = RiskModel(factors, self.window)
+            # Only days the model has not seen are loaded and pushed
+            history = load_history(symbols, days=int(self.window * 1.6) + 10,
+                                   since=model.last_day)
+            prices = factor_prices(history, specs, base_ccy)
+            model.advance(prices)
+
+        report = model.report(exposures, total_value=total_value)
+        report["uncovered"] = model.uncovered()
+        report["exposures"] = exposures
+        report["concentration"] = concentration(positions, summary.get('allocations', {}))
+        return report
+
+
+risk_service = RiskService()
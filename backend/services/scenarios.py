@@ -0,0 +1,162 @@
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .classifier import BUCKETS, stored_weights
+from .fx import FXMatrix
+from .tax_engine import REAL_GAIN, _BASES, tax_engine, years_held
+from .valuation import asset_symbol
+
+
+class Scenario:
+    """
+    One what-if. Shocks are relative changes (-0.3 = down 30%).
+    - prices: {symbol or ticker: shock}, e.g. {"GOOG": -0.3}
+    - fx: {currency: shock against the base currency}, e.g. {"USD": -0.1}
+    - settings: Settings fields to replace, e.g. {"tax_rate_capital_gains": 0.3}
+    """
+
+    def __init__(self, name: str = "", prices: Optional[Dict[str, float]] = None,
+                 fx: Optional[Dict[str, float]] = None, settings: Optional[Dict[str, float]] = None):
+        self.name = name
+        self.prices = prices or {}
+        self.fx = fx or {}
+        self.settings = settings or {}
+
+    def __repr__(self):
+        return f"Scenario({self.name!r}, prices={self.prices}, fx={self.fx}, settings={self.settings})"
+
+
+class _ShockedSettings:
+    """Settings view with some fields replaced."""
+
+    def __init__(self, base, overrides: Dict[str, float]):
+        self._base = base
+        self._overrides = overrides
+
+    def __getattr__(self, name):
+        if name in self._overrides:
+            return self._overrides[name]
+        return getattr(self._base, name)
+
+
+class ScenarioEngine:
+    """
+    Batched revaluation under many scenarios, with process_portfolio semantics
+    (manual prices, FX to the base currency, unconvertible currencies count
+    as 0, tax table, negative values kept out of allocation buckets).
+
+    Everything that does not depend on the shocks (prices, quantities, rule
+    lookups, allocation weights) is prepared once in the constructor; `run`
+    is then a few (scenarios x positions) array operations, processed in
+    chunks so memory stays bounded for large portfolios.
+    """
+
+    def __init__(self, assets, prices: Dict[str, float], fx: FXMatrix, settings):
+        self.settings = settings
+        self.base_ccy = getattr(settings, 'base_currency', None) or 'ILS'
+        n = len(assets)
+
+        # 1. Local values (same price lookup as process_portfolio)
+        symbols = [asset_symbol(a) for a in assets]
+        local_prices = [a.manual_price if (a.manual_price is not None and a.manual_price > 0) else prices.get(s, 0.0)
+                        for a, s in zip(assets, symbols)]
+        self.local_values = np.array([p * a.quantity for p, a in zip(local_prices, assets)], dtype=float)
+        self.local_costs = np.array([a.cost_basis for a in assets], dtype=float)
+
+        # 2. Symbol and currency indices for the shock matrices
+        self.symbols = sorted(set(symbols))
+        sym_index = {s: i for i, s in enumerate(self.symbols)}
+        self.pos_symbol = np.array([sym_index[s] for s in symbols], dtype=np.intp)
+        # Shocks may name the plain ticker too (BTC -> BTC-USD)
+        self._price_keys: Dict[str, List[int]] = {s: [i] for s, i in sym_index.items()}
+        for a, s in zip(assets, symbols):
+            keys = self._price_keys.setdefault(a.ticker.strip(), [])
+            if sym_index[s] not in keys:
+                keys.append(sym_index[s])
+
+        self.currencies = sorted({a.currency for a in assets})
+        ccy_index = {c: i for i, c in enumerate(self.currencies)}
+        self.pos_ccy = np.array([ccy_index[a.currency] for a in assets], dtype=np.intp)
+        self.base_rates = np.array([fx.rate(c, self.base_ccy) if c in fx.index and self.base_ccy in fx.index
+                                    else np.nan for c in self.currencies], dtype=float)
+
+        # 3. Allocation weights (positions x buckets) and the tax plan
+        self.weights = np.zeros((n, len(BUCKETS)))
+        bucket_index = {b: i for i, b in enumerate(BUCKETS)}
+        for i, a in enumerate(assets):
+            for bucket, w in stored_weights(a):
+                self.weights[i, bucket_index[bucket]] = w
+        self.tax_plan = tax_engine.prepare([a.category for a in assets], [a.type for a in assets],
+                                           [a.tax_rate for a in assets])
+        self._has_real_gain = bool(np.any(self.tax_plan.basis_codes == _BASES.index(REAL_GAIN)))
+        self.years = years_held([getattr(a, 'date_acquired', None) for a in assets]) if self._has_real_gain else None
+
+    def run(self, scenarios: Sequence[Scenario], max_cells: int = 4_000_000) -> Dict[str, np.ndarray]:
+        """
+        Revalue under every scenario. Returns arrays indexed by scenario:
+        names, net_worth, after_tax, tax, swr_monthly and allocations
+        ({bucket: array}), all in the base currency.
+        """
+        n_pos = max(len(self.local_values), 1)
+        chunk = max(1, max_cells // n_pos)
+        parts = [self._run_chunk(scenarios[i:i + chunk]) for i in range(0, len(scenarios), chunk)]
+
+        result = {"names": [s.name for s in scenarios]}
+        for key in ("net_worth", "after_tax", "tax", "swr_monthly"):
+            result[key] = np.concatenate([p[key] for p in parts]) if parts else np.zeros(0)
+        allocs = np.vstack([p["allocations"] for p in parts]) if parts else np.zeros((0, len(BUCKETS)))
+        result["allocations"] = {b: allocs[:, i] for i, b in enumerate(BUCKETS)}
+        return result
+
+    def _run_chunk(self, scenarios: Sequence[Scenario]) -> Dict[str, np.ndarray]:
+        k = len(scenarios)
+
+        # 1. Shock matrices: price multipliers per symbol, FX rates per currency
+        price_mult = np.ones((k, len(self.symbols)))
+        fx_rates = np.tile(self.base_rates, (k, 1))
+        ccy_index = {c: i for i, c in enumerate(self.currencies)}
+        for row, sc in enumerate(scenarios):
+            for key, shock in sc.prices.items():
+                for i in self._price_keys.get(key, ()):
+                    price_mult[row, i] = 1.0 + shock
+            for ccy, shock in sc.fx.items():
+                if ccy in ccy_index and ccy != self.base_ccy:
+                    fx_rates[row, ccy_index[ccy]] *= 1.0 + shock
+
+        # 2. Values and cost bases in the base currency (scenarios x positions)
+        rates = fx_rates[:, self.pos_ccy]
+        values = np.nan_to_num(self.local_values * price_mult[:, self.pos_symbol] * rates)
+        costs = np.nan_to_num(self.local_costs * rates)
+
+        # 3. Tax with per-scenario settings
+        shocked = [_ShockedSettings(self.settings, sc.settings) for sc in scenarios]
+        rule_rates = np.vstack([tax_engine.rule_rates(s) for s in shocked])
+        inflation = None
+        if self._has_real_gain:
+            annual = np.array([getattr(s, 'inflation_rate', None) or 0.0 for s in shocked])
+            inflation = np.power(1.0 + annual[:, np.newaxis], self.years[np.newaxis, :]) - 1.0
+        taxes = tax_engine.apply(self.tax_plan, values, costs, rule_rates, inflation)
+
+        # 4. Aggregates (liabilities stay out of the buckets)
+        after_tax = (values - taxes).sum(axis=1)
+        swr = np.array([getattr(s, 'swr_rate', 0.04) for s in shocked])
+        return {
+            "net_worth": values.sum(axis=1),
+            "after_tax": after_tax,
+            "tax": taxes.sum(axis=1),
+            "swr_monthly": after_tax * swr / 12,
+            "allocations": np.maximum(values, 0.0) @ self.weights,
+        }
+
+
+def results_frame(result: Dict[str, np.ndarray]):
+    """One row per scenario, for display."""
+    import pandas as pd
+
+    df = pd.DataFrame({"Scenario": result["names"], "Net Worth": result["net_worth"],
+                       "After Tax": result["after_tax"], "Tax": result["tax"],
+                       "SWR / mo": result["swr_monthly"]})
+    for bucket, values in result["allocations"].items():
+        df[bucket] = values
+    return df
@@ -0,0 +1,71 @@
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Hashable, Iterable, List
+
+from .metrics import counter
+
+COALESCED = counter("portfolio_coalesced_requests_total", "Keys served by another caller's in-flight fetch", ("group",))
+
+_MISSING = object()
+
+
+class SingleFlight:
+    """
+    Per-key in-flight deduplication for batch fetchers.
+    A caller claims every requested key nobody is fetching yet and fetches
+    those as one batch; keys another caller is already fetching are awaited
+    instead of requested again. Each key has at most one outstanding upstream
+    request, however many threads (sessions, API calls) ask at once.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def do(self, keys: Iterable[Hashable], fetch: Callable[[List[Hashable]], Dict]) -> Dict:
+        """
+        {key: value} for `keys`, calling `fetch(claimed keys)` at most once.
+        Keys `fetch` leaves out are omitted here too. If the owner's fetch
+        raises, everyone waiting on its keys gets the same exception.
+        """
+        own: List[Hashable] = []
+        joined: Dict[Hashable, Future] = {}
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                fut = self._inflight.get(key)
+                if fut is None:
+                    self._inflight[key] = Future()
+                    own.append(key)
+                else:
+                    joined[key] = fut
+        if joined:
+            COALESCED.inc(len(joined), group=self.name)
+
+        results: Dict = {}
+        if own:
+            try:
+                results = dict(fetch(own))
+            except BaseException as e:
+                self._settle(own, error=e)
+                raise
+            self._settle(own, results=results)
+
+        for key, fut in joined.items():
+            value = fut.result()
+            if value is not _MISSING:
+                results[key] = value
+        return results
+
+    def _settle(self, keys: List[Hashable], results: Dict = None, error: BaseException = None):
+        with self._lock:
+            futures = [self._inflight.pop(key) for key in keys]
+        for key, fut in zip(keys, futures):
+            if error is not None:
+                fut.set_exception(error)
+            else:
+                fut.set_result(results.get(key, _MISSING))
+
+    def inflight(self) -> int:
+        with self._lock:
+            return len(self._inflight)
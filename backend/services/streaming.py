@@ -0,0 +1,197 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import time
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional
+
+from .fx import FXMatrix
+from .positions import Position
+from .valuation import apply_projections, calculate_tax
+
+logger = logging.getLogger(__name__)
+
+# A tick is {"symbol": "BTC-USD", "price": 65000.0, "ts": <epoch seconds>}
+
+
+def crypto_symbols(positions) -> List[str]:
+    """Symbols of the 24/7 positions worth streaming."""
+    return sorted({p.symbol for p in positions if p.type == 'Cryptocurrency'})
+
+
+class LocalFeed:
+    """
+    Stand-in for a websocket quote feed (tests, offline dev).
+    Replays `ticks` if given, otherwise emits a seeded random walk around
+    `start_prices` every `interval` seconds.
+    """
+
+    def __init__(self, start_prices: Dict[str, float] = None, ticks: Iterable[dict] = None,
+                 interval: float = 0.1, seed: int = 0, limit: Optional[int] = None):
+        self.start_prices = dict(start_prices or {})
+        self.ticks = list(ticks) if ticks is not None else None
+        self.interval = interval
+        self.limit = limit
+        self._rng = random.Random(seed)
+
+    async def __aiter__(self) -> AsyncIterator[dict]:
+        if self.ticks is not None:
+            for tick in self.ticks:
+                if self.interval:
+                    await asyncio.sleep(self.interval)
+                yield tick
+            return
+
+        prices = dict(self.start_prices)
+        n = 0
+        while self.limit is None or n < self.limit:
+            await asyncio.sleep(self.interval)
+            sym = self._rng.choice(list(prices))
+            prices[sym] *= 1 + self._rng.gauss(0, 0.001)
+            n += 1
+            yield {"symbol": sym, "price": prices[sym], "ts": time.time()}
+
+
+class WebSocketFeed:
+    """
+    Generic websocket quote feed. Sends `subscribe(symbols)` on connect and maps
+    each message through `parse` (returning a tick dict or None to skip).
+    Reconnects with capped backoff. Needs the optional `websockets` package.
+    """
+
+    def __init__(self, url: str, symbols: List[str],
+                 subscribe: Callable[[List[str]], dict] = None,
+                 parse: Callable[[dict], Optional[dict]] = None):
+        self.url = url
+        self.symbols = symbols
+        self.subscribe = subscribe or (lambda syms: {"type": "subscribe", "symbols": syms})
+        self.parse = parse or (lambda msg: msg if "symbol" in msg and "price" in msg else None)
+
+    async def __aiter__(self) -> AsyncIterator[dict]:
+        import websockets # Optional dependency, only needed for live streaming
+
+        delay = 1.0
+        while True:
+            try:
+                async with websockets.connect(self.url) as ws:
+                    await ws.send(json.dumps(self.subscribe(self.symbols)))
+                    delay = 1.0
+                    async for raw in ws:
+                        tick = self.parse(json.loads(raw))
+                        if tick:
+                            yield tick
+            except (OSError, websockets.WebSocketException) as e:
+                logger.warning("Quote stream disconnected (%s), retrying in %.0fs", e, delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 60.0)
+
+
+def feed_from_env(symbols: List[str], start_prices: Dict[str, float] = None):
+    """CRYPTO_FEED_URL selects a live websocket feed; otherwise the local stand-in."""
+    url = os.environ.get("CRYPTO_FEED_URL")
+    if url:
+        return WebSocketFeed(url, symbols)
+    return LocalFeed(start_prices={s: (start_prices or {}).get(s, 1.0) for s in symbols}, interval=1.0)
+
+
+class TickCoalescer:
+    """Keeps only the latest price per symbol between flushes."""
+
+    def __init__(self):
+        self._latest: Dict[str, float] = {}
+
+    def add(self, tick: dict):
+        self._latest[tick["symbol"]] = float(tick["price"])
+
+    def drain(self) -> Dict[str, float]:
+        latest, self._latest = self._latest, {}
+        return latest
+
+
+class LivePortfolio:
+    """
+    Incrementally maintained result of process_portfolio.
+    `apply(prices)` revalues only the positions quoting those symbols and
+    patches the summary totals/allocations by the difference.
+    """
+
+    def __init__(self, summary: dict, positions: List[Position], fx: FXMatrix, settings):
+        self.summary = summary
+        self.positions = positions
+        self.fx = fx
+        self.settings = settings
+        self.base_ccy = getattr(settings, 'base_currency', None) or 'ILS'
+        self._by_symbol: Dict[str, List[int]] = {}
+        for i, p in enumerate(positions):
+            self._by_symbol.setdefault(p.symbol, []).append(i)
+
+    def apply(self, prices: Dict[str, float]) -> List[Position]:
+        """Revalue affected positions. Returns the positions that changed."""
+        changed = []
+        for sym, price in prices.items():
+            for i in self._by_symbol.get(sym, ()):
+                pos = self.positions[i]
+                # Manual prices win over live quotes, same as process_portfolio
+                if pos.has_manual_price or price == pos.price:
+                    continue
+                rate = self.fx.rate(pos.currency, self.base_ccy)
+                if math.isnan(rate):
+                    # Unconvertible: stays valued at 0, as process_portfolio left it
+                    logger.warning("Skipping %s tick: no %s/%s rate", sym, pos.currency, self.base_ccy)
+                    continue
+                self._revalue(pos, price, rate)
+                changed.append(pos)
+        if changed:
+            apply_projections(self.summary, self.settings)
+        return changed
+
+    def _revalue(self, pos: Position, price: float, rate: float):
+        old_val, old_net = pos.mkt_val_ils, pos.net_after_tax
+
+        mkt_val = price * pos.quantity * rate
+        tax = calculate_tax(pos, mkt_val, pos.cost_basis_ils, self.settings)
+        pos.price, pos.mkt_val_ils, pos.tax_ils = price, mkt_val, tax
+
+        self.summary['total_net_worth'] += mkt_val - old_val
+        self.summary['total_after_tax'] += pos.net_after_tax - old_net
+        allocs = self.summary['allocations']
+        for bucket, w in pos.weights:
+            # Negative values are kept out of the buckets, as in process_portfolio
+            allocs[bucket] += (max(mkt_val, 0.0) - max(old_val, 0.0)) * w
+
+
+async def stream_quotes(feed, live: LivePortfolio, flush_interval: float = 1.0,
+                        on_update: Callable[[List[dict], dict], None] = None,
+                        on_prices: Callable[[Dict[str, float]], None] = None):
+    """
+    Consume `feed`, coalescing ticks and applying them at most once per
+    `flush_interval`. `on_prices` receives the coalesced prices (e.g. to warm
+    the quote cache); `on_update` receives (changed positions, summary).
+    """
+    coalescer = TickCoalescer()
+    last_flush = time.monotonic()
+
+    def flush():
+        prices = coalescer.drain()
+        if not prices:
+            return
+        if on_prices:
+            on_prices(prices)
+        changed = live.apply(prices)
+        if changed and on_update:
+            on_update(changed, live.summary)
+
+    try:
+        async for tick in feed:
+            coalescer.add(tick)
+            now = time.monotonic()
+            if now - last_flush >= flush_interval:
+                flush()
+                last_flush = now
+        flush()
+    except Exception:
+        # Runs as a background task: without this the stream would just stop silently
+        logger.exception("Quote stream for %d positions stopped", len(live.positions))
+        raise
@@ -1,5 +1,12 @@
+from types import SimpleNamespace
+from typing import Optional
+
+from .fx import FXMatrix
+from .metrics import TAX_SECONDS, timed
+from .tax_engine import VESTING, tax_engine
 from .valuation import get_usd_ils_rate
 
+@timed(TAX_SECONDS, function="calculate_tax_liability")
 def calculate_tax_liability(
     market_value_ils: float, 
     cost_basis_ils: float, 
@@ -10,33 +17,22 @@ def calculate_tax_liability(
     """
     Calculate tax liability based on asset type and rules.
     - Capital Gains: 25% of profit (Market - Cost).
-    - Employee Equity (RSU/GSU): Marginal Rate * Market Value (assuming vesting triggers tax event or purely income tax model).
-      *Note*: Usually RSUs are taxed at vest as income, and then subsequent gains are capital gains. 
-      For simplified logic here as requested: "set a marginal tax rate (e.g., 50%) applied to the full value upon vesting".
+    - Employee Equity (RSU/GSU): Marginal Rate * Market Value (income tax on the full value at vest).
+    Kept for callers without an Asset/Settings; evaluates the shared rule table in tax_engine.py.
     """
-    
-    
     # Auto-detect employee equity from type
     if asset_type == "GSU/RSU":
         is_employee_equity = True
+    asset = SimpleNamespace(category=VESTING if is_employee_equity else None, type=asset_type, tax_rate=None)
+    settings = SimpleNamespace(tax_rate_income=marginal_tax_rate, tax_rate_capital_gains=0.25)
+    return tax_engine.tax_for(asset, market_value_ils, cost_basis_ils, settings)
 
-    if is_employee_equity:
-        # User specified: applied to full value upon vesting
-        return market_value_ils * marginal_tax_rate
-    
-    gain = market_value_ils - cost_basis_ils
-    if gain <= 0:
-        return 0.0
-    
-    # Capital Gains Tax
-    # Israeli Gov Bonds -> 15% nominal usually, but simplifying here
-    # Cash/Deposit -> 15% or 25% depending on track, keeping 25% default
-    tax_rate = 0.25 
-    return gain * tax_rate
-
-def normalize_to_ils(amount: float, currency: str, usd_rate: float) -> float:
+def normalize_to_ils(amount: float, currency: str, usd_rate: float, fx: Optional[FXMatrix] = None) -> float:
+    """Convert to ILS. Currencies other than ILS/USD need an FX matrix."""
     if currency == "ILS":
         return amount
     elif currency == "USD":
         return amount * usd_rate
-    return amount # Default fallback
+    if fx is not None and currency in fx.index and "ILS" in fx.index:
+        return amount * fx.rate(currency, "ILS")
+    raise ValueError(f"No FX rate available to convert {currency} to ILS")
@@ -0,0 +1,211 @@
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .metrics import TAX_SECONDS, timed
+
+# Taxable base per rule
+NONE = "none"            # Not taxed (liabilities)
+VALUE = "value"          # Full market value (pension withdrawal, RSU income at vest)
+GAIN = "gain"            # Nominal gain, floored at 0
+REAL_GAIN = "real_gain"  # Gain above the inflation-adjusted cost (Israeli CPI indexation), floored at 0
+_BASES = [NONE, VALUE, GAIN, REAL_GAIN]
+
+# Pseudo-category for equity taxed at vest (no holding account yet)
+VESTING = "Vesting Equity"
+
+# Asset type for index-linked bonds (e.g. Galil series). Only these get REAL_GAIN;
+# "Israeli Gov Bond" / "Israeli Corporate Bond" are nominal unless marked so.
+CPI_LINKED = "CPI-Linked Bond"
+
+# Settings defaults for rate names, so duck-typed settings objects work too
+SETTINGS_DEFAULTS = {"tax_rate_capital_gains": 0.25, "tax_rate_income": 0.50, "inflation_rate": 0.0}
+
+
+class TaxRule:
+    """
+    One row of the tax table; first match wins.
+    - category / types: conditions (None = any).
+    - basis: NONE, VALUE, GAIN or REAL_GAIN.
+    - rate: a fixed rate, or the name of a Settings field (e.g. "tax_rate_capital_gains").
+    - allow_override: whether Asset.tax_rate replaces `rate`.
+    """
+
+    def __init__(self, basis: str, rate: Union[float, str] = 0.0, category: Optional[str] = None,
+                 types: Sequence[str] = (), allow_override: bool = True, note: str = ""):
+        assert basis in _BASES, basis
+        self.basis = basis
+        self.rate = rate
+        self.category = category
+        self.types = tuple(types)
+        self.allow_override = allow_override
+        self.note = note
+
+    def matches(self, category: Optional[str], type_: Optional[str]) -> bool:
+        return (self.category is None or self.category == category) and (not self.types or type_ in self.types)
+
+    def resolve_rate(self, settings) -> float:
+        if isinstance(self.rate, str):
+            value = getattr(settings, self.rate, None)
+            return SETTINGS_DEFAULTS.get(self.rate, 0.0) if value is None else float(value)
+        return float(self.rate)
+
+
+TAX_RULES: List[TaxRule] = [
+    TaxRule(NONE, category="Future Needs", note="Liabilities carry no tax"),
+    TaxRule(VALUE, 0.25, category="Pension", note="Early withdrawal, flat on the whole balance"),
+    TaxRule(GAIN, "tax_rate_capital_gains", category="Work", note="Post-vest holding (Section 102 capital track)"),
+    TaxRule(VALUE, "tax_rate_income", category=VESTING, allow_override=False,
+            note="Employee equity at vest: income tax on the full value"),
+    TaxRule(REAL_GAIN, "tax_rate_capital_gains", types=[CPI_LINKED],
+            note="CPI-linked: only the real gain is taxed (nominal Shekel bonds fall through to GAIN)"),
+    TaxRule(GAIN, "tax_rate_capital_gains", note="Capital gains (bank, brokerage, funds, crypto)"),
+]
+
+# GSU grant modes: flat blended rates, or the Section 102 split
+GSU_BLENDED_RATES = {"Average": 0.35, "Current": 0.45, "Optimized": 0.30}
+SECTION_102 = "Section 102"
+
+
+def years_held(acquired: Sequence[Optional[datetime]], as_of: Optional[datetime] = None) -> np.ndarray:
+    """Holding period in years per position (0 where the date is unknown)."""
+    as_of = as_of or datetime.utcnow()
+    years = np.array([(as_of - d).days / 365.25 if d else 0.0 for d in acquired], dtype=float)
+    return np.maximum(years, 0.0)
+
+
+def cumulative_inflation(acquired: Sequence[Optional[datetime]], annual_rate: float,
+                         as_of: Optional[datetime] = None) -> np.ndarray:
+    """(1 + annual_rate) ** years_held - 1 per position (0 where the date is unknown)."""
+    if not annual_rate:
+        return np.zeros(len(acquired))
+    return np.power(1.0 + annual_rate, years_held(acquired, as_of)) - 1.0
+
+
+class TaxPlan(NamedTuple):
+    idx: np.ndarray           # rule index per position (-1 = unmatched)
+    basis_codes: np.ndarray   # index into _BASES per position
+    has_override: np.ndarray  # Asset.tax_rate applies
+    overrides: np.ndarray     # Asset.tax_rate (NaN if unset)
+
+
+class TaxEngine:
+    """
+    Table-driven tax evaluation shared by valuation, streaming and the GSU view.
+    `evaluate` works on whole arrays: rules are resolved once per distinct
+    (category, type) pair, then the tax is a handful of numpy operations.
+    """
+
+    def __init__(self, rules: List[TaxRule]):
+        self.rules = rules
+        self._lookup: Dict[Tuple[Optional[str], Optional[str]], int] = {}
+
+    def rule_index(self, category: Optional[str], type_: Optional[str]) -> int:
+        key = (category, type_)
+        idx = self._lookup.get(key)
+        if idx is None:
+            idx = next((i for i, r in enumerate(self.rules) if r.matches(category, type_)), -1)
+            self._lookup[key] = idx
+        return idx
+
+    def rule_for(self, category: Optional[str], type_: Optional[str]) -> Optional[TaxRule]:
+        idx = self.rule_index(category, type_)
+        return self.rules[idx] if idx >= 0 else None
+
+    def prepare(self, categories: Sequence[Optional[str]], types: Sequence[Optional[str]],
+                overrides: Sequence[Optional[float]]) -> "TaxPlan":
+        """Resolve the rule for each position once; the plan can be applied to many value sets."""
+        n = len(categories)
+        idx = np.fromiter((self.rule_index(c, t) for c, t in zip(categories, types)), dtype=np.intp, count=n)
+        # Unmatched positions (-1) map to an extra untaxed slot at the end
+        basis_codes = np.array([_BASES.index(r.basis) for r in self.rules] + [0], dtype=np.intp)[idx]
+        overridable = np.array([r.allow_override for r in self.rules] + [False])[idx]
+        ovr = np.array([o if o else np.nan for o in overrides], dtype=float)
+        return TaxPlan(idx, basis_codes, overridable & ~np.isnan(ovr), ovr)
+
+    def rule_rates(self, settings) -> np.ndarray:
+        """Rate per rule under `settings` (plus the untaxed slot)."""
+        return np.array([r.resolve_rate(settings) for r in self.rules] + [0.0])
+
+    @staticmethod
+    def apply(plan: "TaxPlan", mkt_vals, cost_bases, rule_rates, inflation=None) -> np.ndarray:
+        """
+        Tax for a prepared plan. Broadcasts: `mkt_vals`/`cost_bases` may be
+        (positions,) or (scenarios, positions), with `rule_rates` (rules,) or
+        (scenarios, rules) to match.
+        """
+        mkt = np.asarray(mkt_vals, dtype=float)
+        cost = np.asarray(cost_bases, dtype=float)
+        rates = np.where(plan.has_override, plan.overrides, np.asarray(rule_rates)[..., plan.idx])
+
+        gain = np.maximum(mkt - cost, 0.0)
+        if inflation is not None:
+            real_gain = np.maximum(mkt - cost * (1.0 + np.asarray(inflation, dtype=float)), 0.0)
+        else:
+            real_gain = gain
+        base = np.select([plan.basis_codes == 1, plan.basis_codes == 2, plan.basis_codes == 3],
+                         [mkt, gain, real_gain], 0.0)
+        return base * rates
+
+    @timed(TAX_SECONDS, function="tax_engine")
+    def evaluate(self, categories: Sequence[Optional[str]], types: Sequence[Optional[str]],
+                 overrides: Sequence[Optional[float]], mkt_vals, cost_bases, settings,
+                 inflation=None) -> np.ndarray:
+        """
+        Tax per position (same currency as the inputs).
+        - overrides: Asset.tax_rate per position (None/0 = use the rule's rate).
+        - inflation: cumulative CPI change since purchase per position (REAL_GAIN rules).
+        """
+        if len(categories) == 0:
+            return np.zeros(0)
+        plan = self.prepare(categories, types, overrides)
+        return self.apply(plan, mkt_vals, cost_bases, self.rule_rates(settings), inflation)
+
+    def tax_for(self, asset, mkt_val: float, cost_basis: float, settings, inflation: Optional[float] = None,
+                as_of: Optional[datetime] = None) -> float:
+        """
+        Scalar path for single positions (streamed ticks), same rules as `evaluate`.
+        REAL_GAIN cost is indexed like `evaluate_assets` unless `inflation` is given.
+        """
+        rule = self.rule_for(asset.category, asset.type)
+        if rule is None or rule.basis == NONE:
+            return 0.0
+        rate = asset.tax_rate if (rule.allow_override and asset.tax_rate) else rule.resolve_rate(settings)
+        if rule.basis == VALUE:
+            return mkt_val * rate
+        adjusted_cost = cost_basis
+        if rule.basis == REAL_GAIN:
+            if inflation is None:
+                annual = getattr(settings, "inflation_rate", None) or 0.0
+                inflation = cumulative_inflation([getattr(asset, "date_acquired", None)], annual, as_of)[0]
+            adjusted_cost = cost_basis * (1.0 + inflation)
+        return max(mkt_val - adjusted_cost, 0.0) * rate
+
+    def evaluate_assets(self, assets, mkt_vals, cost_bases, settings, as_of: Optional[datetime] = None) -> np.ndarray:
+        """`evaluate` for a list of Asset-like objects (uses settings.inflation_rate for REAL_GAIN)."""
+        annual = getattr(settings, "inflation_rate", None) or 0.0
+        inflation = None
+        if annual:
+            inflation = cumulative_inflation([getattr(a, "date_acquired", None) for a in assets], annual, as_of)
+        return self.evaluate([a.category for a in assets], [a.type for a in assets],
+                             [a.tax_rate for a in assets], mkt_vals, cost_bases, settings, inflation)
+
+    def gsu_tax(self, units, current_price: float, grant_prices, settings) -> np.ndarray:
+        """
+        Tax per grant for settings.gsu_tax_mode.
+        - Blended modes apply a flat rate to the gross value.
+        - Section 102 (capital track): value up to the grant price is income,
+          the rest is capital gains.
+        """
+        gross = np.asarray(units, dtype=float) * current_price
+        mode = getattr(settings, "gsu_tax_mode", "Average")
+        if mode == SECTION_102:
+            income_rate = getattr(settings, "tax_rate_income", None) or SETTINGS_DEFAULTS["tax_rate_income"]
+            cg_rate = getattr(settings, "tax_rate_capital_gains", None) or SETTINGS_DEFAULTS["tax_rate_capital_gains"]
+            income_part = np.minimum(np.asarray(units, dtype=float) * np.asarray(grant_prices, dtype=float), gross)
+            return income_part * income_rate + (gross - income_part) * cg_rate
+        return gross * GSU_BLENDED_RATES.get(mode, 0.0)
+
+
+tax_engine = TaxEngine(TAX_RULES)
@@ -0,0 +1,215 @@
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .cashflow import HORIZON_MONTHS, LIABILITY_CATEGORY, REAL_RETURN
+from .tax_engine import _BASES, GAIN, REAL_GAIN, VALUE, tax_engine
+
+
+class Pool(NamedTuple):
+    """One account to draw from: a location with a single tax treatment (values in the base currency)."""
+    name: str
+    value: float
+    cost: float
+    basis: str  # tax_engine basis: VALUE, GAIN, REAL_GAIN or NONE
+    rate: float
+
+
+def build_pools(positions, settings) -> List[Pool]:
+    """
+    Group positions into withdrawable pools by location and tax treatment
+    (same rule table as process_portfolio). Liabilities are left out. A pool
+    is taxed on its aggregate gain, so per-position loss floors are not modelled.
+    """
+    held = [p for p in positions if p.category != LIABILITY_CATEGORY and p.mkt_val_ils > 0]
+    if not held:
+        return []
+    plan = tax_engine.prepare([p.category for p in held], [p.type for p in held], [p.tax_rate for p in held])
+    rates = np.where(plan.has_override, plan.overrides, tax_engine.rule_rates(settings)[plan.idx])
+
+    groups: Dict[Tuple[str, str, float], List[float]] = {}
+    for p, code, rate in zip(held, plan.basis_codes.tolist(), rates.tolist()):
+        totals = groups.setdefault((p.category or p.type, _BASES[code], round(rate, 4)), [0.0, 0.0])
+        totals[0] += p.mkt_val_ils
+        totals[1] += p.cost_basis_ils
+
+    per_location: Dict[str, int] = {}
+    for location, _, _ in groups:
+        per_location[location] = per_location.get(location, 0) + 1
+    pools = []
+    for (location, basis, rate), (value, cost) in sorted(groups.items(), key=lambda kv: -kv[1][0]):
+        name = location
+        if per_location[location] > 1:
+            name += " (CPI-linked)" if basis == REAL_GAIN else f" ({rate:.0%} {basis.replace('_', ' ')})"
+        pools.append(Pool(name, value, cost, basis, rate))
+    return pools
+
+
+class WithdrawalOptimizer:
+    """
+    Finds the order in which to drain pools so a constant after-tax monthly
+    spend lasts the whole horizon, and compares it with pro-rata withdrawals
+    (every pool sold down at the same pace, i.e. drawing from total_after_tax).
+
+    Model (today's money):
+    - Each pool grows at its real return and is taxed on withdrawal per its
+      rule: VALUE on the whole amount, GAIN on value minus the nominal cost
+      (which inflation erodes in real terms), REAL_GAIN on value minus the
+      indexed cost.
+    - Withdrawals sell a pool pro rata to its cost (average cost basis), so a
+      pool's state is just the fraction left, and a unit of it sold in month
+      t is worth net[p, t] after tax.
+    - Drawing s a month from pool p between months a and b uses
+      s * (D[p, b] - D[p, a]) of it, with D the running sum of 1 / net.
+
+    If pools are drained one after another, the untouched pools are the same
+    whatever order the drained ones went in. So the latest month a set of
+    pools can last is a memoized DP over subsets:
+    last(S) = max over p in S of drain(p, starting at last(S - {p})).
+    That is 2^k * k cheap steps per spending level instead of k! orders. The
+    best sustainable spend is then found by bisection on s. Pro rata has a
+    closed form: s = 1 / D_total[horizon].
+    """
+
+    def __init__(self, pools: Sequence[Pool], settings=None, horizon_months: int = HORIZON_MONTHS,
+                 real_return: float = REAL_RETURN, returns: Optional[Dict[str, float]] = None,
+                 start_month: int = 0):
+        self.pools = [p for p in pools if p.value > 0]
+        self.horizon = horizon_months
+        self.start_month = start_month
+        t = start_month + np.arange(horizon_months + 1)
+        inflation = (getattr(settings, 'inflation_rate', None) or 0.0) if settings is not None else 0.0
+        deflator = (1.0 + inflation) ** (-t / 12)
+
+        k = len(self.pools)
+        self.gross = np.zeros((k, horizon_months + 1))
+        self.net = np.zeros((k, horizon_months + 1))
+        for i, p in enumerate(self.pools):
+            value = p.value * (1.0 + (returns or {}).get(p.name, real_return)) ** (t / 12)
+            if p.basis == VALUE:
+                taxable = value
+            elif p.basis == GAIN:
+                taxable = np.maximum(value - p.cost * deflator, 0.0)
+            elif p.basis == REAL_GAIN:
+                taxable = np.maximum(value - p.cost, 0.0)
+            else:
+                taxable = np.zeros_like(value)
+            self.gross[i] = value
+            self.net[i] = value - taxable * p.rate
+        self.months = np.arange(horizon_months + 1, dtype=float)
+        # Fraction of each pool (and of all pools sold together) used per 1 of monthly spending, cumulated
+        self.draw = np.hstack([np.zeros((k, 1)), np.cumsum(1.0 / self.net[:, :-1], axis=1)])
+        self.draw_total = np.concatenate(([0.0], np.cumsum(1.0 / self.net[:, :-1].sum(axis=0))))
+
+    def _drain(self, i: int, start: float, spend: float) -> float:
+        """Month at which pool i runs out if it alone funds `spend` a month from month `start`."""
+        if start >= self.horizon:
+            return start
+        draw = self.draw[i]
+        target = float(np.interp(start, self.months, draw)) + 1.0 / spend
+        if target >= draw[-1]:
+            return float("inf")
+        return float(np.interp(target, draw, self.months))
+
+    def sequence(self, spend: float) -> Tuple[float, Tuple[int, ...]]:
+        """(month the money runs out, pool order) for the best sequential drain at `spend` a month."""
+        k = len(self.pools)
+
+        @lru_cache(maxsize=None)
+        def last(mask: int) -> Tuple[float, Tuple[int, ...]]:
+            if mask == 0:
+                return 0.0, ()
+            best = (-1.0, ())
+            for i in range(k):
+                if mask >> i & 1:
+                    start, order = last(mask & ~(1 << i))
+                    stop = self._drain(i, start, spend)
+                    if stop > best[0]:
+                        best = (stop, order + (i,))
+            return best
+
+        return last((1 << k) - 1)
+
+    def pro_rata_spending(self) -> float:
+        return 1.0 / self.draw_total[-1] if len(self.pools) else 0.0
+
+    def optimal_spending(self, rel_tol: float = 1e-7) -> Tuple[float, Tuple[int, ...]]:
+        """Highest monthly spend some drain order sustains for the whole horizon, and that order."""
+        if not self.pools:
+            return 0.0, ()
+        lo = 0.0
+        hi = self.net.max(axis=1).sum() / self.horizon # Every pool sold at its best month
+        order = tuple(range(len(self.pools)))
+        while hi - lo > rel_tol * hi:
+            mid = (lo + hi) / 2
+            end, mid_order = self.sequence(mid)
+            if end >= self.horizon:
+                lo, order = mid, mid_order
+            else:
+                hi = mid
+        return lo, order
+
+    def _shares(self, order: Sequence[int], spend: float) -> np.ndarray:
+        """(pools x months) fraction of each month's spending funded by each pool."""
+        shares = np.zeros((len(self.pools), self.horizon))
+        start = 0.0
+        for i in order:
+            stop = min(self._drain(i, start, spend), self.horizon)
+            # Overlap of [start, stop) with every month [m, m + 1)
+            shares[i] = np.clip(np.minimum(self.months[1:], stop) - np.maximum(self.months[:-1], start), 0.0, 1.0)
+            start = stop
+        return shares
+
+    def optimize(self) -> Dict:
+        """
+        Returns pools, order (pool names, or () when pro rata is as good),
+        spending_monthly and pro_rata_monthly (after tax), gain (relative
+        spending increase), intervals [(pool, first month, last month)],
+        after_tax and tax (pools x months) for the chosen plan, lifetime_tax,
+        and tax_rate / pro_rata_tax_rate (tax as a share of gross withdrawals;
+        the absolute tax is not comparable since the spending differs).
+        """
+        pro_rata = self.pro_rata_spending()
+        spend, order = self.optimal_spending()
+        ratio = self.gross[:, :-1] / self.net[:, :-1]
+
+        total_net = self.net[:, :-1].sum(axis=0)
+        pro_rata_shares = self.net[:, :-1] / total_net if len(self.pools) else np.zeros((0, self.horizon))
+        pro_rata_tax = float((pro_rata * pro_rata_shares * (ratio - 1.0)).sum())
+        pro_rata_gross = pro_rata * self.horizon + pro_rata_tax
+
+        if spend <= pro_rata:
+            # Selling everything together is at least as good: report it as the plan
+            spend, order, shares = pro_rata, (), pro_rata_shares
+            intervals = [(p.name, 0.0, float(self.horizon)) for p in self.pools]
+        else:
+            shares = self._shares(order, spend)
+            intervals, start = [], 0.0
+            for i in order:
+                stop = min(self._drain(i, start, spend), self.horizon)
+                intervals.append((self.pools[i].name, start, stop))
+                start = stop
+        after_tax = spend * shares
+        tax = after_tax * (ratio - 1.0)
+        lifetime_tax = float(tax.sum())
+        return {
+            "pools": self.pools,
+            "order": tuple(self.pools[i].name for i in order),
+            "spending_monthly": float(spend),
+            "pro_rata_monthly": float(pro_rata),
+            "gain": float(spend / pro_rata - 1.0) if pro_rata else 0.0,
+            "intervals": intervals,
+            "after_tax": after_tax,
+            "tax": tax,
+            "lifetime_tax": lifetime_tax,
+            "tax_rate": float(lifetime_tax / (after_tax.sum() + lifetime_tax)) if lifetime_tax else 0.0,
+            "pro_rata_tax_rate": float(pro_rata_tax / pro_rata_gross) if pro_rata_tax else 0.0,
+        }
+
+
+def optimize_withdrawals(positions, settings, horizon_months: int = HORIZON_MONTHS, real_return: float = REAL_RETURN,
+                         start_month: int = 0) -> Dict:
+    """Pools from valued positions, then WithdrawalOptimizer.optimize()."""
+    return WithdrawalOptimizer(build_pools(positions, settings), settings, horizon_months, real_return,
+                               start_month=start_month).optimize()
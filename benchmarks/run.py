@@ -0,0 +1,423 @@
+"""
+Benchmark suite.
+
+    python -m benchmarks.run                      # default sizes
+    python -m benchmarks.run --sizes 10 1000 1000000 --users 100
+    python -m benchmarks.run --only process_portfolio calculate_tax
+    python -m benchmarks.run --compare benchmarks/results/<previous>.json
+
+Everything runs offline against a throwaway SQLite file and synthetic data
+from scripts/seed_portfolio.py, so results are comparable run to run.
+Results are written to benchmarks/results/<timestamp>.json.
+"""
+import os
+import sys
+import tempfile
+
+# Must be set before backend.database is imported anywhere
+_TMP_DIR = tempfile.mkdtemp(prefix="portfolio-bench-")
+os.environ.setdefault("PORTFOLIO_DB", os.path.join(_TMP_DIR, "bench.db"))
+os.environ.setdefault("PORTFOLIO_OFFLINE", "1")
+os.environ.setdefault("PORTFOLIO_METRICS", "0")
+
+import argparse
+import json
+import logging
+import platform
+import statistics
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from backend.database import engine
+from backend.models import Asset, Settings
+from backend.services.fx import FXMatrix
+from backend.services.gsu_calculator import calculate_gsu_tax
+from backend.services.providers import parse_bizportal_html
+from backend.services.valuation import calculate_tax, process_portfolio
+from scripts.seed_portfolio import generate_portfolio, seed_synthetic, synthetic_prices
+from sqlmodel import select
+
+# The app engine echoes SQL; keep benchmark output readable
+engine.echo = False
+logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
+
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+BENCHMARKS: Dict[str, Callable] = {}
+
+
+def benchmark(func):
+    BENCHMARKS[func.__name__.replace("bench_", "")] = func
+    return func
+
+
+def measure(fn: Callable, repeat: int = 5, min_time: float = 0.2) -> Dict[str, float]:
+    """Time `fn` (looping fast calls until `min_time`) and return per-call stats in ms."""
+    fn() # warm-up
+    start = time.perf_counter()
+    fn()
+    single = time.perf_counter() - start
+    loops = max(1, int(min_time / single)) if single < min_time else 1
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        samples.append((time.perf_counter() - start) / loops * 1000)
+    return {"min_ms": min(samples), "median_ms": statistics.median(samples), "loops": loops, "repeat": repeat}
+
+
+# --- Benchmarks (each returns a list of result rows) ---
+
+@benchmark
+def bench_process_portfolio(sizes: List[int], users: int) -> List[dict]:
+    rows = []
+    fx = FXMatrix({"USD": 1.0, "ILS": 3.7})
+    for n in sizes:
+        assets, _, settings = generate_portfolio(n, 1)
+        prices = synthetic_prices(assets)
+        stats = measure(lambda: process_portfolio(assets, prices, fx, settings[1]), repeat=3 if n >= 100000 else 5)
+        rows.append({"positions": n, **stats, "us_per_position": stats["min_ms"] * 1000 / n})
+    return rows
+
+
+@benchmark
+def bench_position_memory(sizes: List[int], users: int) -> List[dict]:
+    """Bytes held per position by process_portfolio output, vs the old dict-per-position shape."""
+    rows = []
+    fx = FXMatrix({"USD": 1.0, "ILS": 3.7})
+    for n in sizes:
+        if n > 100000:
+            continue # tracemalloc makes this slow; 100k is representative
+        assets, _, settings = generate_portfolio(n, 1)
+        prices = synthetic_prices(assets)
+
+        tracemalloc.start()
+        _, positions = process_portfolio(assets, prices, fx, settings[1])
+        records = tracemalloc.get_traced_memory()[0]
+        # Former layout: engine dict holding the ORM object + the UI's flattened copy
+        legacy = [{'asset': a, 'symbol': p.symbol, 'price': p.price, 'mkt_val_ils': p.mkt_val_ils * 1.0,
+                   'cost_basis_ils': p.cost_basis_ils * 1.0, 'tax_ils': p.tax_ils * 1.0, 'net_after_tax': p.net_after_tax}
+                  for a, p in zip(assets, positions)]
+        legacy_ui = [{'id': a.id, 'name': a.name, 'ticker': a.ticker, 'type': a.category, 'qty': a.quantity,
+                      'price': p.price, 'val_ils': p.mkt_val_ils * 1.0, 'currency': a.currency, 'cpu': a.cost_per_unit,
+                      'net_after_tax': p.net_after_tax * 1.0, 'gain_pct': p.gain_pct}
+                     for a, p in zip(assets, positions)]
+        legacy_bytes = tracemalloc.get_traced_memory()[0] - records
+        tracemalloc.stop()
+        del legacy, legacy_ui
+        rows.append({"positions": n, "bytes_per_position": records / max(n, 1),
+                     "legacy_bytes_per_position": legacy_bytes / max(n, 1)})
+    return rows
+
+
+@benchmark
+def bench_ledger_replay(sizes: List[int], users: int) -> List[dict]:
+    """Rebuilding positions from 10 years of monthly transactions: snapshots vs a full scan."""
+    import random
+    from sqlmodel import Session
+    from backend.database import create_db_and_tables
+    from backend.models import Transaction
+    from backend.services import ledger
+
+    rows = []
+    create_db_and_tables()
+    for n in [s for s in sizes if s <= 10000] or [1000]:
+        seed_synthetic(n, 1)
+        rng = random.Random(n)
+        kinds = [ledger.BUY, ledger.BUY, ledger.SELL, ledger.DIVIDEND]
+        with Session(engine) as session:
+            ids = [a.id for a in session.exec(select(Asset)).all()]
+            txns = [{"user_id": 1, "asset_id": a, "kind": rng.choice(kinds), "quantity": rng.uniform(0.1, 5),
+                     "amount": rng.uniform(10, 1000), "trade_date": datetime(2015, 1, 1) + timedelta(days=30.4 * m)}
+                    for a in ids for m in range(120)]
+            for i in range(0, len(txns), 50000):
+                session.connection().execute(Transaction.__table__.insert(), txns[i:i + 50000])
+            session.commit()
+            snapshots = ledger.rebuild_snapshots(session)
+            mid = datetime(2020, 6, 1)
+            for label, as_of in (("now", None), ("2020-06", mid)):
+                fast = measure(lambda: ledger.positions_at(session, ids, as_of), repeat=3, min_time=0)
+                full = measure(lambda: ledger.positions_at(session, ids, as_of, use_snapshots=False), repeat=3, min_time=0)
+                rows.append({"accounts": n, "transactions": len(txns), "snapshots": snapshots, "as_of": label,
+                             **fast, "full_scan_ms": full["min_ms"], "speedup": full["min_ms"] / fast["min_ms"]})
+    return rows
+
+
+@benchmark
+def bench_revaluation(sizes: List[int], users: int) -> List[dict]:
+    """Batch revaluation of `size` users (3 positions each) on 1, 2 and 4 worker processes."""
+    from backend.database import create_db_and_tables
+    from backend.services.revaluation import revalue, take_snapshot
+
+    rows = []
+    create_db_and_tables()
+    for n in sizes:
+        seed_synthetic(n * 3, n)
+        snapshot = take_snapshot(engine)
+        base = None
+        for workers in (1, 2, 4):
+            run = revalue(engine, workers=workers, snapshot=snapshot)
+            base = base or run.seconds
+            rows.append({"users": run.users, "positions": run.positions, "workers": workers, "cpus": os.cpu_count(),
+                         "seconds": run.seconds, "users_per_s": run.users / run.seconds, "speedup": base / run.seconds})
+    return rows
+
+
+@benchmark
+def bench_calculate_tax(sizes: List[int], users: int) -> List[dict]:
+    rows = []
+    settings = Settings(user_id=1)
+    for n in sizes:
+        assets, _, _ = generate_portfolio(n, 1)
+        vals = [(a, a.cost_basis * 1.3, a.cost_basis) for a in assets]
+        stats = measure(lambda: [calculate_tax(a, v, c, settings) for a, v, c in vals])
+        rows.append({"positions": n, **stats})
+    return rows
+
+
+@benchmark
+def bench_calculate_gsu_tax(sizes: List[int], users: int) -> List[dict]:
+    _, grants, settings = generate_portfolio(0, max(users, 250))
+    stats = measure(lambda: [calculate_gsu_tax(g, 175.0, settings[g.user_id]) for g in grants])
+    return [{"grants": len(grants), **stats}]
+
+
+@benchmark
+def bench_bizportal_parse(sizes: List[int], users: int) -> List[dict]:
+    with open(os.path.join(ROOT, "bizportal.html"), "rb") as f:
+        html = f.read()
+    stats = measure(lambda: parse_bizportal_html(html))
+    return [{"page_bytes": len(html), **stats}]
+
+
+@benchmark
+def bench_asset_crud(sizes: List[int], users: int) -> List[dict]:
+    from fastapi.testclient import TestClient
+    from backend.main import app
+    from backend.database import create_db_and_tables
+
+    seed_synthetic(max(sizes[0], 10) if sizes else 100, users)
+    create_db_and_tables()
+    client = TestClient(app)
+    payload = {"user_id": 1, "type": "Stock", "ticker": "VOO", "quantity": 1.0, "currency": "USD"}
+    created = []
+
+    def create():
+        created.append(client.post("/assets/", json=payload).json()["id"])
+
+    rows = [{"op": "create", **measure(create, repeat=3)}]
+    rows.append({"op": "list", **measure(lambda: client.get("/assets/", params={"user_id": 1}), repeat=3)})
+    rows.append({"op": "delete", **measure(lambda: client.delete(f"/assets/{created.pop()}"), repeat=3, min_time=0)})
+    return rows
+
+
+@benchmark
+def bench_table_fragments(sizes: List[int], users: int) -> List[dict]:
+    """Dashboard HTML tables: first render vs a memoized rerun, and the payload size."""
+    from backend.services.fragments import allocation_table, fragment_cache, gsu_table, rebalancing_table
+
+    _, grants, _ = generate_portfolio(0, max(users, 1))
+    groups = {}
+    for g in grants:
+        d = groups.setdefault((g.grant_date, g.grant_price), {"grant_date": g.grant_date, "grant_price": g.grant_price,
+                                                             "vest_date": g.vest_date, "total": 0, "vested": 0, "unvested": 0})
+        d["total"] += g.units
+        d["vested" if g.is_vested else "unvested"] += g.units
+    groups = list(groups.values())
+    allocs = {"US Stocks": 1.2e6, "IL Stocks": 4e5, "Bonds": 3e5, "Cash": 1e5, "Crypto": 5e4, "Work": 2.5e5}
+    targets = {"US Stocks": 35.0, "IL Stocks": 15.0, "Work": 10.0, "Crypto": 5.0, "Bonds": 20.0, "Cash": 15.0}
+    tables = {
+        "allocation": lambda: allocation_table(allocs, targets, 2.3e6, list(allocs)),
+        "rebalancing": lambda: rebalancing_table(allocs, targets, 2.3e6, list(allocs)),
+        "gsu": lambda: gsu_table(groups, 175.0),
+    }
+
+    def cold(render):
+        fragment_cache.clear()
+        return render()
+
+    rows = []
+    for name, render in tables.items():
+        first = measure(lambda: cold(render))
+        hit = measure(render)
+        rows.append({"table": name, "rows": len(groups) if name == "gsu" else len(allocs), "bytes": len(render().encode()),
+                     **hit, "first_render_ms": first["min_ms"], "speedup": first["min_ms"] / hit["min_ms"]})
+    return rows
+
+
+@benchmark
+def bench_downsample(sizes: List[int], users: int) -> List[dict]:
+    """History charts: downsampling time and Plotly payload, raw vs display resolution."""
+    import numpy as np
+    import plotly.graph_objects as go
+    from backend.services.downsample import METHODS, display_points
+
+    rows = []
+    n_out = display_points()
+    for n in sizes:
+        rng = np.random.default_rng(n)
+        days = np.datetime64("1990-01-01") + np.arange(n)
+        y = 1e6 * np.exp(np.cumsum(rng.normal(0.0002, 0.01, n)))
+        raw_bytes = len(go.Figure(go.Scatter(x=days, y=y)).to_json())
+        for method, pick in METHODS.items():
+            stats = measure(lambda: pick(days.astype(np.int64), y, n_out), repeat=3)
+            idx = pick(days.astype(np.int64), y, n_out)
+            rows.append({"days": n, "method": method, "points": len(idx), **stats, "raw_bytes": raw_bytes,
+                         "bytes": len(go.Figure(go.Scatter(x=days[idx], y=y[idx])).to_json())})
+    return rows
+
+
+@benchmark
+def bench_cashflow_plan(sizes: List[int], users: int) -> List[dict]:
+    """40-year monthly cash-flow plan: one-off setup from the portfolio, then a rerun per input change."""
+    from backend.services.cashflow import CashFlowPlanner
+
+    rows = []
+    fx = FXMatrix({"USD": 1.0, "ILS": 3.7})
+    for n in sizes:
+        assets, grants, settings = generate_portfolio(n, 1)
+        for i, a in enumerate(assets):
+            if a.category == "Future Needs":
+                a.due_date = datetime(2027 + i % 30, 1 + i % 12, 1)
+        settings = settings[1]
+        settings.monthly_contribution, settings.retirement_year = 15000.0, 2040
+        _, positions = process_portfolio(assets, synthetic_prices(assets), fx, settings)
+        setup = measure(lambda: CashFlowPlanner(positions, grants, settings, gsu_price=180.0, usd_rate=3.7), repeat=3)
+        planner = CashFlowPlanner(positions, grants, settings, gsu_price=180.0, usd_rate=3.7)
+        rows.append({"positions": n, **measure(lambda: planner.run(real_return=0.04)), "setup_ms": setup["min_ms"]})
+    return rows
+
+
+@benchmark
+def bench_withdrawal_order(sizes: List[int], users: int) -> List[dict]:
+    """Tax-aware drain order vs pro-rata: optimizer time, pool count and spending gain."""
+    from backend.services.withdrawals import WithdrawalOptimizer, build_pools
+
+    rows = []
+    fx = FXMatrix({"USD": 1.0, "ILS": 3.7})
+    for n in sizes:
+        assets, _, settings = generate_portfolio(n, 1)
+        settings = settings[1]
+        settings.inflation_rate = 0.02
+        _, positions = process_portfolio(assets, synthetic_prices(assets), fx, settings)
+        pools = build_pools(positions, settings)
+        stats = measure(lambda: WithdrawalOptimizer(pools, settings).optimize(), repeat=3)
+        plan = WithdrawalOptimizer(pools, settings).optimize()
+        rows.append({"positions": n, "pools": len(pools), **stats, "gain_pct": plan["gain"] * 100,
+                     "tax_rate_pct": plan["tax_rate"] * 100, "pro_rata_tax_rate_pct": plan["pro_rata_tax_rate"] * 100})
+    return rows
+
+
+@benchmark
+def bench_yahoo_quotes(sizes: List[int], users: int) -> List[dict]:
+    """
+    Last prices for N symbols from the local market stand-in (20 ms per request):
+    per-symbol chart requests vs spark chunks, sequential and through the
+    provider router (parallel chunks, with and without the default rate limit).
+    """
+    from backend.services import providers
+    from backend.services.providers import PriceRouter, YahooProvider, fetch_yahoo_chart_prices, fetch_yahoo_spark_prices
+    from scripts.market_server import MarketServer, Recordings, serve_in_thread
+
+    srv = MarketServer(("127.0.0.1", 0), Recordings(os.path.join(_TMP_DIR, "market")), latency=0.02, synthesize=True)
+    serve_in_thread(srv)
+    base_url, providers.YAHOO_BASE_URL = providers.YAHOO_BASE_URL, srv.url
+    paths = {
+        "chart_per_symbol": lambda symbols: fetch_yahoo_chart_prices(symbols, base_url=srv.url),
+        "spark_sequential": lambda symbols: fetch_yahoo_spark_prices(symbols, base_url=srv.url),
+        "spark_parallel": lambda symbols: PriceRouter({"yahoo": YahooProvider()}, [], ["yahoo"]).fetch(symbols),
+        # Same, without the rate limit: what the concurrency alone buys
+        "spark_parallel_unlimited": lambda symbols: PriceRouter(
+            {"yahoo": YahooProvider(rate_per_sec=None)}, [], ["yahoo"]).fetch(symbols),
+    }
+    rows = []
+    try:
+        for n in [s for s in sizes if s <= 2000] or [500]:
+            symbols = [f"SYM{i:04d}" for i in range(n)]
+            for name, fetch in paths.items():
+                before = dict(srv.stats)
+                start = time.perf_counter()
+                prices = fetch(symbols)
+                elapsed = (time.perf_counter() - start) * 1000
+                rows.append({"symbols": n, "path": name, "resolved": len(prices), "ms": elapsed,
+                             "requests": srv.stats["requests"] - before["requests"],
+                             "bytes": srv.stats["bytes"] - before["bytes"]})
+    finally:
+        providers.YAHOO_BASE_URL = base_url
+        srv.shutdown()
+        srv.server_close()
+    return rows
+
+
+@benchmark
+def bench_dashboard_render(sizes: List[int], users: int) -> List[dict]:
+    from streamlit.testing.v1 import AppTest
+
+    rows = []
+    # The dashboard draws one widget row per position; keep sizes UI-realistic
+    for n in [s for s in sizes if s <= 1000] or [100]:
+        seed_synthetic(n, 1)
+        app = AppTest.from_file(os.path.join(ROOT, "dashboard.py"), default_timeout=300)
+
+        def render():
+            app.run()
+            if app.exception:
+                raise RuntimeError(app.exception[0].value)
+
+        rows.append({"positions": n, **measure(render, repeat=3, min_time=0)})
+    return rows
+
+
+def compare(current: dict, previous_path: str):
+    with open(previous_path) as f:
+        previous = json.load(f)
+    print(f"\nComparison vs {previous_path}")
+    for name, rows in current["benchmarks"].items():
+        for row, old in zip(rows, previous.get("benchmarks", {}).get(name, [])):
+            if "min_ms" in row and "min_ms" in old:
+                change = (row["min_ms"] / old["min_ms"] - 1) * 100 if old["min_ms"] else 0.0
+                key = {k: v for k, v in row.items() if k in ("positions", "grants", "op", "page_bytes")}
+                print(f"  {name:<22} {key}  {old['min_ms']:10.3f} -> {row['min_ms']:10.3f} ms  ({change:+.1f}%)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 100000])
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS))
+    parser.add_argument("--compare", metavar="JSON")
+    parser.add_argument("--output", metavar="JSON")
+    args = parser.parse_args(argv)
+
+    result = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "sizes": args.sizes,
+        "users": args.users,
+        "benchmarks": {},
+    }
+    for name in args.only or BENCHMARKS:
+        print(f"Running {name}...")
+        result["benchmarks"][name] = rows = BENCHMARKS[name](args.sizes, args.users)
+        for row in rows:
+            print("   ", {k: round(v, 4) if isinstance(v, float) else v for k, v in row.items()})
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    out = args.output or os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(out, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"Saved {out}")
+
+    if args.compare:
+        compare(result, args.compare)
+
+
+if __name__ == "__main__":
+    main()
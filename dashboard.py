@@ -1,14 +1,26 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-from backend.services.valuation import get_live_prices, get_usd_ils_rate, process_portfolio
+from backend.services.valuation import get_live_quotes, get_usd_ils_rate, get_fx_matrix, process_portfolio, clear_price_cache
 from backend.services.tax import calculate_tax_liability
+from backend.services.scenarios import Scenario, ScenarioEngine, results_frame
+from backend.services.risk import risk_service
+from backend.services.performance import TOTAL, performance_service
+from backend.services.downsample import history_series
+from backend.services.market_hours import open_markets
+from backend.services.cashflow import CashFlowPlanner, plan_frame
+from backend.services.withdrawals import optimize_withdrawals
+from backend.services import fragments, ledger
 from backend.database import engine, create_db_and_tables, models
 from backend.models import Asset, Settings, StockGrant
 from sqlmodel import Session, select
+from datetime import datetime
 import plotly.graph_objects as go
 
 import plotly.express as px
+import os
+import time
+from backend.services.profiler import RerunProfiler, NullProfiler, install as install_profiler, record_run, render_panel as render_profiler_panel
 
 
 # Ensure database and tables exist
@@ -20,6 +32,21 @@ init_db()
 
 st.set_page_config(page_title="Portfolio Manager", layout="wide", initial_sidebar_state="collapsed")
 
+# --- Developer Profiler (opt-in: ?profile=1 or PORTFOLIO_PROFILE=1) ---
+if st.query_params.get("profile") == "1" or os.environ.get("PORTFOLIO_PROFILE") == "1":
+    install_profiler(st, engine)
+    prof = RerunProfiler()
+else:
+    prof = NullProfiler()
+
+def rerun():
+    """st.rerun() aborts this script run, so clear the profiler on the way out."""
+    try:
+        st.rerun()
+    finally:
+        prof.abort()
+
+prof.begin("css")
 # --- PREMIUM DARK UI CSS ---
 st.markdown("""
 <style>
@@ -237,15 +264,20 @@ def add_asset(session, asset_data):
     asset = Asset(**asset_data, user_id=USER_ID)
     session.add(asset)
     session.commit()
+    ledger.open_positions(session, [asset])
     return True
 
 def update_asset(session, asset_id, asset_data):
     asset = session.get(Asset, asset_id)
     if asset:
+        # Quantity and unit-cost edits go through the ledger as an Adjustment
+        quantity = asset_data.pop('quantity', asset.quantity)
+        cost_per_unit = asset_data.pop('cost_per_unit', None)
         for key, value in asset_data.items():
             setattr(asset, key, value)
         session.add(asset)
         session.commit()
+        ledger.edit(session, asset, quantity, cost_per_unit)
         return True
     return False
 
@@ -253,11 +285,13 @@ def delete_asset(asset_id):
     with Session(engine) as session:
         asset = session.get(Asset, asset_id)
         if asset:
+            ledger.forget_asset(session, asset_id)
             session.delete(asset)
             session.commit()
             return True
     return False
 
+prof.begin("header")
 # --- FX Rate Fetching ---
 if 'current_fx' not in st.session_state:
     st.session_state.current_fx = get_usd_ils_rate()
@@ -288,11 +322,12 @@ h_col1, h_col2 = st.columns([3, 1])
 with h_col2:
     if st.button("✚ Add Position", key="add_pos_btn", use_container_width=True):
         # Clear edit state
-        keys_to_clear = ['edit_id', 'f_n', 'f_t', 'f_q', 'f_c', 'f_curr', 'f_type', 'f_acct', 'f_liq', 'f_alloc', 'f_notes', 'f_man_p']
+        keys_to_clear = ['edit_id', 'f_n', 'f_t', 'f_q', 'f_c', 'f_curr', 'f_type', 'f_acct', 'f_liq', 'f_alloc', 'f_notes', 'f_man_p', 'f_due']
         for k in keys_to_clear:
             if k in st.session_state: del st.session_state[k]
         st.session_state.show_add_form = True
 
+prof.begin("add form")
 # --- Add Asset Dialog ---
 if st.session_state.get('show_add_form', False):
     # CSS is handled globally now for div[data-testid="stForm"]
@@ -305,7 +340,7 @@ if st.session_state.get('show_add_form', False):
         
         if c_h2.button("✕", key="close_form_x"):
             st.session_state.show_add_form = False
-            st.rerun()
+            rerun()
 
         with st.form("add_asset_form_rev"):
             # Defaults
@@ -321,7 +356,7 @@ if st.session_state.get('show_add_form', False):
             d_man_p = st.session_state.get('f_man_p', '')
             
             # Asset Type (Generic)
-            typ_opts = ["Stock", "ETF", "Bond", "Crypto", "Cash", "Fund", "Liability"]
+            typ_opts = ["Stock", "ETF", "Bond", "CPI-Linked Bond", "Crypto", "Cash", "Fund", "Liability"]
             t_idx = typ_opts.index(d_type) if d_type in typ_opts else 0
             d_type = st.selectbox("Asset Type (General)", typ_opts, index=t_idx)
 
@@ -338,13 +373,16 @@ if st.session_state.get('show_add_form', False):
             
             # Row 4: Currency | Override
             r4_1, r4_2 = st.columns(2)
-            fcurr = r4_1.selectbox("Currency", ["USD", "ILS"], index=0 if d_curr=='USD' else 1)
+            curr_opts = ["USD", "ILS", "EUR", "GBP"]
+            fcurr = r4_1.selectbox("Currency", curr_opts, index=curr_opts.index(d_curr) if d_curr in curr_opts else 0)
             fprice_override = r4_2.text_input("Price Override", value=str(d_man_p) if d_man_p else "")
 
             # LOCATION (Crucial)
             loc_opts = ["Bank Account", "Brokerage", "Investment Fund", "Pension", "Crypto Wallet", "Work", "Future Needs"]
             l_idx = loc_opts.index(d_acct) if d_acct in loc_opts else 0 # Use f_acct/category field mapping
             f_location = st.selectbox("Location / Category", loc_opts, index=l_idx)
+            f_due = st.date_input("Due Date (Future Needs)", value=st.session_state.get('f_due'),
+                                  help="When the liability must be paid; used by the cash-flow plan")
             
             # ALLOCATION SPLITS (Crucial)
             st.markdown("---")
@@ -396,6 +434,7 @@ if st.session_state.get('show_add_form', False):
                      'type': d_type, 'currency': fcurr, 'category': f_location,
                      'liquidity': 'Liquid', # Default for now or add back if needed? User didn't prioritize liquidity dropdown.
                      'notes': f_notes, 'manual_price': man_p,
+                     'due_date': datetime.combine(f_due, datetime.min.time()) if f_due and f_location == "Future Needs" else None,
                      'alloc_il_stock_pct': fp_il,
                      'alloc_us_stock_pct': fp_us,
                      'alloc_work_pct': fp_work,
@@ -416,30 +455,39 @@ if st.session_state.get('show_add_form', False):
                  st.session_state.show_add_form = False
                  # Clear keys
                  for k in ['edit_id', 'f_n', 'f_t', 'f_q', 'f_c', 'f_curr', 'f_type', 'f_acct', 'f_liq', 'f_alloc', 
-                           'f_a_il', 'f_a_us', 'f_a_wk', 'f_a_cr', 'f_a_bd', 'f_a_ca', 'f_notes', 'f_man_p']:
+                           'f_a_il', 'f_a_us', 'f_a_wk', 'f_a_cr', 'f_a_bd', 'f_a_ca', 'f_notes', 'f_man_p', 'f_due']:
                      if k in st.session_state: del st.session_state[k]
-                 st.rerun()
+                 rerun()
                  
         if st.button("Cancel", key="cancel_form_btn"):
              st.session_state.show_add_form = False
-             st.rerun()
+             rerun()
              
         st.markdown("</div>", unsafe_allow_html=True)
 
 # --- Main Dashboard Logic ---
 # --- Data Fetching & Processing ---
 with Session(engine) as session:
+    prof.begin("get_settings")
     # 1. Load Settings
     user_settings = get_settings(session, USER_ID)
     
+    prof.begin("get_usd_ils_rate")
     # 2. FX Rate Logic
     if user_settings.use_manual_fx:
         fx_rate = user_settings.usd_ils_rate
     else:
         fx_rate = get_usd_ils_rate()
     
+    prof.begin("get_assets")
     # 3. Load Assets
     assets_list = get_assets(session)
+
+    prof.begin("get_fx_matrix")
+    # One batched fetch for every currency held, pinned to the manual USD/ILS if set
+    fx_matrix = get_fx_matrix({a.currency for a in assets_list} | {"USD", "ILS", user_settings.base_currency})
+    if user_settings.use_manual_fx:
+        fx_matrix = fx_matrix.override("USD", "ILS", fx_rate)
     
     processed_positions = []
     portfolio_summary = {
@@ -454,69 +502,55 @@ with Session(engine) as session:
         # Create Ticker List
         tickers_to_fetch = set()
         for asset in assets_list:
+            # Manually priced assets are valued in process_portfolio, never fetched
+            if asset.manual_price is not None and asset.manual_price > 0:
+                continue
             sym = asset.ticker.strip()
             # Crypto handling
             if asset.type == 'Cryptocurrency' and '-' not in sym:
                  sym = f"{sym}-{asset.currency}"
             tickers_to_fetch.add(sym)
 
+        prof.begin("get_live_prices")
         # Fetch Prices
         # print(f"DEBUG: Fetching tickers: {tickers_to_fetch}")
-        current_prices = get_live_prices(list(tickers_to_fetch))
+        live_quotes = get_live_quotes(list(tickers_to_fetch))
+        current_prices = {t: q.price for t, q in live_quotes.items()}
+        stale_tickers = sorted(t for t, q in live_quotes.items() if q.stale)
+        if stale_tickers:
+            st.caption(f"⚠️ Live price unavailable, showing last known price for: {', '.join(stale_tickers)}")
         
+        prof.begin("process_portfolio")
         # Process Portfolio (Tax, Net Worth, Allocation)
         portfolio_summary, processed_positions = process_portfolio(
-            assets_list, current_prices, fx_rate, user_settings
+            assets_list, current_prices, fx_matrix, user_settings
         )
+        if portfolio_summary.get('unconverted'):
+            st.caption(f"⚠️ No FX rate for {', '.join(portfolio_summary['unconverted'])}; those positions are excluded from totals.")
         
+    prof.begin("ui rows")
     # Extract totals for UI
     total_mkt_ils = portfolio_summary['total_net_worth']
     total_net_after_tax = portfolio_summary['total_after_tax']
     total_tax_liab_ils = total_mkt_ils - total_net_after_tax
-    total_cost_basis_ils = 0.0
-    processed_data = []
-    
-    # Map back to flat list for UI compatibility (Legacy UI code expects specific keys)
-    for p in processed_positions:
-        asset = p['asset']
-        item = {
-            'id': asset.id,
-            'name': asset.name,
-            'ticker': asset.ticker,
-            'type': asset.category if asset.category else asset.type,
-            'qty': asset.quantity,
-            'price': p['price'],
-            'val_ils': p['mkt_val_ils'],
-            'currency': asset.currency,
-            'cpu': asset.cost_per_unit,
-            'net_after_tax': p['net_after_tax']
-        }
-        # Calc gain pct locally
-        cost_basis_local = asset.cost_basis
-        if asset.currency == 'USD': cost_basis_local *= fx_rate
-        
-        total_cost_basis_ils += cost_basis_local
-        
-        gain = item['val_ils'] - cost_basis_local
-        if cost_basis_local > 0:
-            item['gain_pct'] = (gain / cost_basis_local) * 100
-        else:
-            item['gain_pct'] = 0.0
-            
-        processed_data.append(item)
+    # Positions are consumed directly by the holdings table below
+    total_cost_basis_ils = sum(p.cost_basis_ils for p in processed_positions)
 
 
     # --- DASHBOARD LAYOUT ---
     
+    prof.begin("sidebar")
     with st.sidebar:
         st.header("Global Settings")
         
         # Data Refresh
         st.subheader("Data Freshness")
-        st.caption("Prices cached for 30 mins.")
+        st.caption(f"Quotes refresh every few minutes while their market trades and hold while it is closed. "
+                   f"Open now: {', '.join(open_markets(time.time())) or 'none'}.")
         if st.button("🔄 Refresh Data"):
             st.cache_data.clear()
-            st.rerun()
+            clear_price_cache()
+            rerun()
 
         # FX Settings
         st.subheader("Currency (USD/ILS)")
@@ -529,14 +563,14 @@ with Session(engine) as session:
                 user_settings.use_manual_fx = True
                 session.add(user_settings)
                 session.commit()
-                st.rerun()
+                rerun()
         else:
             st.metric("Live Rate", f"₪{fx_rate:.2f}")
             if use_manual != user_settings.use_manual_fx:
                 user_settings.use_manual_fx = False
                 session.add(user_settings)
                 session.commit()
-                st.rerun()
+                rerun()
                 
         # Tax Settings
         st.subheader("Tax Assumptions")
@@ -545,7 +579,7 @@ with Session(engine) as session:
             user_settings.tax_rate_capital_gains = tax_cg
             session.add(user_settings)
             session.commit()
-            st.rerun()
+            rerun()
 
         # Planning Settings
         st.subheader("Planning")
@@ -554,7 +588,7 @@ with Session(engine) as session:
             user_settings.swr_rate = swr/100
             session.add(user_settings)
             session.commit()
-            st.rerun()
+            rerun()
 
         st.caption("Target Allocation (JSON)")
         base_targets = user_settings.allocation_targets if user_settings.allocation_targets else "{}"
@@ -563,8 +597,9 @@ with Session(engine) as session:
              user_settings.allocation_targets = new_targets
              session.add(user_settings)
              session.commit()
-             st.rerun()
+             rerun()
 
+    prof.begin("summary cards")
     # --- TOP SUMMARY SECTION ---
     st.markdown("<div style='margin-bottom: 20px;'></div>", unsafe_allow_html=True)
     
@@ -576,8 +611,7 @@ with Session(engine) as session:
     # Calculate Location Splits
     loc_splits = {}
     for p in processed_positions:
-        cat = p['asset'].category
-        loc_splits[cat] = loc_splits.get(cat, 0) + p['mkt_val_ils']
+        loc_splits[p.category] = loc_splits.get(p.category, 0) + p.mkt_val_ils
     sorted_locs = sorted(loc_splits.items(), key=lambda x: x[1], reverse=True)
 
     # Calculate Allocation for Chart
@@ -604,18 +638,12 @@ with Session(engine) as session:
         # But putting it here makes it "under net worth" visually.)
         # Use a "Details" expander
         with st.expander("Portfolio by Location"):
-            st.markdown("""
-<table class="styled-table" style="font-size:0.8rem;">
-    <tbody>
-""", unsafe_allow_html=True)
-            for loc, val in sorted_locs:
-                lpct = (val / net_worth * 100) if net_worth > 0 else 0
-                st.markdown(f"<tr><td style='padding:8px;'>{loc}</td><td style='padding:8px; text-align:right;'>₪{val:,.0f}</td><td style='padding:8px; text-align:right; color:#94A3B8;'>{lpct:.1f}%</td></tr>", unsafe_allow_html=True)
-            st.markdown("</tbody></table>", unsafe_allow_html=True)
+            st.markdown(fragments.location_table(sorted_locs, net_worth), unsafe_allow_html=True)
 
     with c_top2:
         metric_card("Monthly Passive", f"₪{passive_income_mo:,.0f}", f"SWR Rate: {user_settings.swr_rate*100:.1f}%", "positive")
 
+    prof.begin("plotly figure")
     with c_top3:
         # Pie Chart in a Card
         if not pie_data.empty:
@@ -629,6 +657,7 @@ with Session(engine) as session:
             st.info("No Data")
 
 
+    prof.begin("allocation table")
     # --- ASSET ALLOCATION TABLE (Detailed) ---
     st.markdown("<h3 style='margin-top:2rem; margin-bottom:1rem;'>Asset Allocation</h3>", unsafe_allow_html=True)
 
@@ -645,47 +674,8 @@ with Session(engine) as session:
         
     buckets = ['US Stocks', 'IL Stocks', 'Bonds', 'Cash', 'Crypto', 'Work'] 
     
-    # Build HTML String for Asset Allocation Table
-    alloc_table_html = """
-<div class="card" style="padding:0; overflow-x:auto;">
-    <table class="styled-table" style="min-width:600px;">
-        <thead>
-            <tr>
-                <th style="width:25%;">Asset Class</th>
-                <th class="text-right" style="width:20%;">Current Value</th>
-                <th class="text-right" style="width:15%;">Actual %</th>
-                <th class="text-right" style="width:15%;">Target %</th>
-                <th class="text-right" style="width:25%;">Delta</th>
-            </tr>
-        </thead>
-        <tbody>
-"""
-    
-    for b in buckets:
-        val = allocs.get(b, 0.0)
-        pct = (val / net_worth * 100) if net_worth > 0 else 0
-        tgt = targets_map.get(b, 0.0)
-        delta_val = net_worth * (tgt/100) - val
-        
-        if abs(delta_val) < 1000:
-            act_html = "<span style='color:#64748B'>—</span>"
-        elif delta_val > 0:
-            act_html = f"<span style='color:#34D399; font-weight:600;'>+₪{abs(delta_val):,.0f} (Buy)</span>"
-        else:
-             act_html = f"<span style='color:#FB7185; font-weight:600;'>-₪{abs(delta_val):,.0f} (Sell)</span>"
-
-        alloc_table_html += f"""
-<tr>
-    <td style="font-weight:600;">{b}</td>
-    <td class="text-right">₪{val:,.0f}</td>
-    <td class="text-right">{pct:.1f}%</td>
-    <td class="text-right">{tgt:.1f}%</td>
-    <td class="text-right">{act_html}</td>
-</tr>
-"""
-        
-    alloc_table_html += "</tbody></table></div>"
-    st.markdown(alloc_table_html, unsafe_allow_html=True)
+    # Memoized on (allocations, targets, net worth): unchanged reruns reuse the HTML
+    st.markdown(fragments.allocation_table(allocs, targets_map, net_worth, buckets), unsafe_allow_html=True)
     st.write("")
     st.write("")
 
@@ -697,13 +687,14 @@ with Session(engine) as session:
 
         
         # Tabs for different views including dedicated GSUs
-        tab_holdings, tab_gsus, tab_plan, tab_proj = st.tabs(["Holdings", "GSUs", "Rebalancing", "Projections"])
+        tab_holdings, tab_gsus, tab_plan, tab_proj, tab_risk, tab_perf = st.tabs(["Holdings", "GSUs", "Rebalancing", "Projections", "Risk", "Performance"])
         
         # TAB 1: HOLDINGS (Grouped)
+        prof.begin("holdings markdown")
         with tab_holdings:
             st.markdown("<div class='card'>", unsafe_allow_html=True)
             
-            is_empty = len(processed_data) == 0
+            is_empty = len(processed_positions) == 0
             
             if is_empty:
                 st.info("No assets found.")
@@ -716,9 +707,8 @@ with Session(engine) as session:
                 
                 ordered_cats = ["Work", "Bank Account", "Brokerage", "Investment Fund", "Pension", "Crypto Wallet", "Future Needs"]
                 
-                for item in processed_data:
-                    # Item 'type' is mapped to 'category' in backend loop effectively
-                    cat = item.get('type', 'Other')
+                for item in processed_positions:
+                    cat = item.group or 'Other'
                     if cat not in groups_dict:
                         groups_dict[cat] = []
                     groups_dict[cat].append(item)
@@ -733,45 +723,47 @@ with Session(engine) as session:
                     
                     for item in items:
                         # CHECK FOR INLINE EDIT
-                        if st.session_state.get('edit_id') == item['id']:
+                        if st.session_state.get('edit_id') == item.id:
                              # RENDER INLINE FORM
                              with st.container():
                                  st.markdown(f"<div style='border:1px solid #3B82F6; border-radius:8px; padding:16px; background:#0F172A; margin:8px 0;'>", unsafe_allow_html=True)
-                                 st.caption(f"Editing: {item['name']}")
+                                 st.caption(f"Editing: {item.name}")
                                  
                                  # Load existing values into form session keys if not set (or we set them on click)
                                  # We set them on click. Use those.
-                                 with st.form(key=f"edit_form_{item['id']}"):
+                                 with st.form(key=f"edit_form_{item.id}"):
                                      e_c1, e_c2 = st.columns(2)
                                      new_q = e_c1.number_input("Quantity", value=st.session_state.get('f_q', 0.0))
                                      new_c = e_c2.number_input("Cost Basis", value=st.session_state.get('f_c', 0.0))
                                      new_p_ov = e_c1.text_input("Price Override", value=str(st.session_state.get('f_man_p', '')) if st.session_state.get('f_man_p') else "")
                                      new_loc = e_c2.selectbox("Location", ["Bank Account", "Brokerage", "Investment Fund", "Pension", "Crypto Wallet", "Work", "Future Needs"], index=0) # Index logic omitted for brevity, user can select
+                                     new_due = e_c1.date_input("Due Date (Future Needs)", value=st.session_state.get('f_due'))
                                      
                                      submitted_edit = st.form_submit_button("Update")
                                      if submitted_edit:
                                          # Construct update
                                           man_p_val = float(new_p_ov) if new_p_ov.strip() else None
                                           updates = {
-                                              'quantity': new_q, 'cost_per_unit': new_c, 'manual_price': man_p_val, 'category': new_loc
+                                              'quantity': new_q, 'cost_per_unit': new_c, 'manual_price': man_p_val, 'category': new_loc,
+                                              'due_date': datetime.combine(new_due, datetime.min.time()) if new_due and new_loc == "Future Needs" else None
                                           }
                                           with Session(engine) as session:
-                                              update_asset(session, item['id'], updates)
+                                              update_asset(session, item.id, updates)
                                           
                                           del st.session_state['edit_id']
-                                          st.rerun()
+                                          rerun()
                                  
-                                 if st.button("Cancel", key=f"cancel_{item['id']}"):
+                                 if st.button("Cancel", key=f"cancel_{item.id}"):
                                      del st.session_state['edit_id']
-                                     st.rerun()
+                                     rerun()
                                  st.markdown("</div>", unsafe_allow_html=True)
 
                         else:
                             # RENDER ROW
                             c1, c2, c3, c4, c5 = st.columns([2.5, 1.2, 1.2, 1.2, 0.8])
                             
-                            initials = item['ticker'][:2].upper() if item['ticker'] and not item['ticker'][0].isdigit() else "AS"
-                            is_positive = item['gain_pct'] >= 0
+                            initials = item.ticker[:2].upper() if item.ticker and not item.ticker[0].isdigit() else "AS"
+                            is_positive = item.gain_pct >= 0
                             trend_color = "#10B981" if is_positive else "#FB7185"
                             trend_arrow = "↗" if is_positive else "↘"
                             
@@ -780,8 +772,8 @@ with Session(engine) as session:
                                  <div style="display:flex; align-items:center; height:100%;">
                                     <div class="asset-icon" style="width:36px; height:36px; margin-right:10px; font-size:0.8rem;">{initials}</div>
                                     <div>
-                                        <div style="font-weight:600; font-size:0.95rem; color:#F8FAFC; line-height:1.2;">{item['name']}</div>
-                                        <div style="font-size:0.75rem; color:#64748B;">{item['ticker']}</div>
+                                        <div style="font-weight:600; font-size:0.95rem; color:#F8FAFC; line-height:1.2;">{item.name}</div>
+                                        <div style="font-size:0.75rem; color:#64748B;">{item.ticker}</div>
                                     </div>
                                  </div>
                                  """, unsafe_allow_html=True)
@@ -789,16 +781,16 @@ with Session(engine) as session:
                             with c2:
                                  st.markdown(f"""
                                  <div style="text-align:right;">
-                                    <div style="color:#E2E8F0; font-weight:500;">{item['currency']} {item['price']:,.2f}</div>
-                                    <div style="font-size:0.75rem; color:#64748B;">x {item['qty']}</div>
+                                    <div style="color:#E2E8F0; font-weight:500;">{item.currency} {item.price:,.2f}</div>
+                                    <div style="font-size:0.75rem; color:#64748B;">x {item.quantity}</div>
                                  </div>
                                  """, unsafe_allow_html=True)
                                  
                             with c3:
                                  st.markdown(f"""
                                  <div style="text-align:right;">
-                                    <div style="font-weight:700; color:#F8FAFC;">{item['val_ils']:,.0f}₪</div>
-                                    <div style="font-size:0.75rem; color:#64748B;">Net: {(item['net_after_tax']):,.0f}₪</div>
+                                    <div style="font-weight:700; color:#F8FAFC;">{item.mkt_val_ils:,.0f}₪</div>
+                                    <div style="font-size:0.75rem; color:#64748B;">Net: {(item.net_after_tax):,.0f}₪</div>
                                  </div>
                                  """, unsafe_allow_html=True)
                                  
@@ -806,7 +798,7 @@ with Session(engine) as session:
                                  st.markdown(f"""
                                  <div style="text-align:right;">
                                     <div style="color:{trend_color}; font-weight:600; background:rgba(255,255,255,0.03); padding:2px 8px; border-radius:6px; display:inline-block; font-size:0.85rem;">
-                                        {trend_arrow} {item['gain_pct']:+.1f}%
+                                        {trend_arrow} {item.gain_pct:+.1f}%
                                     </div>
                                  </div>
                                  """, unsafe_allow_html=True)
@@ -814,20 +806,22 @@ with Session(engine) as session:
                             with c5:
                                 ac1, ac2 = st.columns(2)
                                 with ac1:
-                                    if st.button("✎", key=f"e_{item['id']}", help="Edit"):
-                                        st.session_state.edit_id = item['id']
+                                    if st.button("✎", key=f"e_{item.id}", help="Edit"):
+                                        st.session_state.edit_id = item.id
                                         # Hydrate state
-                                        st.session_state.f_q = float(item['qty'])
-                                        st.session_state.f_c = float(item['cpu'])
+                                        st.session_state.f_q = float(item.quantity)
+                                        st.session_state.f_c = float(item.cost_per_unit)
                                         # Need full asset for others
                                         with Session(engine) as session:
-                                            a = session.get(Asset, item['id'])
-                                            if a: st.session_state.f_man_p = a.manual_price
-                                        st.rerun()
+                                            a = session.get(Asset, item.id)
+                                            if a:
+                                                st.session_state.f_man_p = a.manual_price
+                                                st.session_state.f_due = a.due_date.date() if a.due_date else None
+                                        rerun()
                                 with ac2:
-                                    if st.button("🗑", key=f"d_{item['id']}", help="Delete"):
-                                        delete_asset(item['id'])
-                                        st.rerun()
+                                    if st.button("🗑", key=f"d_{item.id}", help="Delete"):
+                                        delete_asset(item.id)
+                                        rerun()
 
                             st.markdown("<div style='height:1px; background:#1E293B; margin:8px 0;'></div>", unsafe_allow_html=True)
             
@@ -841,6 +835,7 @@ with Session(engine) as session:
 
             
         # TAB 2: GSUs
+        prof.begin("gsu table")
         with tab_gsus:
              st.markdown("<div class='card'>", unsafe_allow_html=True)
              st.markdown("<h3>Google Stock Units (GSUs)</h3>", unsafe_allow_html=True)
@@ -852,65 +847,30 @@ with Session(engine) as session:
                  st.info("No GSU data found.")
              else:
                  # Aggregation to match Sheet View
-                 # Key: (GrantDate, GrantPrice) -> {vested: 0, unvested: 0, total: 0, vest_end: date}
+                 # Key: (GrantDate, GrantPrice) -> {vested: 0, unvested: 0, total: 0, vest_date: date}
                  grouped = {}
                  for g in grants:
                      k = (g.grant_date, g.grant_price)
                      if k not in grouped:
-                         grouped[k] = {'vested': 0, 'unvested': 0, 'total':0, 'end_date': g.vest_date, 'name': g.name}
-                     
+                         grouped[k] = {'grant_date': g.grant_date, 'grant_price': g.grant_price, 'vest_date': g.vest_date,
+                                       'total': 0, 'vested': 0, 'unvested': 0}
+
                      grouped[k]['total'] += g.units
-                     grouped[k]['end_date'] = max(grouped[k]['end_date'], g.vest_date) # Take max date of the chunks
+                     grouped[k]['vest_date'] = max(grouped[k]['vest_date'], g.vest_date) # Take max date of the chunks
                      if g.is_vested:
                          grouped[k]['vested'] += g.units
                      else:
                          grouped[k]['unvested'] += g.units
-                 
-                 # Render Table
-                 gsu_html = """
-<div style="overflow-x:auto;">
-<table class="styled-table">
-   <thead>
-       <tr>
-           <th>Grant Date</th>
-           <th>Full Vest Date</th>
-           <th class="text-right">Total Units</th>
-           <th class="text-right">Vested</th>
-           <th class="text-right">Unvested</th>
-           <th class="text-right">Grant Price</th>
-           <th class="text-right">Value (Unvested)</th>
-       </tr>
-   </thead>
-   <tbody>
-"""
-                 
+
                  goog_p = current_prices.get('GOOG', 0)
-                 
-                 for (g_date, g_price), d in grouped.items():
-                     val_unvested = d['unvested'] * goog_p
-                     g_date_str = g_date.strftime("%d/%m/%Y")
-                     v_date_str = d['end_date'].strftime("%d/%m/%Y")
-                     
-                     gsu_html += f"""
-<tr>
-    <td>{g_date_str}</td>
-    <td>{v_date_str}</td>
-    <td class="text-right">{d['total']:.0f}</td>
-    <td class="text-right" style="color:#34D399;">{d['vested']:.0f}</td>
-    <td class="text-right" style="color:#F59E0B;">{d['unvested']:.0f}</td>
-    <td class="text-right">${g_price:.2f}</td>
-    <td class="text-right">${val_unvested:,.0f}</td>
-</tr>
-"""
-                     
-                 gsu_html += "</tbody></table></div>"
-                 st.markdown(gsu_html, unsafe_allow_html=True)
+                 st.markdown(fragments.gsu_table(list(grouped.values()), goog_p), unsafe_allow_html=True)
                  if goog_p > 0:
                      st.caption(f"Calculated at current GOOG price: ${goog_p:.2f}")
 
              st.markdown("</div>", unsafe_allow_html=True)
 
         # TAB 3: REBALANCING
+        prof.begin("rebalancing table")
         with tab_plan:
              st.markdown("<div class='card'>", unsafe_allow_html=True)
              st.markdown("<h3>Rebalancing Plan</h3>", unsafe_allow_html=True)
@@ -925,57 +885,13 @@ with Session(engine) as session:
              # 6 Buckets defined in valuation.py
              chart_buckets = ['IL Stocks', 'US Stocks', 'Crypto', 'Work', 'Bonds', 'Cash']
              
-             # Header
-             c1, c2, c3, c4 = st.columns([2, 1, 1, 1.5])
-             c1.markdown("**Bucket**")
-             st.markdown("""
-             <div style="overflow-x:auto;">
-             <table class="styled-table">
-                <thead>
-                    <tr>
-                        <th style="width:25%;">Bucket</th>
-                        <th class="text-right" style="width:20%;">Actual</th>
-                        <th class="text-right" style="width:15%;">Target</th>
-                        <th class="text-right" style="width:40%;">Recommended Action</th>
-                    </tr>
-                </thead>
-                <tbody>
-             """, unsafe_allow_html=True)
-             
-             for cat in chart_buckets:
-                curr_val = portfolio_summary['allocations'].get(cat, 0.0)
-                curr_pct = (curr_val / total_mkt_ils * 100) if total_mkt_ils > 0 else 0
-                target_pct = targets_map.get(cat, 0.0)
-                
-                # Delta
-                target_val = total_mkt_ils * (target_pct / 100)
-                diff_ils = target_val - curr_val
-                is_buy = diff_ils >= 0
-                
-                if abs(diff_ils) < 1000:
-                    action_html = "<span style='color:#64748B'>No Action</span>"
-                else:
-                    color = "#34D399" if is_buy else "#FB7185"
-                    lbl = "BUY" if is_buy else "SELL"
-                    action_html = f"<span style='color:{color}; font-weight:700;'>{lbl} ₪{abs(diff_ils):,.0f}</span>"
-
-                st.markdown(f"""
-                <tr>
-                    <td style="font-weight:600;">{cat}</td>
-                    <td class="text-right">
-                        <div>₪{curr_val:,.0f}</div>
-                        <div style="font-size:0.75rem; color:#64748B;">{curr_pct:.1f}%</div>
-                    </td>
-                    <td class="text-right">{target_pct:.1f}%</td>
-                    <td class="text-right">{action_html}</td>
-                </tr>
-                """, unsafe_allow_html=True)
-                
-             st.markdown("</tbody></table></div>", unsafe_allow_html=True)
+             st.markdown(fragments.rebalancing_table(portfolio_summary['allocations'], targets_map, total_mkt_ils, chart_buckets),
+                         unsafe_allow_html=True)
              st.markdown("</div>", unsafe_allow_html=True)
 
              
         # TAB 4: PROJECTIONS
+        prof.begin("projections")
         with tab_proj:
             st.markdown("<div class='card'>", unsafe_allow_html=True)
             st.markdown("<h3>Financial Independence</h3>", unsafe_allow_html=True)
@@ -989,3 +905,187 @@ with Session(engine) as session:
                 st.caption("Assumes 5% Real Return")
                 
             st.markdown("</div>", unsafe_allow_html=True)
+
+            # Cash-flow plan: dated Future Needs, GSU vests, savings and SWR withdrawals month by month
+            prof.begin("cash-flow plan")
+            st.markdown("<h3>Cash-Flow Plan (40 Years, Today's ₪)</h3>", unsafe_allow_html=True)
+            cf_c1, cf_c2, cf_c3 = st.columns(3)
+            cf_contrib = cf_c1.number_input("Monthly Savings (₪)", value=float(user_settings.monthly_contribution or 0.0), step=1000.0)
+            cf_year = cf_c2.number_input("Retirement Year (0 = now)", value=int(user_settings.retirement_year or 0), step=1, min_value=0)
+            cf_return = cf_c3.slider("Real Return (%)", -2.0, 10.0, 5.0, 0.5, key="cf_return")
+            if cf_contrib != (user_settings.monthly_contribution or 0.0) or cf_year != (user_settings.retirement_year or 0):
+                user_settings.monthly_contribution = cf_contrib
+                user_settings.retirement_year = int(cf_year) or None
+                session.add(user_settings)
+                session.commit()
+
+            plan_grants = session.exec(select(StockGrant).where(StockGrant.user_id == USER_ID)).all()
+            base_ccy = user_settings.base_currency or "ILS"
+            planner = CashFlowPlanner(processed_positions, plan_grants, user_settings, gsu_price=current_prices.get('GOOG', 0.0),
+                                      usd_rate=fx_matrix.rate("USD", base_ccy) if base_ccy in fx_matrix.index else 1.0)
+            plan = planner.run(cf_contrib, int(cf_year), cf_return / 100, user_settings.swr_rate)
+
+            pm_c1, pm_c2, pm_c3 = st.columns(3)
+            pm_c1.metric("Withdrawal from Retirement", f"₪{plan['withdrawal_monthly']:,.0f}/mo")
+            pm_c2.metric("Balance at Retirement", f"₪{plan['balance'][plan['retirement_month']]:,.0f}")
+            depleted = plan["depleted_month"]
+            pm_c3.metric("Money Lasts Until", str(plan["months"][depleted])[:4] if depleted is not None else "40y+",
+                         delta="Shortfall" if depleted is not None else None, delta_color="inverse")
+
+            fig_plan = go.Figure(go.Scatter(x=plan["months"], y=plan["balance"], mode="lines", name="Balance",
+                                            line=dict(color="#3B82F6", width=2)))
+            for need in planner.dated:
+                fig_plan.add_trace(go.Scatter(x=[plan["months"][need["month"]]], y=[plan["balance"][need["month"]]],
+                                              mode="markers", marker=dict(color="#FB7185", size=9),
+                                              name=f"{need['name']} (₪{need['amount']:,.0f})"))
+            fig_plan.update_layout(height=280, margin=dict(t=10, b=10, l=10, r=10), paper_bgcolor='rgba(0,0,0,0)',
+                                   plot_bgcolor='rgba(0,0,0,0)', font=dict(color="#94A3B8"), showlegend=False,
+                                   hovermode="x unified")
+            st.plotly_chart(fig_plan, use_container_width=True, config={'displayModeBar': False})
+            with st.expander("Yearly Plan"):
+                st.dataframe(plan_frame(plan).set_index("Month").round(0), use_container_width=True)
+
+            # Which account to draw from first (tax-aware), against pro-rata withdrawals
+            prof.begin("withdrawal order")
+            order_plan = optimize_withdrawals(processed_positions, user_settings, real_return=cf_return / 100,
+                                              start_month=plan["retirement_month"])
+            if order_plan["pools"]:
+                st.markdown("<h3>Withdrawal Order (40-Year Retirement)</h3>", unsafe_allow_html=True)
+                wo_c1, wo_c2, wo_c3 = st.columns(3)
+                wo_c1.metric("Pro-Rata Spending", f"₪{order_plan['pro_rata_monthly']:,.0f}/mo")
+                wo_c2.metric("Optimized Spending", f"₪{order_plan['spending_monthly']:,.0f}/mo", f"{order_plan['gain']:+.1%}")
+                wo_c3.metric("Tax on Withdrawals", f"{order_plan['tax_rate']:.1%}",
+                             f"{(order_plan['tax_rate'] - order_plan['pro_rata_tax_rate']) * 100:+.1f} pts vs pro-rata", delta_color="inverse")
+                retire_year = int(str(plan["months"][plan["retirement_month"]])[:4])
+                taxes = dict(zip([p.name for p in order_plan["pools"]], order_plan["tax"].sum(axis=1)))
+                st.dataframe(pd.DataFrame([{"Account": name, "From": retire_year + start / 12, "Until": retire_year + stop / 12,
+                                            "Tax Paid": taxes[name]} for name, start, stop in order_plan["intervals"]])
+                             .set_index("Account").style.format({"From": "{:.1f}", "Until": "{:.1f}", "Tax Paid": "₪{:,.0f}"}),
+                             use_container_width=True)
+                if not order_plan["order"]:
+                    st.caption("Drawing from every account pro rata is already optimal here.")
+
+            # What-if: shocks are applied to the live valuation in one batched pass
+            prof.begin("scenarios")
+            if assets_list:
+                st.markdown("<h3>Stress Test</h3>", unsafe_allow_html=True)
+                scenario_engine = ScenarioEngine(assets_list, current_prices, fx_matrix, user_settings)
+                top_symbols = [p.symbol for p in sorted(processed_positions, key=lambda p: p.mkt_val_ils, reverse=True)]
+                top_symbols = list(dict.fromkeys(top_symbols))[:15]
+
+                s_c1, s_c2, s_c3, s_c4 = st.columns(4)
+                usd_shock = s_c1.slider("USD vs ₪ (%)", -30, 30, 0, key="sc_usd")
+                shock_sym = s_c2.selectbox("Holding", top_symbols, key="sc_sym")
+                sym_shock = s_c3.slider(f"{shock_sym} price (%)", -80, 80, 0, key="sc_px")
+                cgt = s_c4.slider("Capital Gains Tax (%)", 0, 50, int(round(user_settings.tax_rate_capital_gains * 100)), key="sc_cgt")
+
+                custom = Scenario("Custom", prices={shock_sym: sym_shock / 100}, fx={"USD": usd_shock / 100},
+                                  settings={"tax_rate_capital_gains": cgt / 100})
+                presets = [
+                    Scenario("Current"),
+                    Scenario("USD -10%", fx={"USD": -0.10}),
+                    Scenario("Work -30%", prices={"GOOG": -0.30, "MSFT": -0.30}),
+                    Scenario("USD -10% & Work -30%", prices={"GOOG": -0.30, "MSFT": -0.30}, fx={"USD": -0.10}),
+                    Scenario("Crypto -50%", prices={p.symbol: -0.50 for p in processed_positions if p.type == 'Cryptocurrency'}),
+                    custom,
+                ]
+                sc_df = results_frame(scenario_engine.run(presets))
+                base_after_tax = sc_df["After Tax"].iloc[0]
+                sc_df["Δ After Tax"] = sc_df["After Tax"] - base_after_tax
+                st.dataframe(sc_df.set_index("Scenario").round(0), use_container_width=True)
+
+        # TAB 5: RISK (from locally stored daily closes; only new days are fetched)
+        prof.begin("risk")
+        with tab_risk:
+            if processed_positions:
+                risk = risk_service.analyze(processed_positions, portfolio_summary,
+                                            base_ccy=getattr(user_settings, 'base_currency', None) or 'ILS')
+                conc = risk["concentration"]
+
+                st.markdown("<div class='card'>", unsafe_allow_html=True)
+                st.markdown(f"<h3>Risk ({risk['days']} trading days)</h3>", unsafe_allow_html=True)
+                r_c1, r_c2, r_c3, r_c4 = st.columns(4)
+                r_c1.metric("Volatility (annual)", f"{risk['portfolio_volatility']:.1%}")
+                r_c2.metric("1-day VaR 95%", f"₪{risk['var'][0.95]['historical']:,.0f}",
+                            help=f"Parametric: ₪{risk['var'][0.95]['parametric']:,.0f}")
+                r_c3.metric("1-day VaR 99%", f"₪{risk['var'][0.99]['historical']:,.0f}",
+                            help=f"Parametric: ₪{risk['var'][0.99]['parametric']:,.0f}")
+                r_c4.metric("Effective Holdings", f"{conc['effective_n']:.1f}",
+                            help=f"HHI {conc['hhi']:.3f}")
+
+                r_c5, r_c6, r_c7 = st.columns(3)
+                r_c5.metric("Top 5 Share", f"{conc['top_share']:.1%}")
+                if conc['largest']:
+                    r_c6.metric("Largest Holding", conc['largest'][0], f"{conc['largest'][1]:.1%}", delta_color="off")
+                r_c7.metric("Employer Equity", f"{conc['work_share']:.1%}")
+                st.markdown("</div>", unsafe_allow_html=True)
+
+                if risk['uncovered']:
+                    st.caption(f"⚠️ No price history for {', '.join(risk['uncovered'])}; treated as riskless.")
+
+                vol_df = pd.DataFrame({
+                    "Exposure": pd.Series(risk["exposures"]),
+                    "Volatility": pd.Series(risk["volatility"]),
+                }).sort_values("Exposure", ascending=False)
+                st.dataframe(vol_df.style.format({"Exposure": "₪{:,.0f}", "Volatility": "{:.1%}"}), use_container_width=True)
+
+                # Correlations among the largest exposures keep the heatmap readable
+                top = list(vol_df.index[:20])
+                corr = risk["correlation"].loc[top, top]
+                fig_corr = px.imshow(corr, zmin=-1, zmax=1, color_continuous_scale="RdBu_r", aspect="auto")
+                fig_corr.update_layout(height=500, margin=dict(t=20, b=20, l=20, r=20),
+                                       paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)')
+                st.plotly_chart(fig_corr, use_container_width=True)
+
+        # TAB 6: PERFORMANCE (ledger flows + stored daily closes; built once, ranges are O(1))
+        prof.begin("performance")
+        with tab_perf:
+            base_ccy = user_settings.base_currency or 'ILS'
+            fx_rates = {c: fx_matrix.rate(c, base_ccy) for c in {a.currency for a in assets_list}
+                        if c in fx_matrix.index and base_ccy in fx_matrix.index}
+            book = performance_service.book(session, assets_list, fx_rates, base_ccy, current_prices)
+            if book is None:
+                st.info("No price history yet; performance appears once daily closes are stored.")
+            else:
+                last = pd.Timestamp(book.days[-1])
+                ranges = {"1M": last - pd.DateOffset(months=1), "3M": last - pd.DateOffset(months=3),
+                          "YTD": last.replace(month=1, day=1), "1Y": last - pd.DateOffset(years=1), "All": None}
+                range_key = st.radio("Range", list(ranges), index=3, horizontal=True, key="perf_range")
+                start = ranges[range_key]
+                perf_df = book.frame(start.date() if start is not None else None)
+
+                # History charts: only the selected range, downsampled to the chart width
+                history = history_series(book, assets_list, start.date() if start is not None else None)
+                nw_days, nw = history["net_worth"]
+                b_days, bucket_hist = history["buckets"]
+                chart_layout = dict(height=260, margin=dict(t=10, b=10, l=10, r=10), paper_bgcolor='rgba(0,0,0,0)',
+                                    plot_bgcolor='rgba(0,0,0,0)', font=dict(color="#94A3B8"),
+                                    legend=dict(orientation="h", y=-0.15), hovermode="x unified")
+                st.markdown("<h3>Net Worth</h3>", unsafe_allow_html=True)
+                fig_nw = go.Figure(go.Scatter(x=nw_days, y=nw[TOTAL], mode="lines", line=dict(color="#3B82F6", width=2),
+                                              name="Net Worth"))
+                fig_nw.update_layout(**chart_layout, showlegend=False)
+                st.plotly_chart(fig_nw, use_container_width=True, config={'displayModeBar': False})
+
+                st.markdown("<h3>Allocation History</h3>", unsafe_allow_html=True)
+                fig_alloc = go.Figure([go.Scatter(x=b_days, y=vals, mode="lines", stackgroup="alloc", name=name,
+                                                  line=dict(width=0.5))
+                                       for name, vals in bucket_hist.items() if vals.any()])
+                fig_alloc.update_layout(**chart_layout)
+                st.plotly_chart(fig_alloc, use_container_width=True, config={'displayModeBar': False})
+                st.caption(f"{len(book.days):,} daily values; charts show {len(nw_days)} / {len(b_days)} points.")
+
+                n_pos = len(book.asset_ids)
+                fmt = {"Start Value": "₪{:,.0f}", "End Value": "₪{:,.0f}", "Net Flows": "₪{:,.0f}",
+                       "TWR": "{:.2%}", "TWR (ann.)": "{:.2%}", "XIRR": "{:.2%}"}
+                st.markdown("<h3>By Location</h3>", unsafe_allow_html=True)
+                st.dataframe(perf_df.iloc[n_pos:].style.format(fmt, na_rep="–"), use_container_width=True)
+                st.markdown("<h3>By Position</h3>", unsafe_allow_html=True)
+                st.dataframe(perf_df.iloc[:n_pos].sort_values("End Value", ascending=False)
+                             .style.format(fmt, na_rep="–"), use_container_width=True)
+
+# --- Developer Profiler Panel ---
+profile_run = prof.finish()
+if profile_run:
+    st.session_state.profile_history = record_run(st.session_state.get('profile_history'), profile_run)
+    render_profiler_panel(st, st.session_state.profile_history)
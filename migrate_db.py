@@ -1,7 +1,9 @@
+import os
+
 from sqlmodel import create_engine, text
 from backend.models import Asset, Settings, StockGrant
 
-sqlite_file_name = "database.db"
+sqlite_file_name = os.environ.get("PORTFOLIO_DB", "database.db")
 sqlite_url = f"sqlite:///{sqlite_file_name}"
 engine = create_engine(sqlite_url)
 
@@ -17,7 +19,9 @@ def run_migrations():
             ("alloc_crypto_pct", "FLOAT DEFAULT 0.0"),
             ("alloc_work_pct", "FLOAT DEFAULT 0.0"),
             ("alloc_bonds_pct", "FLOAT DEFAULT 0.0"),
-            ("alloc_cash_pct", "FLOAT DEFAULT 0.0")
+            ("alloc_cash_pct", "FLOAT DEFAULT 0.0"),
+            ("allocation_split", "TEXT"),
+            ("due_date", "DATETIME")
         ]
         
         for col_name, col_type in columns_to_add:
@@ -40,7 +44,10 @@ def run_migrations():
             ("gsu_tax_mode", "TEXT DEFAULT 'Average'"),
             ("swr_rate", "FLOAT DEFAULT 0.04"),
             ("include_crypto", "BOOLEAN DEFAULT 1"),
-            ("allocation_targets", "TEXT DEFAULT '{}'")
+            ("allocation_targets", "TEXT DEFAULT '{}'"),
+            ("inflation_rate", "FLOAT DEFAULT 0.0"),
+            ("monthly_contribution", "FLOAT DEFAULT 0.0"),
+            ("retirement_year", "INTEGER")
         ]
 
         for col_name, col_type in settings_cols:
@@ -60,6 +67,16 @@ def run_migrations():
     # Force create new tables
     from sqlmodel import SQLModel
     SQLModel.metadata.create_all(engine)
+
+    # 4. Backfill persisted allocation splits
+    from backend.services.classifier import reclassify_all
+    print(f"Classified {reclassify_all(engine)} assets.")
+
+    # 5. Opening ledger entries so existing quantities / costs have a history
+    from sqlmodel import Session, select
+    from backend.services.ledger import open_positions
+    with Session(engine) as session:
+        print(f"Opened ledger for {open_positions(session, session.exec(select(Asset)).all())} assets.")
     print("Migration complete.")
 
 if __name__ == "__main__":
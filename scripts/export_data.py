@@ -0,0 +1,49 @@
+"""
+Export data in chunks to CSV, Parquet or XLSX.
+
+    python -m scripts.export_data positions --format csv -o positions.csv
+    python -m scripts.export_data grants --format xlsx --user 1 -o grants.xlsx
+    python -m scripts.export_data history --format parquet -o history.parquet
+
+Datasets: positions (valued as on the dashboard), grants, transactions, history.
+Writes to stdout when no output file is given.
+"""
+import argparse
+import sys
+import time
+
+from backend.database import engine
+from backend.services.export import CHUNK_ROWS, DATASETS, WRITERS, check_export, export
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("dataset", choices=sorted(DATASETS))
+    parser.add_argument("--format", choices=sorted(WRITERS), default="csv")
+    parser.add_argument("--user", type=int, action="append", help="user id (repeatable; default: all users)")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("-o", "--output", metavar="FILE")
+    args = parser.parse_args(argv)
+
+    engine.echo = False
+    try:
+        check_export(args.dataset, args.format)
+    except ValueError as e:
+        parser.error(str(e))
+
+    start = time.perf_counter()
+    written = 0
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for data in export(args.dataset, args.format, args.user, args.chunk_rows):
+            out.write(data)
+            written += len(data)
+    finally:
+        if args.output:
+            out.close()
+    if args.output:
+        print(f"Wrote {written:,} bytes to {args.output} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
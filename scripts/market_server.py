@@ -0,0 +1,272 @@
+"""
+Local market-data stand-in for Yahoo (v8 chart and spark) and Bizportal quote pages.
+
+    # Record real responses while using the app normally
+    python -m scripts.market_server --mode record --data market_data
+    # Replay them offline with 200±50 ms latency and 5% HTTP 503s
+    python -m scripts.market_server --mode replay --data market_data --latency 200 --jitter 50 --error-rate 0.05
+
+Then point the providers at it:
+
+    BIZPORTAL_BASE_URL=http://127.0.0.1:8765 YAHOO_BASE_URL=http://127.0.0.1:8765 streamlit run dashboard.py
+
+Recordings are one JSON file per request (status, content type, body), so they
+can be inspected and edited by hand. In replay mode `--synthesize` answers
+unrecorded symbols with deterministic prices, which lets load tests use
+arbitrarily many tickers. Latency, jitter and errors are drawn from a RNG
+seeded by (seed, path, n-th request for that path), so a run is reproducible
+no matter how concurrent requests interleave.
+"""
+import argparse
+import base64
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import requests
+
+# Path prefix -> real upstream host
+UPSTREAMS = {
+    "/capitalmarket/": "https://www.bizportal.co.il",
+    "/v8/finance/": "https://query1.finance.yahoo.com",
+}
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+
+_CHART_PATH = re.compile(r"^/v8/finance/chart/([^/]+)$")
+_SPARK_PATH = "/v8/finance/spark"
+_BIZPORTAL_PATH = re.compile(r"^/capitalmarket/quote/general/(\d+)$")
+
+
+def synthetic_price(symbol: str) -> float:
+    """Stable per symbol, same scheme as OfflineProvider."""
+    return 1.0 + (zlib.crc32(symbol.encode()) % 100000) / 100.0
+
+
+def requested_symbols(path: str, query: str = "") -> List[str]:
+    """Symbols a request asks for (one for chart/Bizportal paths, many for spark)."""
+    if path == _SPARK_PATH:
+        return [s for s in dict(parse_qsl(query)).get("symbols", "").split(",") if s]
+    m = _CHART_PATH.match(path) or _BIZPORTAL_PATH.match(path)
+    return [m.group(1)] if m else []
+
+
+def _chart_result(symbol: str, days: int) -> dict:
+    price = synthetic_price(symbol)
+    now = int(time.time())
+    return {
+        "meta": {"symbol": symbol, "regularMarketPrice": price},
+        "timestamp": [now - 86400 * i for i in range(days - 1, -1, -1)],
+        "indicators": {"quote": [{"close": [price] * days}]},
+    }
+
+
+def synthesize(path: str, query: str = "") -> Optional[Tuple[int, str, bytes]]:
+    """Made-up but well-formed response for unrecorded symbols."""
+    m = _CHART_PATH.match(path)
+    if m:
+        body = {"chart": {"result": [_chart_result(m.group(1), 5)], "error": None}}
+        return 200, "application/json", json.dumps(body).encode()
+    if path == _SPARK_PATH:
+        results = [{"symbol": s, "response": [_chart_result(s, 1)]} for s in requested_symbols(path, query)]
+        return 200, "application/json", json.dumps({"spark": {"result": results, "error": None}}).encode()
+    m = _BIZPORTAL_PATH.match(path)
+    if m:
+        # Bizportal shows Agorot
+        agorot = synthetic_price(m.group(1)) * 100
+        html = f'<html><body><div class="paper_rate"><span class="num">{agorot:,.2f}</span></div></body></html>'
+        return 200, "text/html; charset=utf-8", html.encode()
+    return None
+
+
+class Recordings:
+    """
+    On-disk store: <root>/<sha1 of path+query>.json, with a path-only fallback
+    key (except for spark, where the query is the symbol list).
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def key(path: str, query: str = "") -> str:
+        canonical = path + ("?" + urlencode(sorted(parse_qsl(query))) if query else "")
+        return hashlib.sha1(canonical.encode()).hexdigest()
+
+    def _keys(self, path: str, query: str) -> List[str]:
+        if path == _SPARK_PATH:
+            return [self.key(path, query)]
+        return [self.key(path, query), self.key(path)]
+
+    def save(self, path: str, query: str, status: int, content_type: str, body: bytes):
+        record = {
+            "path": path, "query": query, "status": status, "content_type": content_type,
+            "body_b64": base64.b64encode(body).decode(), "recorded_at": time.time(),
+        }
+        with self._lock:
+            for key in self._keys(path, query):
+                with open(os.path.join(self.root, key + ".json"), "w") as f:
+                    json.dump(record, f, indent=1)
+
+    def load(self, path: str, query: str) -> Optional[Tuple[int, str, bytes]]:
+        for key in self._keys(path, query):
+            file = os.path.join(self.root, key + ".json")
+            if os.path.exists(file):
+                with open(file) as f:
+                    record = json.load(f)
+                return record["status"], record["content_type"], base64.b64decode(record["body_b64"])
+        return None
+
+
+class MarketServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, recordings: Recordings, mode: str = "replay", latency: float = 0.0,
+                 jitter: float = 0.0, error_rate: float = 0.0, hang_rate: float = 0.0,
+                 synthesize: bool = False, seed: int = 0):
+        super().__init__(address, _Handler)
+        self.recordings = recordings
+        self.mode = mode
+        self.latency = latency     # seconds
+        self.jitter = jitter       # seconds, uniform +/-
+        self.error_rate = error_rate
+        self.hang_rate = hang_rate # requests that stall long enough to trip client timeouts
+        self.synthesize = synthesize
+        self.seed = seed
+        self.stats: Dict[str, int] = {"requests": 0, "errors": 0, "hangs": 0, "misses": 0, "bytes": 0}
+        self.symbol_requests: Dict[str, int] = {} # symbol -> requests that asked for it
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def rng_for(self, path: str) -> random.Random:
+        with self._lock:
+            n = self._counts.get(path, 0)
+            self._counts[path] = n + 1
+            self.stats["requests"] += 1
+        return random.Random(f"{self.seed}:{path}:{n}")
+
+    def count(self, stat: str, n: int = 1):
+        with self._lock:
+            self.stats[stat] += n
+
+    def count_symbols(self, symbols: List[str]):
+        with self._lock:
+            for s in symbols:
+                self.symbol_requests[s] = self.symbol_requests.get(s, 0) + 1
+
+    def respond(self, path: str, query: str) -> Tuple[int, str, bytes]:
+        if self.mode == "record":
+            return self._proxy(path, query)
+        found = self.recordings.load(path, query)
+        if found is None and self.synthesize:
+            found = synthesize(path, query)
+        if found is None:
+            self.count("misses")
+            return 404, "text/plain", b"not recorded"
+        return found
+
+    def _proxy(self, path: str, query: str) -> Tuple[int, str, bytes]:
+        upstream = next((host for prefix, host in UPSTREAMS.items() if path.startswith(prefix)), None)
+        if upstream is None:
+            return 404, "text/plain", b"unknown upstream"
+        url = upstream + path + ("?" + query if query else "")
+        try:
+            r = requests.get(url, headers={"User-Agent": USER_AGENT}, timeout=10)
+        except requests.RequestException as e:
+            return 502, "text/plain", str(e).encode()
+        content_type = r.headers.get("Content-Type", "application/octet-stream")
+        # Only keep answers worth replaying; upstream outages are simulated instead
+        if r.status_code < 500:
+            self.recordings.save(path, query, r.status_code, content_type, r.content)
+        return r.status_code, content_type, r.content
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: MarketServer
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        srv = self.server
+        # Spark requests differ only by their symbol list, so that is part of the RNG key
+        rng = srv.rng_for(parts.path + "?" + parts.query if parts.path == _SPARK_PATH else parts.path)
+        srv.count_symbols(requested_symbols(parts.path, parts.query))
+
+        delay = max(0.0, srv.latency + rng.uniform(-srv.jitter, srv.jitter))
+        roll = rng.random()
+        if roll < srv.hang_rate:
+            srv.count("hangs")
+            delay += 30.0
+        time.sleep(delay)
+
+        if srv.hang_rate <= roll < srv.hang_rate + srv.error_rate:
+            srv.count("errors")
+            status, content_type, body = 503, "text/plain", b"injected error"
+        else:
+            status, content_type, body = srv.respond(parts.path, parts.query)
+
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            srv.count("bytes", len(body))
+        except (BrokenPipeError, ConnectionResetError):
+            pass # Client gave up (timeout) - expected when hangs are injected
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_in_thread(server: MarketServer) -> threading.Thread:
+    """Run in the background (tests, benchmarks). Stop with server.shutdown()."""
+    thread = threading.Thread(target=server.serve_forever, daemon=True, name="market-server")
+    thread.start()
+    return thread
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["record", "replay"], default="replay")
+    parser.add_argument("--data", default="market_data", help="Recordings directory")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Added latency per request (ms)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Uniform +/- jitter (ms)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 503")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="Fraction of requests stalled by 30s")
+    parser.add_argument("--synthesize", action="store_true", help="Invent prices for unrecorded symbols")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    server = MarketServer(
+        (args.host, args.port), Recordings(args.data), mode=args.mode,
+        latency=args.latency / 1000, jitter=args.jitter / 1000, error_rate=args.error_rate,
+        hang_rate=args.hang_rate, synthesize=args.synthesize, seed=args.seed,
+    )
+    print(f"Market data stand-in ({args.mode}) on {server.url}, recordings in {args.data}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"Stats: {server.stats}")
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
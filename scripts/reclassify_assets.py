@@ -0,0 +1,28 @@
+"""
+Recompute the persisted allocation split of every asset.
+
+    python -m scripts.reclassify_assets
+
+Run after changing RULES in backend/services/classifier.py. Normal inserts
+and edits are classified automatically when they are written.
+"""
+import argparse
+import time
+
+from backend.database import engine
+from backend.services.classifier import reclassify_all
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args(argv)
+
+    engine.echo = False
+    start = time.perf_counter()
+    updated = reclassify_all(engine, batch_size=args.batch_size)
+    print(f"Reclassified {updated} assets in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
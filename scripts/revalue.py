@@ -0,0 +1,57 @@
+"""
+Revalue every portfolio on a process pool and persist the results.
+
+    python -m scripts.revalue                   # once, one worker per core
+    python -m scripts.revalue --workers 4 --user 1 --user 2
+    python -m scripts.revalue --at 02:30        # nightly, runs until stopped
+
+All users in a run share one quote and FX snapshot. Results land in the
+PortfolioValuation / PositionValuation tables (see GET /valuations/latest).
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+
+from backend.database import create_db_and_tables, engine
+from backend.services.revaluation import BATCH_USERS, revalue
+
+
+def run_once(args):
+    run = revalue(engine, args.user, args.workers, args.batch_users)
+    rate = run.users / run.seconds if run.seconds else 0.0
+    print(f"Run {run.id}: {run.users:,} users, {run.positions:,} positions on {run.workers} "
+          f"worker(s) in {run.seconds:.1f}s ({rate:,.0f} users/s)")
+
+
+def seconds_until(hhmm: str) -> float:
+    hour, minute = map(int, hhmm.split(":"))
+    now = datetime.now()
+    target = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if target <= now:
+        target += timedelta(days=1)
+    return (target - now).total_seconds()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, help="processes (default: CPU count)")
+    parser.add_argument("--user", type=int, action="append", help="user id (repeatable; default: all users)")
+    parser.add_argument("--batch-users", type=int, default=BATCH_USERS)
+    parser.add_argument("--at", metavar="HH:MM", help="run daily at this local time instead of once")
+    args = parser.parse_args(argv)
+
+    engine.echo = False
+    create_db_and_tables()
+    if not args.at:
+        run_once(args)
+        return
+    while True:
+        time.sleep(seconds_until(args.at))
+        try:
+            run_once(args)
+        except Exception as e:
+            print(f"Nightly revaluation failed: {e}")
+
+
+if __name__ == "__main__":
+    main()
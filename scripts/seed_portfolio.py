@@ -1,15 +1,21 @@
 
 
+import argparse
+import random
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Tuple
+
 from sqlmodel import Session, select, delete
-from datetime import datetime
 
 from backend.database import engine, create_db_and_tables
-from backend.models import User, Asset, Settings, StockGrant
+from backend.models import User, Asset, Settings, StockGrant, Transaction, PositionSnapshot
 import pandas as pd
 
 def wipe_data(session: Session):
-    """Deletes all rows from Asset and StockGrant tables."""
+    """Deletes all rows from Asset and StockGrant tables (and the assets' ledger)."""
     print("Wiping existing Asset and StockGrant data...")
+    session.exec(delete(PositionSnapshot))
+    session.exec(delete(Transaction))
     session.exec(delete(Asset))
     session.exec(delete(StockGrant))
     session.commit()
@@ -57,7 +63,7 @@ def seed_data():
         # US Funds (Rows 46-47)
         assets_to_add.append(Asset(user_id=user.id, name="Invesco S&P 500", ticker="1183441", quantity=875, cost_per_unit=42.73, type="Israeli Stock", currency="ILS", category="Brokerage", alloc_us_stock_pct=1.0))
         assets_to_add.append(Asset(user_id=user.id, name="iShares S&P 500", ticker="1159250", quantity=4.15, cost_per_unit=2295.7, type="Israeli Stock", currency="ILS", category="Brokerage", alloc_us_stock_pct=1.0)) 
-        assets_to_add.append(Asset(user_id=user.id, name="AAA MTF Indexed", ticker="5133210", quantity=6244.42, cost_per_unit=1.13, type="Israeli Gov Bond", currency="ILS", category="Bank Account", alloc_bonds_pct=1.0))
+        assets_to_add.append(Asset(user_id=user.id, name="AAA MTF Indexed", ticker="5133210", quantity=6244.42, cost_per_unit=1.13, type="CPI-Linked Bond", currency="ILS", category="Bank Account", alloc_bonds_pct=1.0))
         
         # Corporate Bonds (Rows 49-53) - NEW
         assets_to_add.append(Asset(user_id=user.id, name="Azrieli Bond H", ticker="1178656", quantity=50000, cost_per_unit=1.12, type="Israeli Corporate Bond", currency="ILS", category="Bank Account", alloc_bonds_pct=1.0))
@@ -144,5 +150,112 @@ def seed_data():
         session.commit()
         print(f"Seeded {len(assets_to_add)} assets.")
 
+
+# --- Synthetic Portfolios (benchmarks / load tests) ---
+# Templates mirror the real seed above: (type, currency, category, bucket field, ticker pool)
+SYNTHETIC_TEMPLATES = [
+    ("Israeli Gov Bond", "ILS", "Bank Account", "alloc_bonds_pct", [str(1100000 + i * 37) for i in range(400)]),
+    ("Israeli Corporate Bond", "ILS", "Bank Account", "alloc_bonds_pct", [str(1150000 + i * 53) for i in range(400)]),
+    ("Israeli Stock", "ILS", "Brokerage", "alloc_us_stock_pct", [str(5100000 + i * 71) for i in range(200)]),
+    ("US Stock/ETF", "USD", "Investment Fund", "alloc_us_stock_pct", ["VOO", "QQQ", "VTI", "AAPL", "NVDA", "AMZN", "ETHA", "SCHD"]),
+    ("GSU/RSU", "USD", "Work", "alloc_work_pct", ["GOOG", "MSFT"]),
+    ("Cryptocurrency", "USD", "Crypto Wallet", "alloc_crypto_pct", ["BTC", "ETH", "SOL", "ADA"]),
+    ("Cash/Deposit", "ILS", "Bank Account", "alloc_cash_pct", ["ILS", "USD"]),
+    ("Fund", "ILS", "Pension", None, ["CLAL_PEN", "HAR_PEN", "MIG_PEN", "PHX_MAN"]),
+    ("Liability", "ILS", "Future Needs", None, ["HOUSE", "TUITION", "CAR"]),
+]
+SYNTHETIC_WEIGHTS = [20, 15, 10, 20, 5, 8, 10, 8, 4]
+
+
+def iter_synthetic_assets(n_positions: int, n_users: int = 1, seed: int = 0) -> Iterator[Asset]:
+    """
+    Deterministic stream of `n_positions` assets spread round-robin over user ids
+    1..n_users. Same (n_positions, n_users, seed) always yields the same book.
+    """
+    rng = random.Random(seed)
+    for i in range(n_positions):
+        typ, ccy, cat, bucket, pool = rng.choices(SYNTHETIC_TEMPLATES, SYNTHETIC_WEIGHTS)[0]
+        ticker = rng.choice(pool)
+        qty = round(rng.lognormvariate(6, 1.5), 4) if typ.startswith("Israeli") else round(rng.lognormvariate(2, 1.2), 4)
+        cpu = round(rng.uniform(0.5, 2.0), 4) if ccy == "ILS" and typ.startswith("Israeli") else round(rng.lognormvariate(4, 1.0), 2)
+        fields = dict(
+            user_id=1 + i % n_users, name=f"{typ} {ticker} #{i}", ticker=ticker, type=typ, currency=ccy,
+            category=cat, quantity=qty, cost_per_unit=cpu, cost_basis=round(qty * cpu, 2),
+            date_acquired=datetime(2015, 1, 1) + timedelta(days=rng.randrange(3650)),
+        )
+        if cat == "Pension":
+            fields.update(quantity=1, manual_price=round(rng.uniform(5000, 400000), 2),
+                          alloc_il_stock_pct=0.3, alloc_us_stock_pct=0.5, alloc_bonds_pct=0.2)
+        elif cat == "Future Needs":
+            fields.update(quantity=1, manual_price=-round(rng.uniform(10000, 500000), 2), cost_basis=0.0)
+        elif bucket and rng.random() < 0.8:
+            # 20% left without splits to exercise the auto-categorize path
+            fields[bucket] = 1.0
+        yield Asset(**fields)
+
+
+def generate_portfolio(n_positions: int, n_users: int = 1, seed: int = 0) -> Tuple[List[Asset], List[StockGrant], Dict[int, Settings]]:
+    """Assets, GSU grants (4 per user) and per-user Settings for a synthetic book."""
+    rng = random.Random(seed + 1)
+    assets = list(iter_synthetic_assets(n_positions, n_users, seed))
+    grants = []
+    settings = {}
+    for uid in range(1, n_users + 1):
+        for g in range(4):
+            grant_date = datetime(2022 + g, 3, 1)
+            grants.append(StockGrant(user_id=uid, name=f"GSU {2022 + g}", grant_date=grant_date,
+                                     vest_date=grant_date + timedelta(days=730), units=rng.randint(5, 80),
+                                     grant_price=round(rng.uniform(90, 190), 2), is_vested=g < 2))
+        settings[uid] = Settings(user_id=uid, gsu_tax_mode=rng.choice(["Average", "Current", "Optimized"]),
+                                 allocation_targets='{"US Stocks": 35.0, "IL Stocks": 15.0, "Work": 10.0, "Crypto": 5.0, "Bonds": 20.0, "Cash": 15.0}')
+    return assets, grants, settings
+
+
+def synthetic_prices(assets, seed: int = 0) -> Dict[str, float]:
+    """Deterministic live prices for every symbol in `assets` (TASE in Shekels)."""
+    from backend.services.valuation import asset_symbol
+
+    rng = random.Random(seed + 2)
+    prices = {}
+    for a in assets:
+        sym = asset_symbol(a)
+        if sym not in prices:
+            prices[sym] = round(a.cost_per_unit * rng.uniform(0.7, 1.6), 4) if a.cost_per_unit else round(rng.uniform(50, 500), 2)
+    return prices
+
+
+def seed_synthetic(n_positions: int, n_users: int, seed: int = 0, batch_size: int = 10000):
+    """Replace all data with a synthetic book, inserting in batches."""
+    create_db_and_tables()
+    assets, grants, settings = generate_portfolio(0, n_users, seed)
+    with Session(engine) as session:
+        wipe_data(session)
+        session.exec(delete(Settings))
+        for uid in range(1, n_users + 1):
+            if not session.get(User, uid):
+                session.add(User(id=uid, email=f"user{uid}@example.com", name=f"Synthetic User {uid}"))
+        session.add_all(grants)
+        session.add_all(settings.values())
+        session.commit()
+
+        batch = []
+        for asset in iter_synthetic_assets(n_positions, n_users, seed):
+            batch.append(asset)
+            if len(batch) >= batch_size:
+                session.add_all(batch)
+                session.commit()
+                batch = []
+        session.add_all(batch)
+        session.commit()
+    print(f"Seeded {n_positions} synthetic assets across {n_users} users.")
+
 if __name__ == "__main__":
-    seed_data()
+    parser = argparse.ArgumentParser(description="Seed the portfolio database")
+    parser.add_argument("--synthetic", type=int, metavar="N", help="seed N generated positions instead of the real book")
+    parser.add_argument("--users", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.synthetic is not None:
+        seed_synthetic(args.synthetic, args.users, args.seed)
+    else:
+        seed_data()
@@ -0,0 +1,69 @@
+from datetime import date, datetime
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from backend.models import Settings, StockGrant
+from backend.services.cashflow import CashFlowPlanner, accumulate, plan_frame
+from backend.services.positions import Position
+
+
+def position(name, value, category="Brokerage", due_date=None, tax=0.0):
+    asset = SimpleNamespace(name=name, ticker=name, type="Stock", category=category, currency="ILS", quantity=1.0,
+                            manual_price=None, tax_rate=None, due_date=due_date)
+    return Position(asset, name, (), value, value, value, tax)
+
+
+def test_accumulate_matches_the_monthly_recurrence():
+    rng = np.random.default_rng(0)
+    flows = rng.normal(0, 5000, 480)
+    growth = 1.05 ** (1 / 12)
+    expected = [1e6]
+    for f in flows:
+        expected.append(expected[-1] * growth + f)
+    assert accumulate(1e6, flows, growth) == pytest.approx(expected, rel=1e-9)
+
+
+def test_retired_plan_withdraws_the_swr_amount_and_pays_dated_needs_when_due():
+    positions = [position("VOO", 1_000_000.0, tax=100_000.0),
+                 position("HOUSE", -200_000.0, "Future Needs", due_date=datetime(2031, 6, 1)),
+                 position("CAR", -50_000.0, "Future Needs")]
+    settings = Settings(user_id=1, swr_rate=0.04)
+    planner = CashFlowPlanner(positions, [], settings, start=date(2026, 10, 19))
+
+    plan = planner.run(real_return=0.0)
+
+    # Undated needs stay netted like process_portfolio; the dated one stays invested until June 2031
+    assert planner.opening == pytest.approx(850_000.0)
+    assert plan["withdrawal_monthly"] == pytest.approx(850_000.0 * 0.04 / 12)
+    due = 4 * 12 + 8
+    assert plan["liabilities"][due] == pytest.approx(200_000.0)
+    assert plan["balance"][due + 1] - plan["balance"][due] == pytest.approx(-200_000.0 - plan["withdrawal_monthly"])
+    assert plan["depleted_month"] is not None # No growth: 4% a year runs out within the horizon
+
+
+def test_contributions_and_gsu_vests_until_retirement():
+    grants = [StockGrant(user_id=1, name="GSU", grant_date=datetime(2025, 1, 1), vest_date=datetime(2027, 1, 15),
+                         units=10, grant_price=150.0, is_vested=False),
+              StockGrant(user_id=1, name="Old", grant_date=datetime(2020, 1, 1), vest_date=datetime(2022, 1, 1),
+                         units=99, grant_price=50.0, is_vested=True)]
+    settings = Settings(user_id=1, gsu_tax_mode="Average", monthly_contribution=10_000.0, retirement_year=2036)
+    planner = CashFlowPlanner([position("VOO", 500_000.0)], grants, settings, gsu_price=200.0, usd_rate=3.5,
+                              start=date(2026, 10, 1))
+
+    plan = planner.run()
+
+    assert plan["gsu"].sum() == pytest.approx(10 * 200.0 * 0.65 * 3.5) # Average mode: 35% blended tax
+    assert plan["gsu"][3] == plan["gsu"].sum()
+    retire = plan["retirement_month"]
+    assert retire == 9 * 12 + 3
+    assert plan["contributions"][:retire].min() == plan["contributions"][:retire].max() == 10_000.0
+    assert not plan["contributions"][retire:].any() and not plan["withdrawals"][:retire].any()
+    assert plan["withdrawal_monthly"] == pytest.approx(plan["balance"][retire] * 0.04 / 12)
+    # Real growth above 4% keeps the plan alive for the whole horizon
+    assert plan["depleted_month"] is None
+
+    yearly = plan_frame(plan)
+    assert len(yearly) == 41
+    assert yearly["Contributions"].iloc[1] == pytest.approx(120_000.0)
@@ -0,0 +1,56 @@
+from types import SimpleNamespace
+
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from backend.models import Asset
+from backend.services import classifier
+from backend.services.classifier import Rule, classify, register_classification_hooks, reclassify_all
+
+
+def make_asset(**fields):
+    base = dict(name="Asset", ticker="X", type="Stock", category="Brokerage", currency="ILS",
+                alloc_il_stock_pct=0.0, alloc_us_stock_pct=0.0, alloc_crypto_pct=0.0,
+                alloc_work_pct=0.0, alloc_bonds_pct=0.0, alloc_cash_pct=0.0)
+    base.update(fields)
+    return SimpleNamespace(**base)
+
+
+def test_rules_match_legacy_heuristics():
+    assert classify(make_asset(type="Cryptocurrency", currency="USD")) == {"Crypto": 1.0}
+    assert classify(make_asset(ticker="MSFT", currency="USD")) == {"Work": 1.0}
+    assert classify(make_asset(name="Govt Shekel 0330")) == {"Bonds": 1.0}
+    assert classify(make_asset(name="Bank Deposit")) == {"Cash": 1.0}
+    assert classify(make_asset(currency="USD")) == {"US Stocks": 1.0}
+    assert classify(make_asset()) == {"IL Stocks": 1.0}
+    assert classify(make_asset(category="Future Needs")) == {}
+    # Explicit splits win over any rule
+    split = classify(make_asset(type="Cryptocurrency", alloc_us_stock_pct=0.6, alloc_cash_pct=0.4))
+    assert {b: w for b, w in split.items() if w} == {"US Stocks": 0.6, "Cash": 0.4}
+
+
+def test_split_persisted_on_write_and_reclassified(monkeypatch):
+    engine = create_engine("sqlite://")
+    SQLModel.metadata.create_all(engine)
+    register_classification_hooks(Asset)
+
+    with Session(engine) as session:
+        asset = Asset(user_id=1, ticker="VOO", type="ETF", quantity=1, currency="USD", name="Vanguard")
+        session.add(asset)
+        session.commit()
+        assert asset.allocation_split == '{"US Stocks":1.0}'
+
+        asset.alloc_bonds_pct = 1.0
+        session.add(asset)
+        session.commit()
+        assert asset.allocation_split == '{"Bonds":1.0}'
+
+    monkeypatch.setattr(classifier, "RULES", [Rule("Crypto", ticker="SPY")])
+    with Session(engine) as session:
+        session.add(Asset(user_id=1, ticker="SPY", type="ETF", quantity=1, currency="USD"))
+        session.commit()
+    monkeypatch.setattr(classifier, "RULES", [Rule("US Stocks", currency="USD")])
+
+    assert reclassify_all(engine, batch_size=1) == 1
+    with Session(engine) as session:
+        splits = [a.allocation_split for a in session.exec(select(Asset).order_by(Asset.id))]
+    assert splits == ['{"Bonds":1.0}', '{"US Stocks":1.0}']
@@ -0,0 +1,54 @@
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+import numpy as np
+
+from backend.services.classifier import encode_split
+from backend.services.downsample import history_series, lttb, minmax, select_points
+from backend.services.performance import TOTAL, PerformanceBook
+
+
+def noisy_series(n=20000, seed=0):
+    rng = np.random.default_rng(seed)
+    y = np.cumsum(rng.normal(0, 1, n))
+    y[12345] += 500.0 # one-day spike
+    return np.arange(n, dtype=float), y
+
+
+def test_lttb_keeps_endpoints_and_spikes():
+    x, y = noisy_series()
+    idx = lttb(x, y, 500)
+    assert len(idx) == 500 and idx[0] == 0 and idx[-1] == len(x) - 1
+    assert np.all(np.diff(idx) > 0)
+    assert 12345 in idx
+    assert len(lttb(x[:100], y[:100], 500)) == 100 # short series pass through
+
+
+def test_minmax_keeps_every_bucket_extreme():
+    x, y = noisy_series()
+    idx = minmax(x, y, 400)
+    assert len(idx) <= 402
+    assert {int(y.argmax()), int(y.argmin()), 0, len(x) - 1} <= set(idx.tolist())
+    for lo, hi in zip(range(0, 20000, 100), range(100, 20001, 100)):
+        assert y[lo:hi].max() == y[idx[(idx >= lo) & (idx < hi)]].max()
+
+
+def test_history_payload_is_bounded_by_width():
+    days = [date(2000, 1, 1) + timedelta(days=i) for i in range(9000)]
+    values = np.linspace(100.0, 1000.0, 9000)[:, None] * np.array([[1.0, 2.0, 3.0]]) # two positions + total
+    values[:, 2] = values[:, 0] + values[:, 1]
+    book = PerformanceBook(days, ["A (VOO)", "B (BTC)", TOTAL], values, np.zeros_like(values))
+    book.asset_ids = [1, 2]
+    assets = [SimpleNamespace(id=1, allocation_split=encode_split({"US Stocks": 1.0}), ticker="VOO"),
+              SimpleNamespace(id=2, allocation_split=encode_split({"Crypto": 1.0}), ticker="BTC")]
+
+    for start in (None, date(2024, 1, 1)):
+        history = history_series(book, assets, start, width_px=800)
+        nw_days, nw = history["net_worth"]
+        b_days, buckets = history["buckets"]
+        assert len(nw_days) <= 400 and len(b_days) <= 400
+        assert nw[TOTAL][-1] == values[-1, 2]
+        assert buckets["US Stocks"][-1] == values[-1, 0] and buckets["Crypto"][-1] == values[-1, 1]
+    # A narrow window keeps full resolution
+    assert len(history_series(book, assets, days[-100], width_px=800)["net_worth"][0]) == 100
+    assert len(select_points(np.arange(10), np.zeros((10, 3)), 400)) == 10
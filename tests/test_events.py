@@ -0,0 +1,110 @@
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+from backend.services.events import PortfolioHub, diff
+from backend.services.fx import FXMatrix
+from backend.services.streaming import LocalFeed
+from backend.services.valuation import process_portfolio
+
+
+def make_asset(id_, ticker, type_, qty):
+    return SimpleNamespace(id=id_, ticker=ticker, type=type_, currency="USD", quantity=qty, cost_basis=0.0,
+                           manual_price=None, name=ticker, category="Crypto Wallet", tax_rate=None,
+                           alloc_il_stock_pct=0.0, alloc_us_stock_pct=0.0, alloc_crypto_pct=1.0,
+                           alloc_work_pct=0.0, alloc_bonds_pct=0.0, alloc_cash_pct=0.0)
+
+
+def loader(user_id):
+    assets = [make_asset(1, "BTC", "Cryptocurrency", 1), make_asset(2, "VOO", "ETF", 3)]
+    settings = SimpleNamespace(base_currency="USD", tax_rate_capital_gains=0.25, swr_rate=0.04, use_manual_fx=False)
+    fx = FXMatrix({"USD": 1.0, "ILS": 3.6})
+    summary, positions = process_portfolio(assets, {"BTC-USD": 100.0, "VOO": 500.0}, fx, settings)
+    return summary, positions, fx, settings
+
+
+def test_diff_only_reports_changes():
+    old = {"positions": {"1": {"value": 1}, "2": {"value": 2}}, "totals": {"net_worth": 3}, "allocations": {"Cash": 3}}
+    new = {"positions": {"1": {"value": 5}}, "totals": {"net_worth": 5}, "allocations": {"Cash": 3}}
+    assert diff(old, new) == {"positions": {"1": {"value": 5}, "2": None}, "totals": {"net_worth": 5}}
+
+
+def test_stream_sends_snapshot_then_throttled_delta():
+    ticks = [{"symbol": "BTC-USD", "price": 100.0 + i} for i in range(1, 6)]
+    hub = PortfolioHub(loader=loader, feed_factory=lambda syms, start: LocalFeed(ticks=ticks, interval=0.01),
+                       fx_interval=3600)
+
+    async def collect():
+        events = []
+        gen = hub.events(1, min_interval=0.2)
+        async for msg in gen:
+            events.append(msg)
+            if len(events) == 2:
+                await gen.aclose()
+                break
+        return events
+
+    snapshot, delta = asyncio.run(collect())
+
+    assert snapshot.startswith("event: snapshot")
+    assert delta.startswith("event: delta")
+    payload = json.loads(delta.split("data: ", 1)[1])
+    # Five ticks within the throttle window arrive as one delta for the BTC position only
+    assert list(payload["positions"]) == ["1"]
+    assert payload["positions"]["1"]["price"] == 105.0
+    assert payload["totals"]["net_worth"] == 1605.0
+
+
+def test_concurrent_first_connections_share_one_load_and_task():
+    calls = []
+
+    def slow_loader(user_id):
+        calls.append(user_id)
+        time.sleep(0.05)
+        return loader(user_id)
+
+    hub = PortfolioHub(loader=slow_loader, feed_factory=lambda syms, start: LocalFeed(ticks=[], interval=0.01),
+                       fx_interval=3600)
+
+    async def connect_twice():
+        first, second = await asyncio.gather(hub._state(1), hub._state(1))
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        first.task.cancel()
+        return first, second, tasks
+
+    first, second, tasks = asyncio.run(connect_twice())
+
+    assert calls == [1]
+    assert first is second
+    assert tasks == [first.task]
+
+
+def test_polled_quote_change_sends_delta():
+    polls = []
+
+    def quotes(symbols):
+        polls.append(list(symbols))
+        return {"VOO": SimpleNamespace(price=510.0)}
+
+    hub = PortfolioHub(loader=loader, feed_factory=lambda syms, start: LocalFeed(ticks=[], interval=0.01),
+                       fx_interval=3600, quote_interval=0.01, quote_source=quotes)
+
+    async def collect():
+        events = []
+        gen = hub.events(1, min_interval=0.0)
+        async for msg in gen:
+            events.append(msg)
+            if len(events) == 2:
+                await gen.aclose()
+                break
+        return events
+
+    snapshot, delta = asyncio.run(collect())
+
+    # Only the non-crypto symbol is polled; the stream owns BTC
+    assert polls[0] == ["VOO"]
+    payload = json.loads(delta.split("data: ", 1)[1])
+    assert list(payload["positions"]) == ["2"]
+    assert payload["positions"]["2"]["price"] == 510.0
+    assert payload["totals"]["net_worth"] == 1630.0
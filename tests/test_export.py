@@ -0,0 +1,90 @@
+import csv
+import io
+import zipfile
+from datetime import datetime
+
+import pytest
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine
+
+from backend.models import Asset, Settings, StockGrant
+from backend.services import export as exporter
+from backend.services.fx import FXMatrix
+
+
+@pytest.fixture
+def book(monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(Settings(user_id=1))
+        session.add(Settings(user_id=2, tax_rate_capital_gains=0.5))
+        for i in range(7):
+            session.add(Asset(user_id=1 + i % 2, name=f"Fund <{i}> & co", ticker="VOO", type="ETF",
+                              currency="USD", quantity=i + 1, cost_basis=100.0 * (i + 1), category="Brokerage"))
+        session.add(StockGrant(user_id=1, name="GSU 2024", grant_date=datetime(2024, 1, 1),
+                               vest_date=datetime(2025, 1, 1), units=10, grant_price=150.0))
+        session.commit()
+    monkeypatch.setattr(exporter, "engine", engine)
+    monkeypatch.setattr(exporter, "get_live_prices", lambda symbols: {"VOO": 200.0})
+    monkeypatch.setattr(exporter, "get_fx_matrix", lambda currencies: FXMatrix({"USD": 1.0, "ILS": 4.0}))
+    return engine
+
+
+def test_csv_positions_stream_in_chunks(book):
+    chunks = list(exporter.export("positions", "csv", chunk_rows=2))
+    # Header first, then one piece per 2-asset chunk
+    assert len(chunks) == 1 + 4
+    rows = list(csv.DictReader(io.StringIO(b"".join(chunks).decode())))
+    assert len(rows) == 7
+    first = rows[0]
+    assert float(first["market_value"]) == pytest.approx(1 * 200 * 4.0)
+    assert float(first["tax"]) == pytest.approx((800 - 400) * 0.25)
+    assert float(rows[1]["tax"]) == pytest.approx((1600 - 800) * 0.5)  # user 2 settings
+    assert [r["user_id"] for r in exporter.iter_positions([2], 10).__next__()] == [2, 2, 2]
+
+
+def test_other_base_currencies_are_fetched_and_missing_rates_do_not_abort(book, monkeypatch):
+    with Session(book) as session:
+        session.add(Settings(user_id=3, base_currency="EUR"))
+        session.add(Settings(user_id=4, base_currency="GBP"))
+        session.add(Asset(user_id=3, name="SAP", ticker="VOO", type="ETF", currency="USD", quantity=1, cost_basis=50.0))
+        session.add(Asset(user_id=4, name="BP", ticker="VOO", type="ETF", currency="USD", quantity=1, cost_basis=50.0))
+        session.commit()
+    requested = []
+
+    def matrix(currencies):
+        requested.append(set(currencies))
+        return FXMatrix({"USD": 1.0, "ILS": 4.0, "EUR": 0.8}) # No GBP rate
+
+    monkeypatch.setattr(exporter, "get_fx_matrix", matrix)
+    rows = list(csv.DictReader(io.StringIO(b"".join(exporter.export("positions", "csv", [3, 4])).decode())))
+
+    assert requested == [{"USD", "ILS", "EUR", "GBP"}]
+    eur, gbp = rows
+    assert float(eur["market_value"]) == pytest.approx(200 * 0.8)
+    assert gbp["base_currency"] == "GBP" and gbp["market_value"] == "" and gbp["name"] == "BP"
+
+
+def test_xlsx_is_a_valid_workbook(book):
+    data = b"".join(exporter.export("positions", "xlsx", chunk_rows=3))
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert zf.testzip() is None
+        sheet = zf.read("xl/worksheets/sheet1.xml").decode()
+    assert sheet.count("<row>") == 8
+    assert "Fund &lt;0&gt; &amp; co" in sheet
+
+
+def test_parquet_round_trip(book):
+    pq = pytest.importorskip("pyarrow.parquet")
+    data = b"".join(exporter.export("grants", "parquet"))
+    table = pq.read_table(io.BytesIO(data))
+    assert table.column_names == [name for name, _ in exporter.COLUMNS["grants"]]
+    assert table.to_pylist()[0]["grant_date"] == datetime(2024, 1, 1)
+
+
+def test_unknown_dataset_or_format():
+    with pytest.raises(ValueError):
+        exporter.check_export("positions", "json")
+    with pytest.raises(ValueError):
+        exporter.check_export("secrets", "csv")
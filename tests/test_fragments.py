@@ -0,0 +1,42 @@
+from datetime import date
+
+from backend.services.fragments import FragmentCache, allocation_table, fragment_cache, gsu_table, rebalancing_table
+
+BUCKETS = ['US Stocks', 'IL Stocks', 'Bonds', 'Cash', 'Crypto', 'Work']
+
+
+def test_tables_are_memoized_on_input():
+    fragment_cache.clear()
+    allocs = {'US Stocks': 60000.0, 'Bonds': 40000.0}
+    targets = {'US Stocks': 50.0, 'Bonds': 50.0}
+    first = allocation_table(allocs, targets, 100000.0, BUCKETS)
+    assert allocation_table(dict(allocs), dict(targets), 100000.0, BUCKETS) is first
+    assert (fragment_cache.hits, fragment_cache.misses) == (1, 1)
+
+    # Any input change renders again
+    moved = allocation_table({**allocs, 'Bonds': 41000.0}, targets, 101000.0, BUCKETS)
+    assert moved != first and fragment_cache.misses == 2
+    assert "-₪10,000 (Sell)" in first and "+₪10,000 (Buy)" in first
+    assert first.count("<tr>") == len(BUCKETS) + 1 and "\n" not in first
+
+    rebalance = rebalancing_table(allocs, targets, 100000.0, ['Cash'])
+    assert "No Action" in rebalance and "SELL" not in rebalance
+
+
+def test_gsu_table_values_unvested_at_price():
+    groups = [{'grant_date': date(2022, 3, 1), 'grant_price': 120.0, 'vest_date': date(2026, 3, 1),
+               'total': 100, 'vested': 60, 'unvested': 40}]
+    html = gsu_table(groups, 175.0)
+    assert "<td>01/03/2022</td>" in html and "$7,000" in html
+    assert gsu_table(groups, 180.0) != html
+
+
+def test_cache_evicts_least_recently_used():
+    cache = FragmentCache(maxsize=2)
+    cache.get("t", 1, lambda: "one")
+    cache.get("t", 2, lambda: "two")
+    cache.get("t", 1, lambda: "unused")
+    cache.get("t", 3, lambda: "three")
+    assert len(cache) == 2
+    assert cache.get("t", 1, lambda: "again") == "one"
+    assert cache.get("t", 2, lambda: "rendered") == "rendered"
@@ -0,0 +1,87 @@
+import math
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from backend.services.fx import FXMatrix, FXService
+from backend.services.tax import normalize_to_ils
+from backend.services.valuation import process_portfolio
+
+
+def test_matrix_cross_rates_and_vectorized_convert():
+    fx = FXMatrix({"USD": 1.0, "ILS": 3.6, "EUR": 0.9})
+
+    assert fx.rate("EUR", "ILS") == pytest.approx(4.0)
+    out = fx.convert([100, 100, 100, 100], ["USD", "EUR", "ILS", "JPY"], "ILS")
+    assert out[:3].tolist() == pytest.approx([360.0, 400.0, 100.0])
+    assert math.isnan(out[3])
+
+
+def test_service_fetches_missing_pairs_in_one_batch():
+    calls = []
+
+    def fetcher(currencies):
+        calls.append(currencies)
+        return {"ILS": 3.6, "EUR": 0.9, "GBP": 0.8}
+
+    service = FXService(fetcher=fetcher)
+    service.get_matrix(["ILS", "EUR", "GBP"])
+    service.get_matrix(["ILS", "EUR"])
+
+    assert calls == [["EUR", "GBP", "ILS"]]
+    ts, rates = service.history_for("EUR", "ILS")
+    assert rates.tolist() == pytest.approx([4.0])
+
+
+def test_normalize_to_ils_no_longer_passes_through_unknown_currency():
+    fx = FXMatrix({"USD": 1.0, "ILS": 3.6, "EUR": 0.9})
+
+    assert normalize_to_ils(10, "EUR", 3.6, fx) == pytest.approx(40.0)
+    with pytest.raises(ValueError):
+        normalize_to_ils(10, "GBP", 3.6)
+
+
+def test_process_portfolio_converts_to_base_currency():
+    asset = SimpleNamespace(
+        ticker="SAP", type="Stock", currency="EUR", quantity=2, cost_basis=100.0, manual_price=None,
+        name="SAP", category="Brokerage", tax_rate=None,
+        alloc_il_stock_pct=0.0, alloc_us_stock_pct=1.0, alloc_crypto_pct=0.0,
+        alloc_work_pct=0.0, alloc_bonds_pct=0.0, alloc_cash_pct=0.0,
+    )
+    settings = SimpleNamespace(base_currency="ILS", tax_rate_capital_gains=0.25, swr_rate=0.04)
+    fx = FXMatrix({"USD": 1.0, "ILS": 3.6, "EUR": 0.9})
+
+    summary, positions = process_portfolio([asset], {"SAP": 150.0}, fx, settings)
+
+    assert summary['total_net_worth'] == pytest.approx(1200.0)
+    assert positions[0].cost_basis_ils == pytest.approx(400.0)
+
+
+def test_missing_base_currency_is_unconverted_not_an_error():
+    calls = []
+
+    def fetcher(currencies):
+        calls.append(currencies)
+        return {"ILS": 3.6} # EUR pair is down
+
+    service = FXService(fetcher=fetcher)
+    fx = service.get_matrix(["ILS", "EUR"])
+    service.get_matrix(["ILS", "EUR"])
+
+    # The failed pair backs off instead of being refetched on every call
+    assert calls == [["EUR", "ILS"]]
+    assert math.isnan(fx.rate("USD", "EUR"))
+    assert np.isnan(fx.convert([1.0, 2.0], ["USD", "ILS"], "EUR")).all()
+
+    asset = SimpleNamespace(
+        ticker="VOO", type="ETF", currency="USD", quantity=2, cost_basis=100.0, manual_price=None,
+        name="VOO", category="Brokerage", tax_rate=None,
+        alloc_il_stock_pct=0.0, alloc_us_stock_pct=1.0, alloc_crypto_pct=0.0,
+        alloc_work_pct=0.0, alloc_bonds_pct=0.0, alloc_cash_pct=0.0,
+    )
+    settings = SimpleNamespace(base_currency="EUR", tax_rate_capital_gains=0.25, swr_rate=0.04)
+    summary, positions = process_portfolio([asset], {"VOO": 150.0}, fx, settings)
+
+    assert summary['unconverted'] == ["USD"]
+    assert positions[0].mkt_val_ils == 0.0
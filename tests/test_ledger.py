@@ -0,0 +1,101 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from backend.models import Asset, PositionSnapshot, Transaction
+from backend.services import ledger
+
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+
+
+def add_asset(session, **fields):
+    asset = Asset(user_id=1, ticker="VOO", type="ETF", currency="USD", **fields)
+    session.add(asset)
+    session.commit()
+    return asset
+
+
+def test_average_cost_materialized_onto_asset(session):
+    asset = add_asset(session, quantity=0.0)
+    day = datetime(2024, 1, 1)
+    for kind, qty, amount in [(ledger.BUY, 10, 1000.0), (ledger.BUY, 10, 3000.0),
+                              (ledger.SELL, 5, 1500.0), (ledger.DIVIDEND, 0, 40.0), (ledger.FEE, 0, 5.0)]:
+        day += timedelta(days=1)
+        ledger.record(session, Transaction(user_id=1, asset_id=asset.id, kind=kind, quantity=qty,
+                                           amount=amount, trade_date=day))
+
+    session.refresh(asset)
+    assert asset.quantity == 15
+    assert asset.cost_basis == pytest.approx(3000.0)
+    assert asset.cost_per_unit == pytest.approx(200.0)
+    h = ledger.positions_at(session, [asset.id])[asset.id]
+    assert h.realized == pytest.approx(500.0)
+    assert h.income == pytest.approx(35.0)
+    # Point in time: after the two buys only
+    assert ledger.positions_at(session, [asset.id], datetime(2024, 1, 3))[asset.id].quantity == 20
+
+    # Manual edits become an Adjustment, not an in-place overwrite
+    ledger.reconcile(session, asset, 12, 2400.0)
+    assert (asset.quantity, asset.cost_basis) == (12, 2400.0)
+    assert session.exec(select(Transaction).where(Transaction.kind == ledger.ADJUSTMENT)).one().quantity == -3
+
+
+def test_form_edit_keeps_the_entered_unit_cost(session):
+    asset = add_asset(session, quantity=10.0, cost_per_unit=100.0, cost_basis=1000.0, date_acquired=datetime(2024, 1, 1))
+
+    # Quantity and unit cost edited together: the new unit cost applies to the new quantity
+    ledger.edit(session, asset, 12.0, 150.0)
+    assert (asset.quantity, asset.cost_basis, asset.cost_per_unit) == (12.0, 1800.0, 150.0)
+    adjustments = session.exec(select(Transaction).where(Transaction.kind == ledger.ADJUSTMENT)
+                               .order_by(Transaction.id)).all()
+    assert [(t.quantity, t.amount) for t in adjustments] == [(10.0, 1000.0), (2.0, 800.0)]
+
+    # Quantity only: the total cost is kept
+    ledger.edit(session, asset, 24.0, 150.0)
+    assert (asset.quantity, asset.cost_basis, asset.cost_per_unit) == (24.0, 1800.0, 75.0)
+    # Unit cost only
+    ledger.edit(session, asset, 24.0, 80.0)
+    assert (asset.cost_basis, asset.cost_per_unit) == (1920.0, 80.0)
+    assert ledger.positions_at(session, [asset.id])[asset.id].cost_basis == pytest.approx(1920.0)
+
+
+def test_snapshot_replay_matches_full_replay(session, monkeypatch):
+    monkeypatch.setattr(ledger, "SNAPSHOT_EVERY", 8)
+    rng = random.Random(0)
+    assets = [add_asset(session, quantity=5.0, cost_basis=500.0, date_acquired=datetime(2015, 1, 1)) for _ in range(3)]
+    assert ledger.open_positions(session, assets) == 3
+
+    rows = []
+    for asset in assets:
+        for month in range(120):
+            kind = rng.choice([ledger.BUY, ledger.BUY, ledger.SELL, ledger.DIVIDEND])
+            rows.append(Transaction(user_id=1, asset_id=asset.id, kind=kind, quantity=rng.uniform(0.1, 2),
+                                    amount=rng.uniform(10, 300), trade_date=datetime(2015, 2, 1) + timedelta(days=30 * month)))
+    session.add_all(rows)
+    session.commit()
+    assert ledger.rebuild_snapshots(session) == 3 * (121 // 8)
+
+    ids = [a.id for a in assets]
+    # A back-dated entry drops later snapshots; results stay exact either way
+    ledger.record(session, Transaction(user_id=1, asset_id=ids[0], kind=ledger.BUY, quantity=1, amount=90.0,
+                                       trade_date=datetime(2019, 6, 15)))
+    for as_of in [datetime(2016, 3, 1), datetime(2019, 6, 15), datetime(2021, 12, 31), None]:
+        fast = ledger.positions_at(session, ids, as_of)
+        full = ledger.positions_at(session, ids, as_of, use_snapshots=False)
+        for asset_id in ids:
+            assert fast[asset_id].quantity == pytest.approx(full[asset_id].quantity)
+            assert fast[asset_id].cost_basis == pytest.approx(full[asset_id].cost_basis)
+            assert fast[asset_id].realized == pytest.approx(full[asset_id].realized)
+            assert fast[asset_id].replayed <= 8 or asset_id == ids[0]
+    # Only the fresh checkpoint at the tail survives past the back-dated entry
+    later = session.exec(select(PositionSnapshot).where(PositionSnapshot.asset_id == ids[0],
+                                                        PositionSnapshot.as_of > datetime(2019, 6, 15))).all()
+    assert [s.txn_id for s in later] == [max(t.id for t in rows if t.asset_id == ids[0])]
@@ -0,0 +1,89 @@
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from backend.services.market_hours import (CRYPTO, FX, FUND_NAV, MAX_CLOSED_TTL, NYSE, QUOTE_POLICY, SETTLE, TASE,
+                                           open_markets)
+from backend.services.quotes import QuoteCache
+
+NY = ZoneInfo("America/New_York")
+TLV = ZoneInfo("Asia/Jerusalem")
+
+
+def ts(y, m, d, hh, mm, tz):
+    return datetime(y, m, d, hh, mm, tzinfo=tz).timestamp()
+
+
+def test_symbols_route_to_their_market():
+    assert QUOTE_POLICY.market_for("1184076") is TASE
+    assert QUOTE_POLICY.market_for("5139258") is FUND_NAV
+    assert QUOTE_POLICY.market_for("BTC-USD") is CRYPTO
+    assert QUOTE_POLICY.market_for("USDILS=X") is FX
+    assert QUOTE_POLICY.market_for("VOO") is NYSE
+
+
+def test_expiry_follows_session_state():
+    # 2026-10-19 is a Monday
+    open_ = ts(2026, 10, 20, 11, 0, NY)
+    assert NYSE.expires("VOO", open_) == open_ + 300
+    # Close at 16:00; a quote just after it is refetched once the close settles
+    assert NYSE.expires("VOO", ts(2026, 10, 20, 15, 58, NY)) == ts(2026, 10, 20, 16, 3, NY)
+    assert NYSE.expires("VOO", ts(2026, 10, 20, 16, 5, NY)) == ts(2026, 10, 20, 16, 0, NY) + SETTLE
+    # Then it holds until the next open (or the safety cap)
+    assert NYSE.expires("VOO", ts(2026, 10, 21, 6, 0, NY)) == ts(2026, 10, 21, 9, 30, NY)
+    friday_night = ts(2026, 10, 23, 20, 0, NY)
+    assert NYSE.expires("VOO", friday_night) == friday_night + MAX_CLOSED_TTL
+
+    # TASE: short Friday session, closed on Saturday and Sunday
+    assert TASE.is_open(ts(2026, 10, 23, 12, 0, TLV))
+    assert not TASE.is_open(ts(2026, 10, 23, 15, 0, TLV))
+    assert not TASE.is_open(ts(2026, 10, 25, 12, 0, TLV))
+    assert TASE.expires("1184076", ts(2026, 10, 26, 7, 0, TLV)) == ts(2026, 10, 26, 9, 59, TLV)
+
+    # FX trades from Sunday 17:00 to Friday 17:00 New York time, across midnight
+    assert not FX.is_open(ts(2026, 10, 25, 12, 0, NY)) and FX.is_open(ts(2026, 10, 25, 23, 0, NY))
+    assert FX.is_open(ts(2026, 10, 21, 0, 0, NY))
+    # NAVs: one per business day, with the same safety cap over weekends
+    assert FUND_NAV.expires("5139258", ts(2026, 10, 22, 23, 0, TLV)) == ts(2026, 10, 23, 11, 0, TLV)
+    assert FUND_NAV.expires("5139258", ts(2026, 10, 23, 15, 0, TLV)) == ts(2026, 10, 23, 22, 0, TLV)
+    weekend = ts(2026, 10, 23, 23, 0, TLV)
+    assert FUND_NAV.expires("5139258", weekend) == weekend + MAX_CLOSED_TTL
+    assert open_markets(open_) == ["NYSE", "FX", "CRYPTO"]
+
+
+def simulate_week(symbol, expires):
+    """A dashboard rerun every minute for a week: (fetches while closed, worst staleness in minutes while open)."""
+    market = QUOTE_POLICY.market_for(symbol)
+    start = ts(2026, 10, 19, 0, 0, TLV)
+    until = fetched_at = 0.0
+    closed_calls, worst = 0, 0.0
+    for minute in range(7 * 24 * 60):
+        now = start + minute * 60
+        is_open = market.is_open(now)
+        if now >= until:
+            until, fetched_at = expires(now), now
+            closed_calls += not is_open
+        if is_open:
+            worst = max(worst, (now - fetched_at) / 60)
+    return closed_calls, worst
+
+
+@pytest.mark.parametrize("symbol", ["1184076", "5139258", "VOO", "BTC-USD"])
+def test_fewer_calls_while_closed_and_fresher_while_open(symbol):
+    closed, stale = simulate_week(symbol, lambda now: QUOTE_POLICY.expires(symbol, now))
+    flat_closed, flat_stale = simulate_week(symbol, lambda now: now + 1800) # the old fixed TTL
+    assert closed <= flat_closed // 10
+    assert stale < 5 and (stale < flat_stale or flat_stale == 0)
+
+
+def test_quote_cache_uses_policy_expiry():
+    class Frozen:
+        def expires(self, key, fetched_at):
+            return fetched_at + (3600 if key == "VOO" else -1)
+
+    calls = []
+    cache = QuoteCache(lambda tickers: calls.extend(tickers) or {t: 1.0 for t in tickers}, policy=Frozen())
+    cache.get(["VOO", "BTC-USD"])
+    cache.get(["VOO", "BTC-USD"])
+    assert calls == ["VOO", "BTC-USD", "BTC-USD"]
@@ -0,0 +1,79 @@
+import pytest
+
+from backend.services import providers
+from backend.services.providers import (SPARK_CHUNK, PriceRouter, ProviderError, YahooProvider,
+                                        fetch_yahoo_chart_prices, parse_yahoo_spark)
+from scripts.market_server import MarketServer, Recordings, serve_in_thread, synthetic_price
+
+
+@pytest.fixture
+def server(tmp_path):
+    servers = []
+
+    def start(**kwargs):
+        srv = MarketServer(("127.0.0.1", 0), Recordings(str(tmp_path)), **kwargs)
+        serve_in_thread(srv)
+        servers.append(srv)
+        return srv
+
+    yield start
+    for srv in servers:
+        srv.shutdown()
+        srv.server_close()
+
+
+def test_replays_recordings_and_synthesizes_unknown_symbols(server, monkeypatch):
+    srv = server(synthesize=True)
+    srv.recordings.save("/v8/finance/chart/GOOG", "", 200, "application/json",
+                        b'{"chart":{"result":[{"meta":{},"indicators":{"quote":[{"close":[170.0,null]}]}}]}}')
+    monkeypatch.setattr(providers, "BIZPORTAL_BASE_URL", srv.url)
+
+    prices = fetch_yahoo_chart_prices(["GOOG", "MSFT"], base_url=srv.url)
+
+    assert prices == {"GOOG": 170.0, "MSFT": synthetic_price("MSFT")}
+    assert providers._bizportal_request("1184076") == pytest.approx(synthetic_price("1184076"))
+
+
+def test_injected_errors_surface_as_provider_errors(server):
+    srv = server(synthesize=True, error_rate=1.0)
+
+    with pytest.raises(ProviderError):
+        fetch_yahoo_chart_prices(["GOOG"], base_url=srv.url)
+    assert srv.stats["errors"] == 1
+
+
+def test_latency_and_errors_are_reproducible(server):
+    a = server(synthesize=True, error_rate=0.5, seed=7)
+    b = server(synthesize=True, error_rate=0.5, seed=7)
+
+    for srv in (a, b):
+        for _ in range(20):
+            try:
+                fetch_yahoo_chart_prices(["GOOG"], base_url=srv.url)
+            except ProviderError:
+                pass
+
+    assert a.stats == b.stats
+    assert 0 < a.stats["errors"] < 20
+
+
+def test_yahoo_provider_fetches_last_prices_in_spark_chunks(server, monkeypatch):
+    srv = server(synthesize=True, latency=0.02)
+    monkeypatch.setattr(providers, "YAHOO_BASE_URL", srv.url)
+    symbols = [f"S{i:03d}" for i in range(500)]
+
+    yahoo = YahooProvider(rate_per_sec=None)
+    prices = PriceRouter({"yahoo": yahoo}, [], ["yahoo"]).fetch(symbols)
+
+    assert prices == {s: pytest.approx(synthetic_price(s)) for s in symbols}
+    assert srv.stats["requests"] == -(-500 // SPARK_CHUNK)
+    assert set(srv.symbol_requests.values()) == {1}
+
+
+def test_spark_parser_falls_back_to_last_close():
+    payload = {"spark": {"result": [
+        {"symbol": "A", "response": [{"meta": {"regularMarketPrice": 10.5}}]},
+        {"symbol": "B", "response": [{"meta": {}, "indicators": {"quote": [{"close": [3.0, None]}]}}]},
+        {"symbol": "C", "response": []},
+    ]}}
+    assert parse_yahoo_spark(payload) == {"A": 10.5, "B": 3.0}
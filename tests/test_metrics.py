@@ -0,0 +1,56 @@
+import pytest
+from sqlalchemy import create_engine, text
+
+from backend.services import metrics
+from backend.services.metrics import Counter, Histogram, instrument_engine, render_prometheus, timed
+
+
+def test_histogram_buckets_are_cumulative():
+    h = Histogram("t_seconds", "test", ("provider",), buckets=(0.1, 1.0))
+    h.observe(0.05, provider="yahoo")
+    h.observe(0.5, provider="yahoo")
+    h.observe(5.0, provider="yahoo")
+
+    lines = list(h.render())
+
+    assert 't_seconds_bucket{provider="yahoo",le="0.1"} 1' in lines
+    assert 't_seconds_bucket{provider="yahoo",le="1.0"} 2' in lines
+    assert 't_seconds_bucket{provider="yahoo",le="+Inf"} 3' in lines
+    assert 't_seconds_count{provider="yahoo"} 3' in lines
+
+
+def test_timed_decorator_and_counter():
+    h = Histogram("f_seconds", "test")
+    c = Counter("calls_total", "test", ("outcome",))
+
+    @timed(h)
+    def work():
+        c.inc(outcome="ok")
+        return 42
+
+    assert work() == 42
+    assert list(h.render())[-1] == "f_seconds_count 1"
+    assert 'calls_total{outcome="ok"} 1.0' in list(c.render())
+
+
+def test_registry_exposes_hot_path_metrics():
+    text = render_prometheus()
+    assert "# TYPE portfolio_provider_request_seconds histogram" in text
+    assert "# TYPE portfolio_cache_requests_total counter" in text
+
+
+def test_failed_statement_does_not_skew_query_timing(monkeypatch):
+    monkeypatch.setattr(metrics, "ENABLED", True)
+    hist = Histogram("q_seconds", "test", ("statement",))
+    monkeypatch.setattr(metrics, "DB_QUERY_SECONDS", hist)
+    engine = create_engine("sqlite://")
+    instrument_engine(engine)
+
+    with engine.connect() as conn:
+        with pytest.raises(Exception):
+            conn.execute(text("SELECT * FROM missing"))
+        conn.execute(text("SELECT 1"))
+        # Nothing is left on the connection by the statement that raised
+        assert "query_start" not in conn.info
+
+    assert 'q_seconds_count{statement="SELECT"} 1' in list(hist.render())
@@ -0,0 +1,67 @@
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from backend.services import ledger
+from backend.services.performance import TOTAL, build_book, xirr
+
+
+def test_vectorized_xirr_matches_closed_form():
+    years = np.array([0.0, 0.5, 1.0, 2.0])
+    cashflows = np.array([
+        [-1000.0, 0.0, 1100.0, 0.0],       # 10% over one year
+        [-1000.0, 0.0, 0.0, 1000.0],       # flat
+        [-1000.0, -1000.0, 0.0, 2500.0],   # two contributions
+        [-1000.0, 0.0, 0.0, 0.0],          # never returned: undefined
+    ])
+    rates = xirr(cashflows, years)
+    assert rates[0] == pytest.approx(0.10)
+    assert rates[1] == pytest.approx(0.0, abs=1e-9)
+    npv = (cashflows[2] * (1 + rates[2]) ** -years).sum()
+    assert npv == pytest.approx(0.0, abs=1e-6)
+    assert np.isnan(rates[3])
+
+
+def make_book():
+    days = [date(2024, 1, 1) + timedelta(days=i) for i in range(200)]
+    # Price doubles linearly; USD/ILS flat at 3.5
+    history = pd.DataFrame({"VOO": np.linspace(100.0, 200.0, 200), "USDILS=X": 3.5}, index=days)
+    assets = [SimpleNamespace(id=1, name="Vanguard", ticker="VOO", type="ETF", currency="USD", category="Brokerage",
+                              manual_price=None, quantity=15.0),
+              SimpleNamespace(id=2, name="Pension", ticker="MIG", type="Fund", currency="ILS", category="Pension",
+                              manual_price=1000.0, quantity=1.0)]
+    txns = [(1, datetime(2023, 6, 1), ledger.ADJUSTMENT, 10.0, 900.0),
+            (1, datetime(2024, 4, 10), ledger.BUY, 10.0, 10.0 * float(history["VOO"].iloc[100])),
+            (1, datetime(2024, 6, 1), ledger.SELL, 5.0, 5.0 * float(history["VOO"].iloc[152])),
+            (2, datetime(2024, 1, 1), ledger.ADJUSTMENT, 1.0, 0.0)]
+    return build_book(assets, txns, history, {"USD": 3.5}), days
+
+
+def test_twr_ignores_flows_and_ranges_compose():
+    book, days = make_book()
+    twr = dict(zip(book.labels, book.twr()))
+    # Buys and sells at market price leave the time-weighted return equal to the price move
+    assert twr["Vanguard (VOO)"] == pytest.approx(1.0)
+    assert twr["Pension"] == pytest.approx(0.0)
+    assert book.values[-1, book.labels.index(TOTAL)] == pytest.approx(15 * 200 * 3.5 + 1000)
+
+    a, b, c = days[20], days[120], days[180]
+    whole = book.twr(a, c)
+    assert whole == pytest.approx((1 + book.twr(a, b)) * (1 + book.twr(b, c)) - 1)
+
+
+def test_xirr_over_range_weights_money():
+    book, days = make_book()
+    i = book.labels.index("Vanguard (VOO)")
+    # More money was invested in the second half, so the money-weighted rate
+    # differs from the TWR, but it prices the flows to zero NPV
+    rate = book.xirr(days[50], days[199])[i]
+    s, e = book.window(days[50], days[199])
+    cf = -book.flows[s:e + 1, i].copy()
+    cf[0] = -book.values[s, i]
+    cf[-1] += book.values[e, i]
+    years = (book.days[s:e + 1] - book.days[s]).astype(int) / 365.0
+    assert (cf * (1 + rate) ** -years).sum() == pytest.approx(0.0, abs=1e-4)
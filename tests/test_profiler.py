@@ -0,0 +1,65 @@
+import threading
+from types import SimpleNamespace
+
+from backend.services import profiler
+from backend.services.profiler import NullProfiler, RerunProfiler
+
+
+class FakeDeltaGenerator:
+    def markdown(self, body):
+        return body
+
+    def write(self, body):
+        # Like st.write, renders through another output call
+        return self.markdown(body)
+
+
+def fake_streamlit():
+    main = FakeDeltaGenerator()
+    return SimpleNamespace(delta_generator=SimpleNamespace(DeltaGenerator=FakeDeltaGenerator),
+                           markdown=main.markdown, write=main.write)
+
+
+class FakeEngine:
+    pass
+
+
+def test_payload_counts_container_calls_once_and_stays_per_context(monkeypatch):
+    monkeypatch.setattr(profiler, "_engines", {id(FakeEngine)})
+    st = fake_streamlit()
+    profiler.install(st, FakeEngine)
+    column = FakeDeltaGenerator()
+
+    prof = RerunProfiler()
+    prof.begin("rows")
+    st.markdown("abcd")
+    column.markdown("xy")   # st.columns()/containers go through DeltaGenerator
+    column.write("123")     # write -> markdown counts once
+
+    other = {}
+    def other_session():
+        # Another session's thread sees no profiler and records nothing
+        other["active"] = profiler._active.get()
+        column.markdown("ignored")
+    t = threading.Thread(target=other_session)
+    t.start()
+    t.join()
+
+    run = prof.finish()
+    assert run["sections"][0]["bytes"] == 4 + 2 + 3
+    assert other["active"] is None
+    assert profiler._active.get() is None
+
+
+def test_aborted_rerun_does_not_leave_the_profiler_active():
+    prof = RerunProfiler()
+    prof.begin("form")
+    prof.abort()
+    assert profiler._active.get() is None
+
+    stale = RerunProfiler()
+    NullProfiler()  # Profiling switched off on the next rerun
+    assert profiler._active.get() is None
+    RerunProfiler()
+    assert profiler._active.get() is not stale
+    profiler._active.set(None)
@@ -0,0 +1,113 @@
+import time
+from types import SimpleNamespace
+
+from backend.services.providers import (
+    PriceProvider, PriceRouter, OfflineProvider, CSVPriceProvider, DEFAULT_CHAIN, OFFLINE_CHAIN, ROUTES
+)
+from backend.services.fx import FXMatrix
+from backend.services.valuation import process_portfolio
+
+
+class FixedProvider(PriceProvider):
+    def __init__(self, name, prices, delay=0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.name = name
+        self.prices = prices
+        self.delay = delay
+        self.calls = []
+
+    def _fetch(self, tickers):
+        self.calls.append(list(tickers))
+        time.sleep(self.delay)
+        return {t: self.prices[t] for t in tickers if t in self.prices}
+
+
+def test_fallback_chain_fills_missing_tickers():
+    primary = FixedProvider("primary", {"GOOG": 170.0})
+    backup = FixedProvider("backup", {"GOOG": 1.0, "MSFT": 420.0})
+    router = PriceRouter({"primary": primary, "backup": backup}, [], ["primary", "backup"])
+
+    prices = router.fetch(["GOOG", "MSFT", "NOPE"])
+
+    assert prices == {"GOOG": 170.0, "MSFT": 420.0}
+    assert backup.calls == [["MSFT", "NOPE"]]
+
+
+def test_routes_by_pattern():
+    tase = FixedProvider("tase", {"1184076": 0.75})
+    us = FixedProvider("us", {"GOOG": 170.0})
+    router = PriceRouter({"tase": tase, "us": us}, [(r'^\d+(\.TA)?$', ["tase"])], ["us"])
+
+    assert router.fetch(["1184076", "GOOG"]) == {"1184076": 0.75, "GOOG": 170.0}
+    assert us.calls == [["GOOG"]]
+
+
+def test_hedged_request_fires_backup_over_budget():
+    slow = FixedProvider("slow", {"GOOG": 170.0}, delay=1.0, latency_budget=0.05)
+    fast = FixedProvider("fast", {"GOOG": 169.0})
+    router = PriceRouter({"slow": slow, "fast": fast}, [], ["slow", "fast"])
+
+    start = time.monotonic()
+    prices = router.fetch(["GOOG"])
+
+    assert prices == {"GOOG": 169.0}
+    assert time.monotonic() - start < 0.5
+
+
+def test_hedge_also_sends_fast_misses_to_the_backup_and_rest_of_chain():
+    class PerTickerDelay(FixedProvider):
+        def _fetch(self, tickers):
+            self.calls.append(list(tickers))
+            time.sleep(max(self.delay.get(t, 0.0) for t in tickers))
+            return {t: self.prices[t] for t in tickers if t in self.prices}
+
+    primary = PerTickerDelay("primary", {"SLOW": 1.0}, delay={"SLOW": 1.0}, batch_size=1, latency_budget=0.05)
+    backup = FixedProvider("backup", {"SLOW": 2.0, "MISS": 3.0})
+    last = FixedProvider("last", {"GONE": 4.0})
+    router = PriceRouter({"primary": primary, "backup": backup, "last": last}, [], ["primary", "backup", "last"])
+
+    prices = router.fetch(["SLOW", "MISS", "GONE"])
+
+    assert prices == {"SLOW": 2.0, "MISS": 3.0, "GONE": 4.0}
+    assert sorted(t for call in backup.calls for t in call) == ["GONE", "MISS", "SLOW"]
+    assert last.calls == [["GONE"]]
+
+
+def test_concurrency_limit_is_respected():
+    provider = FixedProvider("bizportal", {str(i): 1.0 for i in range(8)}, delay=0.05, max_concurrency=2, batch_size=1)
+    router = PriceRouter({"bizportal": provider}, [], ["bizportal"])
+
+    start = time.monotonic()
+    router.fetch([str(i) for i in range(8)])
+
+    # 8 single-ticker batches, 2 at a time -> at least 4 waves
+    assert time.monotonic() - start >= 0.2
+
+
+def test_csv_and_offline_providers(tmp_path):
+    csv_path = tmp_path / "prices.csv"
+    csv_path.write_text("ticker,price\nIBI_GEN,11200\n")
+    router = PriceRouter({"csv": CSVPriceProvider(path=str(csv_path)), "offline": OfflineProvider()},
+                         [], ["csv", "offline"])
+
+    prices = router.fetch(["IBI_GEN", "ZERO"])
+
+    assert prices["IBI_GEN"] == 11200
+    assert prices["ZERO"] == router.fetch(["ZERO"])["ZERO"] > 0
+
+
+def test_manual_prices_stay_per_asset():
+    # User-entered prices are not quotes: no chain answers them, process_portfolio applies them
+    assert all("manual" not in chain for chain in [DEFAULT_CHAIN, OFFLINE_CHAIN] + [c for _, c in ROUTES])
+
+    def asset(manual_price):
+        return SimpleNamespace(ticker="VOO", type="ETF", currency="USD", quantity=1, cost_basis=0.0,
+                               manual_price=manual_price, name="VOO", category="Brokerage", tax_rate=None,
+                               alloc_il_stock_pct=0.0, alloc_us_stock_pct=1.0, alloc_crypto_pct=0.0,
+                               alloc_work_pct=0.0, alloc_bonds_pct=0.0, alloc_cash_pct=0.0)
+    settings = SimpleNamespace(base_currency="USD", tax_rate_capital_gains=0.25, swr_rate=0.04)
+
+    _, positions = process_portfolio([asset(999.0), asset(None)], {"VOO": 500.0},
+                                     FXMatrix({"USD": 1.0, "ILS": 3.6}), settings)
+
+    assert [p.price for p in positions] == [999.0, 500.0]
@@ -0,0 +1,79 @@
+import time
+
+from backend.services.providers import CircuitBreaker, PriceProvider, PriceRouter
+from backend.services.quotes import QuoteCache
+
+
+class FlakyFetcher:
+    def __init__(self, prices):
+        self.prices = prices
+        self.calls = []
+
+    def __call__(self, tickers):
+        self.calls.append(list(tickers))
+        return {t: self.prices[t] for t in tickers if t in self.prices}
+
+
+def test_failed_ticker_serves_last_known_good_as_stale():
+    fetcher = FlakyFetcher({"GOOG": 170.0})
+    cache = QuoteCache(fetcher, ttl=0, backoff_base=60)
+
+    assert cache.get(["GOOG"])["GOOG"].stale is False
+
+    fetcher.prices = {}
+    quote = cache.get(["GOOG"])["GOOG"]
+    assert quote.price == 170.0
+    assert quote.stale is True
+
+
+def test_failures_are_negatively_cached():
+    fetcher = FlakyFetcher({})
+    cache = QuoteCache(fetcher, ttl=1800, backoff_base=60)
+
+    assert cache.get(["ILS_BOND_OS"]) == {}
+    assert cache.get(["ILS_BOND_OS"]) == {}
+    assert fetcher.calls == [["ILS_BOND_OS"]]
+
+
+def test_backoff_grows_exponentially():
+    fetcher = FlakyFetcher({})
+    cache = QuoteCache(fetcher, ttl=1800, backoff_base=10, backoff_max=25)
+
+    cache.get(["X"])
+    first = cache._failures["X"][1] - time.time()
+    cache._failures["X"][1] = 0.0
+    cache.get(["X"])
+    second = cache._failures["X"][1] - time.time()
+    cache._failures["X"][1] = 0.0
+    cache.get(["X"])
+    third = cache._failures["X"][1] - time.time()
+
+    assert 9 < first <= 10
+    assert 19 < second <= 20
+    assert 24 < third <= 25
+
+
+def test_circuit_breaker_skips_failing_provider():
+    class DownProvider(PriceProvider):
+        name = "down"
+        calls = 0
+
+        def _fetch(self, tickers):
+            DownProvider.calls += 1
+            raise ConnectionError("unreachable")
+
+    class UpProvider(PriceProvider):
+        name = "up"
+
+        def _fetch(self, tickers):
+            return {t: 1.0 for t in tickers}
+
+    down = DownProvider()
+    down.breaker = CircuitBreaker(threshold=2, cooldown=60)
+    router = PriceRouter({"down": down, "up": UpProvider()}, [], ["down", "up"])
+
+    for _ in range(5):
+        assert router.fetch(["1184076"]) == {"1184076": 1.0}
+
+    assert DownProvider.calls == 2
+    assert not down.breaker.available()
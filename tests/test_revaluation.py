@@ -0,0 +1,66 @@
+import json
+from datetime import datetime
+
+import pytest
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from backend.models import Asset, PortfolioValuation, PositionValuation, Settings, User, ValuationRun
+from backend.services.fx import FXMatrix
+from backend.services.revaluation import MarketSnapshot, latest_valuation, revalue
+from backend.services.valuation import process_portfolio
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        for uid in (1, 2, 3):
+            session.add(User(id=uid, email=f"u{uid}@example.com", name=f"User {uid}"))
+        session.add(Settings(user_id=1))
+        session.add(Settings(user_id=2, base_currency="USD", use_manual_fx=True, usd_ils_rate=4.0))
+        session.add_all([
+            Asset(user_id=1, ticker="VOO", type="ETF", currency="USD", category="Brokerage", quantity=10, cost_basis=3000),
+            Asset(user_id=1, ticker="1184076", type="Fund", currency="ILS", category="Pension", quantity=100),
+            Asset(user_id=2, ticker="VOO", type="ETF", currency="USD", category="Brokerage", quantity=5, cost_basis=1000),
+            Asset(user_id=2, ticker="CASH", type="Cash", currency="ILS", category="Cash", quantity=1, manual_price=8000),
+        ])
+        session.commit()
+    return engine
+
+
+def test_persisted_values_match_process_portfolio(engine):
+    snapshot = MarketSnapshot({"VOO": 500.0, "1184076": 20.0}, FXMatrix({"USD": 1.0, "ILS": 3.5}), datetime(2024, 1, 2))
+    run = revalue(engine, workers=1, batch_users=1, snapshot=snapshot)
+    assert (run.status, run.users, run.positions) == ("done", 2, 4)
+
+    with Session(engine) as session:
+        for uid in (1, 2):
+            settings = session.exec(select(Settings).where(Settings.user_id == uid)).one()
+            assets = session.exec(select(Asset).where(Asset.user_id == uid)).all()
+            fx = snapshot.fx.override("USD", "ILS", settings.usd_ils_rate) if settings.use_manual_fx else snapshot.fx
+            summary, positions = process_portfolio(assets, snapshot.prices, fx, settings)
+
+            stored = latest_valuation(session, uid)
+            assert stored.base_currency == settings.base_currency
+            assert stored.net_worth == pytest.approx(summary["total_net_worth"])
+            assert stored.after_tax == pytest.approx(summary["total_after_tax"])
+            assert json.loads(stored.allocations) == pytest.approx(summary["allocations"])
+            rows = session.exec(select(PositionValuation).where(PositionValuation.user_id == uid)
+                                .order_by(PositionValuation.asset_id)).all()
+            assert [r.market_value for r in rows] == pytest.approx([p.mkt_val_ils for p in positions])
+        # Manual FX applies per user: 5 VOO at 4.0 ILS/USD plus 8000 ILS, valued in USD
+        assert latest_valuation(session, 2).net_worth == pytest.approx(5 * 500 + 8000 / 4.0)
+
+
+def test_old_position_rows_are_pruned(engine):
+    snapshot = MarketSnapshot({"VOO": 500.0}, FXMatrix({"USD": 1.0, "ILS": 3.5}), datetime(2024, 1, 2))
+    for _ in range(3):
+        last = revalue(engine, workers=1, snapshot=snapshot, keep_position_runs=2)
+    with Session(engine) as session:
+        assert len(session.exec(select(ValuationRun)).all()) == 3
+        assert {r.run_id for r in session.exec(select(PositionValuation)).all()} == {last.id - 1, last.id}
+        # Summaries are kept for every run
+        assert len(session.exec(select(PortfolioValuation).where(PortfolioValuation.user_id == 1)).all()) == 3
+        assert latest_valuation(session, 1).run_id == last.id
@@ -0,0 +1,89 @@
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from backend.services import risk
+from backend.services.risk import RiskModel, RiskService, RollingWindow, concentration, factor_prices
+
+
+def test_rolling_window_matches_full_recompute():
+    rng = np.random.default_rng(0)
+    rows = rng.normal(0, 0.01, size=(700, 4))
+    window = RollingWindow(4, window=250)
+    for row in rows:
+        window.push(row)
+
+    np.testing.assert_allclose(window.returns(), rows[-250:])
+    np.testing.assert_allclose(window.cov(), np.cov(rows[-250:], rowvar=False), atol=1e-12)
+    np.testing.assert_allclose(window.mean(), rows[-250:].mean(axis=0), atol=1e-12)
+
+
+def test_incremental_advance_equals_batch_and_var_is_sane():
+    rng = np.random.default_rng(1)
+    days = [date(2024, 1, 1) + timedelta(days=i) for i in range(400)]
+    prices = pd.DataFrame(np.exp(np.cumsum(rng.normal(0, 0.01, size=(400, 3)), axis=0)),
+                          index=days, columns=["A", "B", "C"])
+
+    batch = RiskModel(["A", "B", "C"], window=252)
+    batch.advance(prices)
+    incremental = RiskModel(["A", "B", "C"], window=252)
+    incremental.advance(prices.iloc[:390])
+    # Re-sending seen days is a no-op; only the 10 new ones are pushed
+    assert incremental.advance(prices) == 10
+    np.testing.assert_allclose(incremental.window.cov(), batch.window.cov(), atol=1e-12)
+
+    report = batch.report({"A": 1000.0, "B": 500.0, "C": 0.0})
+    assert 0 < report["var"][0.95]["historical"] < report["var"][0.99]["historical"] < 1500
+    assert report["var"][0.99]["parametric"] > report["var"][0.95]["parametric"] > 0
+    assert report["volatility"]["A"] == pytest.approx(0.01 * np.sqrt(252), rel=0.2)
+    assert np.allclose(np.diag(report["correlation"]), 1.0)
+
+
+def test_fx_folded_into_base_currency_prices():
+    history = pd.DataFrame({"SPY": [100.0, 110.0], "USDILS=X": [3.5, 3.0]}, index=[date(2024, 1, 1), date(2024, 1, 2)])
+    specs = {"SPY:USD": ("SPY", "USD"), "FX:USD": (None, "USD"), "TA35": ("TA35", "ILS")}
+    out = factor_prices(history, specs, "ILS")
+    assert list(out["SPY:USD"]) == [350.0, 330.0]
+    assert list(out["FX:USD"]) == [3.5, 3.0]
+    assert "TA35" not in out.columns
+
+
+def test_concentration():
+    positions = [SimpleNamespace(symbol=s, mkt_val_ils=v, category=c)
+                 for s, v, c in [("GOOG", 600.0, "Work"), ("SPY", 200.0, "Brokerage"),
+                                 ("SPY", 200.0, "Pension"), ("LOAN", -500.0, "Future Needs")]]
+    conc = concentration(positions, {"US Stocks": 1000.0, "Cash": 0.0})
+    assert conc["hhi"] == pytest.approx(0.6 ** 2 + 0.4 ** 2)
+    assert conc["effective_n"] == pytest.approx(1 / conc["hhi"])
+    assert conc["largest"] == ("GOOG", pytest.approx(0.6))
+    assert conc["work_share"] == pytest.approx(0.6)
+    assert conc["buckets"] == {"US Stocks": 1.0}
+
+
+def test_liabilities_and_manual_prices_are_not_priced_from_history(monkeypatch):
+    def position(symbol, type_, currency, value, category="Brokerage", manual=False):
+        return SimpleNamespace(symbol=symbol, type=type_, currency=currency, mkt_val_ils=value,
+                               category=category, has_manual_price=manual)
+
+    positions = [position("VOO", "ETF", "USD", 1000.0),
+                 position("MIG_PEN", "Fund", "ILS", 500.0, "Pension", manual=True),
+                 position("IRA", "Fund", "USD", 300.0, "Pension", manual=True),
+                 position("HOUSE", "Liability", "ILS", -800.0, "Future Needs", manual=True)]
+    requested = []
+    monkeypatch.setattr(risk, "update_history", lambda symbols: requested.append(set(symbols)))
+    days = [date(2024, 1, 1) + timedelta(days=i) for i in range(30)]
+    rng = np.random.default_rng(2)
+    history = pd.DataFrame({"VOO": np.exp(np.cumsum(rng.normal(0, 0.01, 30))) * 400,
+                            "USDILS=X": np.exp(np.cumsum(rng.normal(0, 0.005, 30))) * 3.6}, index=days)
+    monkeypatch.setattr(risk, "load_history", lambda symbols, days, since: history)
+
+    report = RiskService().analyze(positions, {}, "ILS")
+
+    assert requested == [{"VOO", "USDILS=X"}]
+    assert report["exposures"] == {"VOO:USD": 1000.0, "FX:USD": 300.0}
+    # Volatility is relative to everything held (1800), not just the priced exposures
+    assert report["portfolio_volatility"] == pytest.approx(report["portfolio_sd_daily"] / 1800 * np.sqrt(252))
+    assert report["portfolio_volatility"] > 0
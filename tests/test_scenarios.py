@@ -0,0 +1,51 @@
+from types import SimpleNamespace
+
+import pytest
+
+from backend.services.fx import FXMatrix
+from backend.services.scenarios import Scenario, ScenarioEngine
+from backend.services.valuation import process_portfolio
+
+
+def make_asset(ticker, type_, currency, qty, cost, category, manual_price=None, **alloc):
+    fields = dict(alloc_il_stock_pct=0.0, alloc_us_stock_pct=0.0, alloc_crypto_pct=0.0,
+                  alloc_work_pct=0.0, alloc_bonds_pct=0.0, alloc_cash_pct=0.0)
+    fields.update(alloc)
+    return SimpleNamespace(ticker=ticker, type=type_, currency=currency, quantity=qty, cost_basis=cost,
+                           manual_price=manual_price, name=ticker, category=category, tax_rate=None, **fields)
+
+
+ASSETS = [
+    make_asset("GOOG", "GSU/RSU", "USD", 100, 5000, "Work", alloc_work_pct=1.0),
+    make_asset("MSFT", "Stock", "USD", 20, 6000, "Brokerage"),
+    make_asset("BTC", "Cryptocurrency", "USD", 0.5, 20000, "Crypto Wallet"),
+    make_asset("1184076", "Israeli Gov Bond", "ILS", 8000, 6000, "Bank Account", manual_price=0.9),
+    make_asset("SAP", "Stock", "EUR", 10, 1000, "Brokerage"),
+    make_asset("Wedding", "Liability", "ILS", 1, 0, "Future Needs", manual_price=-50000),
+]
+PRICES = {"GOOG": 170.0, "MSFT": 420.0, "BTC-USD": 60000.0, "SAP": 150.0}
+SETTINGS = SimpleNamespace(base_currency="ILS", tax_rate_capital_gains=0.25, swr_rate=0.04)
+FX = FXMatrix({"USD": 1.0, "ILS": 3.6, "EUR": 0.9})
+
+
+def test_batched_scenarios_match_full_revaluation():
+    scenarios = [
+        Scenario("base"),
+        Scenario("usd -10%, goog -30%", prices={"GOOG": -0.3}, fx={"USD": -0.1}),
+        Scenario("crypto crash, higher cgt", prices={"BTC": -0.5}, settings={"tax_rate_capital_gains": 0.3}),
+    ]
+    result = ScenarioEngine(ASSETS, PRICES, FX, SETTINGS).run(scenarios, max_cells=len(ASSETS) * 2)
+
+    usd_down = FXMatrix({"USD": 1.0, "ILS": 3.6 * 0.9, "EUR": 0.9 * 0.9})
+    expected = [
+        process_portfolio(ASSETS, PRICES, FX, SETTINGS)[0],
+        process_portfolio(ASSETS, {**PRICES, "GOOG": 119.0}, usd_down, SETTINGS)[0],
+        process_portfolio(ASSETS, {**PRICES, "BTC-USD": 30000.0}, FX,
+                          SimpleNamespace(**{**vars(SETTINGS), "tax_rate_capital_gains": 0.3}))[0],
+    ]
+    for i, summary in enumerate(expected):
+        assert result["net_worth"][i] == pytest.approx(summary["total_net_worth"])
+        assert result["after_tax"][i] == pytest.approx(summary["total_after_tax"])
+        assert result["swr_monthly"][i] == pytest.approx(summary["swr_monthly"])
+        for bucket, value in summary["allocations"].items():
+            assert result["allocations"][bucket][i] == pytest.approx(value)
@@ -0,0 +1,110 @@
+import random
+import threading
+import time
+
+import pytest
+
+from backend.services import providers
+from backend.services.fx import FXService, fetch_usd_rates
+from backend.services.providers import (BizportalProvider, CSVPriceProvider, PriceRouter,
+                                        YahooProvider, DEFAULT_CHAIN, ROUTES)
+from backend.services.quotes import QuoteCache
+from backend.services.singleflight import SingleFlight
+from scripts.market_server import MarketServer, Recordings, serve_in_thread, synthetic_price
+
+
+def run_sessions(n, target):
+    """Start `n` threads that all call `target(i)` at the same moment; return their results."""
+    barrier = threading.Barrier(n)
+    results, errors = [None] * n, []
+
+    def session(i):
+        barrier.wait()
+        try:
+            results[i] = target(i)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, errors
+
+
+def test_overlapping_batches_fetch_each_key_once():
+    flight = SingleFlight("test")
+    calls = []
+    lock = threading.Lock()
+
+    def fetch(keys):
+        with lock:
+            calls.extend(keys)
+        time.sleep(0.05)
+        return {k: k.lower() for k in keys if k != "DEAD"}
+
+    universe = ["A", "B", "C", "D", "E", "DEAD"]
+    rng = random.Random(0)
+    wanted = [rng.sample(universe, 3) for _ in range(40)]
+    results, errors = run_sessions(40, lambda i: flight.do(wanted[i], fetch))
+
+    assert not errors
+    assert sorted(calls) == sorted(set(calls)) # no key requested twice
+    for keys, got in zip(wanted, results):
+        assert got == {k: k.lower() for k in keys if k != "DEAD"}
+    assert flight.inflight() == 0
+
+
+def test_waiters_share_the_owner_exception():
+    flight = SingleFlight("test")
+    started = threading.Event()
+
+    def failing(keys):
+        started.set()
+        time.sleep(0.05)
+        raise RuntimeError("upstream down")
+
+    owner = threading.Thread(target=lambda: pytest.raises(RuntimeError, flight.do, ["X"], failing))
+    owner.start()
+    started.wait()
+    with pytest.raises(RuntimeError, match="upstream down"):
+        flight.do(["X"], lambda keys: {"X": 1.0})
+    owner.join()
+    # Nothing left in flight: the next caller fetches again
+    assert flight.do(["X"], lambda keys: {"X": 2.0}) == {"X": 2.0}
+
+
+@pytest.fixture
+def market(tmp_path, monkeypatch):
+    srv = MarketServer(("127.0.0.1", 0), Recordings(str(tmp_path)), latency=0.2, synthesize=True)
+    serve_in_thread(srv)
+    monkeypatch.delenv("PORTFOLIO_OFFLINE", raising=False)
+    monkeypatch.setattr(providers, "YAHOO_BASE_URL", srv.url)
+    monkeypatch.setattr(providers, "BIZPORTAL_BASE_URL", srv.url)
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+def test_concurrent_sessions_send_one_upstream_request_per_symbol(market):
+    chain = {p.name: p for p in (BizportalProvider(), YahooProvider(), CSVPriceProvider(path="none.csv"))}
+    quotes = QuoteCache(PriceRouter(chain, ROUTES, DEFAULT_CHAIN).fetch)
+    fx = FXService(fetch_usd_rates)
+    symbols = ["GOOG", "MSFT", "VOO", "BTC-USD", "1184076", "1159110"]
+    rng = random.Random(1)
+    portfolios = [rng.sample(symbols, 4) for _ in range(32)]
+
+    def dashboard_rerun(i):
+        prices = {t: q.price for t, q in quotes.get(portfolios[i]).items()}
+        return prices, fx.get_matrix(["USD", "ILS", "EUR"]).rate("USD", "ILS")
+
+    results, errors = run_sessions(32, dashboard_rerun)
+
+    assert not errors
+    for portfolio, (prices, usd_ils) in zip(portfolios, results):
+        assert prices == {t: pytest.approx(synthetic_price(t)) for t in portfolio}
+        assert usd_ils == pytest.approx(synthetic_price("USDILS=X"))
+    requested = dict(market.symbol_requests)
+    assert set(requested) == set(symbols) | {"USDILS=X", "USDEUR=X"}
+    assert set(requested.values()) == {1}
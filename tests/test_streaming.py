@@ -0,0 +1,88 @@
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from backend.services.fx import FXMatrix
+from backend.services.streaming import LivePortfolio, LocalFeed, TickCoalescer, crypto_symbols, stream_quotes
+from backend.services.valuation import process_portfolio
+
+
+def make_asset(ticker, type_, currency, qty, cost, category="Bank Account", **alloc):
+    fields = dict(alloc_il_stock_pct=0.0, alloc_us_stock_pct=0.0, alloc_crypto_pct=0.0,
+                  alloc_work_pct=0.0, alloc_bonds_pct=0.0, alloc_cash_pct=0.0)
+    fields.update(alloc)
+    return SimpleNamespace(ticker=ticker, type=type_, currency=currency, quantity=qty, cost_basis=cost,
+                           manual_price=None, name=ticker, category=category, tax_rate=None, **fields)
+
+
+ASSETS = [
+    make_asset("BTC", "Cryptocurrency", "USD", 0.5, 20000, "Crypto Wallet", alloc_crypto_pct=1.0),
+    make_asset("ETH", "Cryptocurrency", "USD", 2, 3000, "Crypto Wallet"),
+    make_asset("GOOG", "GSU/RSU", "USD", 10, 0, "Work", alloc_work_pct=1.0),
+]
+SETTINGS = SimpleNamespace(base_currency="ILS", tax_rate_capital_gains=0.25, swr_rate=0.04)
+FX = FXMatrix({"USD": 1.0, "ILS": 3.6})
+
+
+def test_coalescer_keeps_latest_tick():
+    c = TickCoalescer()
+    for price in (1.0, 2.0, 3.0):
+        c.add({"symbol": "BTC-USD", "price": price})
+    assert c.drain() == {"BTC-USD": 3.0}
+    assert c.drain() == {}
+
+
+def test_streamed_updates_match_full_revaluation():
+    prices = {"BTC-USD": 60000.0, "ETH-USD": 2500.0, "GOOG": 170.0}
+    summary, positions = process_portfolio(ASSETS, prices, FX, SETTINGS)
+    live = LivePortfolio(summary, positions, FX, SETTINGS)
+    assert crypto_symbols(positions) == ["BTC-USD", "ETH-USD"]
+
+    ticks = [{"symbol": "BTC-USD", "price": p} for p in (61000.0, 62000.0, 63000.0)]
+    ticks.append({"symbol": "ETH-USD", "price": 2600.0})
+    updates = []
+    asyncio.run(stream_quotes(LocalFeed(ticks=ticks, interval=0), live, flush_interval=60,
+                              on_update=lambda changed, s: updates.append([p.symbol for p in changed])))
+
+    # All four ticks coalesced into one flush touching only the two crypto positions
+    assert updates == [["BTC-USD", "ETH-USD"]]
+    expected, _ = process_portfolio(ASSETS, {**prices, "BTC-USD": 63000.0, "ETH-USD": 2600.0}, FX, SETTINGS)
+    assert live.summary['total_net_worth'] == pytest.approx(expected['total_net_worth'])
+    assert live.summary['total_after_tax'] == pytest.approx(expected['total_after_tax'])
+    for bucket, value in expected['allocations'].items():
+        assert live.summary['allocations'][bucket] == pytest.approx(value)
+
+
+def test_unconvertible_positions_are_skipped_and_stream_errors_logged(caplog):
+    assets = ASSETS + [make_asset("SOL", "Cryptocurrency", "EUR", 10, 100, "Crypto Wallet")]
+    prices = {"BTC-USD": 60000.0, "ETH-USD": 2500.0, "GOOG": 170.0, "SOL-USD": 150.0}
+    summary, positions = process_portfolio(assets, prices, FX, SETTINGS)
+    live = LivePortfolio(summary, positions, FX, SETTINGS)
+
+    changed = live.apply({"SOL-USD": 160.0, "BTC-USD": 61000.0})
+
+    assert [p.symbol for p in changed] == ["BTC-USD"]
+    assert positions[-1].mkt_val_ils == 0.0
+
+    def boom(changed, summary):
+        raise RuntimeError("subscriber failed")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(stream_quotes(LocalFeed(ticks=[{"symbol": "BTC-USD", "price": 1.0}], interval=0), live,
+                                  on_update=boom))
+    assert "Quote stream for 4 positions stopped" in caplog.text
+
+
+def test_streamed_tax_indexes_cpi_linked_cost_like_full_revaluation():
+    bond = make_asset("1166180", "CPI-Linked Bond", "ILS", 1000, 100000, alloc_bonds_pct=1.0)
+    bond.date_acquired = datetime(2020, 1, 1)
+    settings = SimpleNamespace(base_currency="ILS", tax_rate_capital_gains=0.25, swr_rate=0.04, inflation_rate=0.03)
+    summary, positions = process_portfolio([bond], {"1166180": 120.0}, FX, settings)
+    live = LivePortfolio(summary, positions, FX, settings)
+
+    live.apply({positions[0].symbol: 130.0})
+
+    expected, _ = process_portfolio([bond], {"1166180": 130.0}, FX, settings)
+    assert live.summary['total_after_tax'] == pytest.approx(expected['total_after_tax'])
@@ -0,0 +1,109 @@
+import random
+from datetime import datetime
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from backend.services.gsu_calculator import calculate_gsu_tax
+from backend.services.tax import calculate_tax_liability
+from backend.services.tax_engine import CPI_LINKED, SECTION_102, cumulative_inflation, tax_engine
+from backend.services.valuation import calculate_tax
+
+CATEGORIES = ["Bank Account", "Pension", "Work", "Future Needs", "Crypto", "Fund"]
+TYPES = ["Stock", "ETF", "GSU/RSU", "Cryptocurrency", "Israeli Gov Bond", "Cash/Deposit"]
+
+
+# Reference implementations the engine replaced (cross-check oracles)
+def legacy_calculate_tax(asset, mkt_val, cost_basis, tax_settings):
+    tax = 0.0
+    if asset.category == 'Pension':
+        tax = mkt_val * (asset.tax_rate if asset.tax_rate else 0.25)
+    elif asset.category in ['Bank Account', 'Crypto', 'Fund']:
+        gain = mkt_val - cost_basis
+        if gain > 0:
+            tax = gain * (asset.tax_rate if asset.tax_rate else tax_settings.tax_rate_capital_gains)
+    elif asset.category == 'Work':
+        gain = mkt_val - cost_basis
+        if gain > 0:
+            tax = gain * tax_settings.tax_rate_capital_gains
+    return tax
+
+
+def legacy_tax_liability(mkt, cost, asset_type, is_employee_equity=False, marginal_tax_rate=0.50):
+    if asset_type == "GSU/RSU" or is_employee_equity:
+        return mkt * marginal_tax_rate
+    return max(mkt - cost, 0.0) * 0.25
+
+
+def random_positions(n, seed=0):
+    rng = random.Random(seed)
+    assets, mkts, costs = [], [], []
+    for _ in range(n):
+        category = rng.choice(CATEGORIES)
+        # The old code ignored overrides on Work assets; the engine honours them
+        override = rng.choice([None, 0.0, 0.15]) if category != "Work" else None
+        assets.append(SimpleNamespace(category=category, type=rng.choice(TYPES), tax_rate=override))
+        mkts.append(rng.uniform(-1000, 100000))
+        costs.append(rng.uniform(0, 80000))
+    return assets, mkts, costs
+
+
+def test_vectorized_engine_matches_legacy_valuation_rules():
+    settings = SimpleNamespace(tax_rate_capital_gains=0.27)
+    assets, mkts, costs = random_positions(2000)
+
+    taxes = tax_engine.evaluate_assets(assets, mkts, costs, settings)
+
+    expected = [legacy_calculate_tax(a, m, c, settings) for a, m, c in zip(assets, mkts, costs)]
+    assert taxes == pytest.approx(expected)
+    assert [calculate_tax(a, m, c, settings) for a, m, c in zip(assets, mkts, costs)] == pytest.approx(expected)
+
+
+def test_type_based_liability_matches_legacy():
+    for asset_type in TYPES:
+        for mkt, cost in [(1000.0, 400.0), (300.0, 400.0)]:
+            assert calculate_tax_liability(mkt, cost, asset_type, marginal_tax_rate=0.47) == \
+                pytest.approx(legacy_tax_liability(mkt, cost, asset_type, marginal_tax_rate=0.47))
+    assert calculate_tax_liability(1000.0, 0.0, "Stock", is_employee_equity=True) == pytest.approx(500.0)
+
+
+def test_gsu_modes():
+    grant = SimpleNamespace(units=100, grant_price=50.0)
+    for mode, rate in [("Average", 0.35), ("Current", 0.45), ("Optimized", 0.30)]:
+        result = calculate_gsu_tax(grant, 150.0, SimpleNamespace(gsu_tax_mode=mode))
+        assert result["tax"] == pytest.approx(15000 * rate)
+
+    settings = SimpleNamespace(gsu_tax_mode=SECTION_102, tax_rate_income=0.5, tax_rate_capital_gains=0.25)
+    # 5,000 up to the grant price is income, the other 10,000 is capital gain
+    assert calculate_gsu_tax(grant, 150.0, settings)["tax"] == pytest.approx(2500 + 2500)
+
+
+def test_real_gain_only_for_cpi_linked_bonds():
+    settings = SimpleNamespace(tax_rate_capital_gains=0.25, inflation_rate=0.03)
+    indexed = SimpleNamespace(category="Bank Account", type=CPI_LINKED, tax_rate=None,
+                              date_acquired=datetime(2020, 1, 1))
+    # Nominal "Govt Shekel" series: taxed on the nominal gain, like a stock
+    nominal = SimpleNamespace(category="Bank Account", type="Israeli Gov Bond", tax_rate=None,
+                              date_acquired=datetime(2020, 1, 1))
+    stock = SimpleNamespace(category="Bank Account", type="Stock", tax_rate=None,
+                            date_acquired=datetime(2020, 1, 1))
+    as_of = datetime(2025, 1, 1)
+    inflation = cumulative_inflation([indexed.date_acquired], 0.03, as_of)[0]
+
+    taxes = tax_engine.evaluate_assets([indexed, nominal, stock], [1200.0] * 3, [1000.0] * 3, settings, as_of=as_of)
+
+    assert taxes[0] == pytest.approx((1200 - 1000 * (1 + inflation)) * 0.25)
+    assert taxes[1] == taxes[2] == pytest.approx(50.0)
+    assert np.all(taxes >= 0)
+    # The scalar path (calculate_tax, streamed ticks) indexes the cost the same way
+    for asset, tax in zip([indexed, nominal, stock], taxes):
+        assert tax_engine.tax_for(asset, 1200.0, 1000.0, settings, as_of=as_of) == pytest.approx(tax)
+
+
+def test_account_categories_missing_from_legacy_list_are_taxed():
+    # The old category list ('Crypto', 'Fund') predates the current location names
+    settings = SimpleNamespace(tax_rate_capital_gains=0.25)
+    assets = [SimpleNamespace(category=c, type="Stock", tax_rate=None)
+              for c in ("Brokerage", "Investment Fund", "Crypto Wallet")]
+    assert tax_engine.evaluate_assets(assets, [200.0] * 3, [100.0] * 3, settings) == pytest.approx([25.0] * 3)
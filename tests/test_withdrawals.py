@@ -0,0 +1,72 @@
+import itertools
+from types import SimpleNamespace
+
+import pytest
+
+from backend.models import Settings
+from backend.services.positions import Position
+from backend.services.withdrawals import Pool, WithdrawalOptimizer, build_pools, optimize_withdrawals
+
+POOLS = [Pool("Pension", 1e6, 0.0, "value", 0.25), Pool("Brokerage", 1e6, 3e5, "gain", 0.25),
+         Pool("Bank Account", 5e5, 4.9e5, "gain", 0.25), Pool("Work", 4e5, 1e5, "gain", 0.25)]
+
+
+def position(name, category, type_, value, cost):
+    asset = SimpleNamespace(name=name, ticker=name, type=type_, category=category, currency="ILS", quantity=1.0,
+                            manual_price=None, tax_rate=None)
+    return Position(asset, name, (), value, value, cost, 0.0)
+
+
+def test_single_untaxed_pool_spends_evenly():
+    opt = WithdrawalOptimizer([Pool("Cash", 480_000.0, 480_000.0, "gain", 0.25)], horizon_months=480, real_return=0.0)
+    plan = opt.optimize()
+    assert plan["spending_monthly"] == pytest.approx(1000.0)
+    assert plan["gain"] == pytest.approx(0.0, abs=1e-6)
+    assert plan["lifetime_tax"] == pytest.approx(0.0)
+
+
+def test_dp_order_beats_pro_rata_and_every_other_order():
+    opt = WithdrawalOptimizer(POOLS, Settings(user_id=1, inflation_rate=0.02))
+    plan = opt.optimize()
+
+    assert plan["spending_monthly"] > plan["pro_rata_monthly"]
+    assert plan["tax_rate"] < plan["pro_rata_tax_rate"]
+    assert plan["order"][0] == "Bank Account" and plan["order"][-1] == "Pension" # Least gain first, flat-taxed last
+    spend, order = opt.optimal_spending()
+    for perm in itertools.permutations(range(len(POOLS))):
+        end = 0.0
+        for i in perm:
+            end = opt._drain(i, end, spend * 1.0001)
+        assert end < opt.horizon, perm
+
+    # Month-by-month replay of the plan: every month is funded and the pools end empty
+    left = [1.0] * len(POOLS)
+    for m in range(opt.horizon):
+        need = spend
+        for i in order:
+            take = min(left[i], need / opt.net[i, m])
+            left[i] -= take
+            need -= take * opt.net[i, m]
+        assert need == pytest.approx(0.0, abs=1e-4)
+    assert sum(left) == pytest.approx(0.0, abs=1e-5)
+    assert plan["after_tax"].sum() == pytest.approx(spend * opt.horizon)
+
+
+def test_pools_follow_the_tax_rules_and_skip_liabilities():
+    positions = [position("PEN", "Pension", "Fund", 300_000.0, 100_000.0),
+                 position("VOO", "Brokerage", "US Stock/ETF", 200_000.0, 120_000.0),
+                 position("BOND", "Bank Account", "CPI-Linked Bond", 50_000.0, 48_000.0),
+                 position("ILS", "Bank Account", "Cash/Deposit", 20_000.0, 20_000.0),
+                 position("SHEKEL", "Bank Account", "Israeli Gov Bond", 30_000.0, 29_000.0), # Nominal
+                 position("HOUSE", "Future Needs", "Liability", -100_000.0, 0.0)]
+    settings = Settings(user_id=1, tax_rate_capital_gains=0.25)
+
+    pools = {p.name: p for p in build_pools(positions, settings)}
+
+    assert set(pools) == {"Pension", "Brokerage", "Bank Account (CPI-linked)", "Bank Account (25% gain)"}
+    assert pools["Pension"].basis == "value" and pools["Pension"].rate == 0.25
+    assert pools["Brokerage"] == Pool("Brokerage", 200_000.0, 120_000.0, "gain", 0.25)
+    assert pools["Bank Account (CPI-linked)"].value == 50_000.0
+    assert pools["Bank Account (25% gain)"].value == 50_000.0
+    plan = optimize_withdrawals(positions, settings)
+    assert plan["spending_monthly"] >= plan["pro_rata_monthly"] > 0